@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Просмотры туров копятся в памяти процесса и пишутся в БД фоновым потоком (tour/trending.py)
+from tour.trending import view_buffer  # noqa: E402
+
+view_buffer.start()
@@ -0,0 +1,54 @@
+"""Настройки кэша из переменной окружения CACHE_URL.
+
+Версии пространств имён (tour/cache.py), кэш ответов, рейтинг, избранное и пользователи
+JWT-аутентификации должны быть общими для всех процессов: сигнал в одном процессе и команды
+manage.py сдвигают версию, которую читают остальные. Поддерживаются адреса вида:
+
+    redis://localhost:6379/0                  (пакет redis, см. requirements.txt)
+    rediss://:password@cache:6380/1
+    memcached://cache1:11211,cache2:11211     (нужен пакет pymemcache)
+    locmem://                                 (по умолчанию)
+
+locmem:// — кэш в памяти процесса, подходит для разработки и тестов. Изменения из других
+процессов он не видит, поэтому с ним записи, которые иначе живут до инвалидации, получают
+конечное время жизни (см. блок кэшей в core/settings.py).
+"""
+from urllib.parse import urlsplit
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+
+
+class CacheConfigError(ValueError):
+    pass
+
+
+def parse_cache_url(url):
+    """Словарь настроек Django для одного адреса кэша."""
+    parts = urlsplit(url.strip())
+    if parts.scheme not in BACKENDS:
+        raise CacheConfigError(f'Неизвестная схема адреса кэша: {url!r}')
+    config = {'BACKEND': BACKENDS[parts.scheme]}
+    if parts.scheme == 'locmem':
+        config['LOCATION'] = parts.netloc or 'tir-default'
+    elif parts.scheme == 'memcached':
+        if not parts.netloc:
+            raise CacheConfigError(f'Не указаны серверы memcached: {url!r}')
+        config['LOCATION'] = parts.netloc.split(',')
+    else:
+        # Адрес Redis передаётся клиенту как есть, включая пароль и номер базы
+        config['LOCATION'] = url.strip()
+    return config
+
+
+def cache_settings(environ):
+    """CACHES и признак того, что кэш общий для всех процессов."""
+    config = parse_cache_url(environ.get('CACHE_URL') or 'locmem://')
+    if environ.get('CACHE_KEY_PREFIX'):
+        config['KEY_PREFIX'] = environ['CACHE_KEY_PREFIX']
+    shared = config['BACKEND'] != BACKENDS['locmem']
+    return {'default': config}, shared
@@ -0,0 +1,185 @@
+"""Замеры запросов к БД и времени обработки для каждого HTTP-запроса.
+
+RequestMetricsMiddleware считает количество SQL-запросов, суммарное время БД, повторяющиеся
+запросы (по отпечатку SQL без параметров), время представления и время рендеринга ответа
+(перевод готовых данных DRF в JSON). Работа сериализаторов (serializer.data) вместе с её
+запросами к БД входит во время представления: DRF собирает данные ещё до возврата Response.
+Результат отдаётся в заголовке Server-Timing и пишется в лог core.middleware одной
+JSON-строкой: на уровне DEBUG для каждого запроса, на уровне INFO — для запросов дольше
+REQUEST_METRICS_SLOW_MS миллисекунд.
+
+Бюджет запросов задаётся в QUERY_BUDGETS по имени URL или имени класса представления
+(QUERY_BUDGET_DEFAULT — для остальных). При превышении QUERY_BUDGET_ACTION = 'log' пишет
+предупреждение, 'raise' — выбрасывает QueryBudgetExceeded (для тестов).
+
+Запросы, выполненные при чтении StreamingHttpResponse, не учитываются: тело отдаётся уже
+после выхода из middleware.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+# Списки плейсхолдеров IN (%s, %s, ...) разной длины дают один отпечаток
+_PLACEHOLDERS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+DUPLICATES_LOGGED = 5
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    return _PLACEHOLDERS.sub('(%s, ...)', sql)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.view_started = None
+        self.view_time = None
+        self.render_started = None
+
+    def duplicates(self):
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+        metrics.fingerprints[fingerprint(sql)] += 1
+
+
+def install_recorder(connection, **kwargs):
+    # Обёртка постоянная: без активного замера она сразу передаёт запрос дальше
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_recorder)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics = _current.get()
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        # Асинхронные представления выполняют ORM в потоке sync_to_async; контекст копируется туда,
+        # а обёртка ставится на соединение того потока сигналом connection_created
+        token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics = _current.get()
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def start(self):
+        for connection in connections.all(initialized_only=True):
+            install_recorder(connection)
+        return _current.set(RequestMetrics())
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после этого хука: до него — работа представления, после — рендеринг
+        metrics = _current.get()
+        if metrics is not None and metrics.view_started is not None:
+            metrics.render_started = time.perf_counter()
+            metrics.view_time = metrics.render_started - metrics.view_started
+        return response
+
+    def finish(self, request, response, metrics):
+        finished = time.perf_counter()
+        total = finished - metrics.started
+        view_time = metrics.view_time
+        if view_time is None and metrics.view_started is not None:
+            view_time = finished - metrics.view_started
+        render_time = finished - metrics.render_started if metrics.render_started is not None else 0.0
+        duplicates = metrics.duplicates()
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else None
+        view_class = getattr(match.func, 'view_class', None) if match else None
+        budget = self.get_budget(match, view_class)
+
+        timings = [
+            f'db;dur={metrics.db_time * 1000:.2f};desc="queries={metrics.queries} duplicated={len(duplicates)}"',
+            f'view;dur={(view_time or 0) * 1000:.2f}',
+            f'render;dur={render_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ]
+        response['Server-Timing'] = ', '.join(timings)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'view': view_class.__name__ if view_class else None,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'view_ms': round((view_time or 0) * 1000, 2),
+            'render_ms': round(render_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'duplicates': [{'sql': sql[:300], 'count': count} for sql, count in duplicates[:DUPLICATES_LOGGED]],
+            'query_budget': budget,
+        }
+        level = logging.INFO if total * 1000 >= getattr(settings, 'REQUEST_METRICS_SLOW_MS', 500) else logging.DEBUG
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(record, ensure_ascii=False), extra={'metrics': record})
+
+        if budget is not None and metrics.queries > budget:
+            message = f'{request.method} {request.path} ({route}): {metrics.queries} запросов при бюджете {budget}'
+            if getattr(settings, 'QUERY_BUDGET_ACTION', 'log') == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'metrics': record})
+        return response
+
+    @staticmethod
+    def get_budget(match, view_class):
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        if match is not None:
+            for key in (match.view_name, match.url_name, view_class.__name__ if view_class else None):
+                if key in budgets:
+                    return budgets[key]
+        return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
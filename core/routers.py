@@ -0,0 +1,154 @@
+"""Чтение каталога из реплик (DATABASE_REPLICAS, см. core/databases.py).
+
+ReplicaRoutingMiddleware решает для каждого HTTP-запроса, можно ли читать из реплики: только
+GET/HEAD/OPTIONS к представлениям из DATABASE_REPLICA_VIEWS (имя URL или класса, как
+в QUERY_BUDGETS). Реплика выбирается одна на запрос, чтобы все его чтения видели один снимок.
+Все записи и чтения вне таких запросов (команды, сигналы, транзакции) идут в default.
+
+Чтение своих записей:
+- после первой записи в запросе (db_for_write) его чтения тоже идут в default;
+- ответ на изменяющий запрос (POST, PUT, PATCH, DELETE), который писал в БД, ставит cookie
+  DATABASE_PIN_COOKIE на DATABASE_REPLICA_PIN_SECONDS секунд, и следующие запросы этого
+  клиента читают из default, пока реплики догоняют основную базу;
+- клиенты с JWT (в том числе с другого домена, куда cookie не доходит) закрепляются по
+  заголовку Authorization: в кэше на то же время хранится отметка по хешу этого заголовка.
+  Отметку видят все процессы, только если кэш общий (CACHE_URL, см. core/caches.py).
+
+Данные, которые кэшируются до сдвига версии (tour/response_cache.py), читаются в блоке
+read_from_primary(): ответ, собранный из отстающей реплики, остался бы в кэше под новой версией.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+DATABASE_PIN_COOKIE = 'db_primary'
+
+_current = ContextVar('database_routing', default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def _pin_key(request):
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return f'db-pin:{hashlib.sha1(authorization.encode()).hexdigest()}'
+
+
+@contextmanager
+def read_from_primary():
+    """Чтения внутри блока идут в default, даже если запросу выбрана реплика."""
+    state = _current.get()
+    if state is None:
+        yield
+        return
+    replica, state.replica = state.replica, None
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+class RoutingState:
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+    def read_alias(self):
+        if self.wrote or self.replica is None:
+            return None
+        # Внутри транзакции на основной базе читаем её же, иначе не увидим свои изменения
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return self.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        return state.read_alias() if state is not None else None
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        aliases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с репликацией (или с копией файла SQLite)
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _current.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        # Асинхронный ORM работает в потоке sync_to_async с копией контекста, но с тем же RoutingState
+        state = RoutingState()
+        token = _current.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _current.get()
+        replicas = get_replicas()
+        if state is not None and replicas and self.can_use_replica(request):
+            state.replica = random.choice(replicas)
+
+    def can_use_replica(self, request):
+        if request.method not in SAFE_METHODS or request.COOKIES.get(DATABASE_PIN_COOKIE):
+            return False
+        match = request.resolver_match
+        view_class = getattr(match.func, 'view_class', None)
+        views = getattr(settings, 'DATABASE_REPLICA_VIEWS', ())
+        if not any(key in views for key in (match.view_name, match.url_name, view_class and view_class.__name__)):
+            return False
+        pin_key = _pin_key(request)
+        return pin_key is None or not cache.get(pin_key)
+
+    def finish(self, request, response, state):
+        if state.wrote and request.method not in SAFE_METHODS:
+            seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(DATABASE_PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+            pin_key = _pin_key(request)
+            if pin_key is not None:
+                cache.set(pin_key, True, seconds)
+        return response
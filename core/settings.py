@@ -9,9 +9,13 @@ https://docs.djangoproject.com/en/5.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
+import os
 from datetime import timedelta
 from pathlib import Path
 
+from core.caches import cache_settings
+from core.databases import database_settings
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -60,6 +64,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -118,12 +124,48 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Адреса основной базы и реплик задаются переменными окружения (core/databases.py);
+# без них используется db.sqlite3 в корне проекта
+DATABASES, DATABASE_REPLICAS = database_settings(os.environ, BASE_DIR)
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Представления каталога только для чтения, которые при наличии реплик читают из них (core/routers.py)
+DATABASE_REPLICA_VIEWS = {
+    'banner-list-create',
+    'banner-detail',
+    'tour-list',
+    'tour-season',
+    'tour-search',
+    'tour-trending',
+    'tour-detail',
+    'tour-similar',
+    'region-list',
+    'region-detail',
+    'region-landing',
+    'feedback-list',
+    'feedback-thread',
+    'async-banner-list',
+    'async-banner-detail',
+    'async-tour-list',
+    'async-tour-season',
+    'async-tour-search',
+    'async-tour-detail',
+    'async-feedback-list',
+    'async-feedback-thread',
+    'async-region-list',
+    'async-region-detail',
 }
+DATABASE_REPLICA_PIN_SECONDS = 5  # Столько секунд после изменения клиент читает из основной базы
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# Адрес кэша задаётся переменной CACHE_URL (core/caches.py): Redis или Memcached, общий для
+# всех процессов. Без неё используется кэш в памяти процесса, который не видит изменений из
+# других процессов и команд, поэтому записи «до инвалидации» живут не дольше CACHE_LOCAL_TIMEOUT
+CACHES, CACHE_SHARED = cache_settings(os.environ)
+CACHE_LOCAL_TIMEOUT = 60  # Секунд: предел устаревания данных при кэше в памяти процесса
 
 
 # Password validation
@@ -193,7 +235,7 @@ SITE_ID = 1
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-      'rest_framework_simplejwt.authentication.JWTAuthentication',
+      'user.authentication.CachedJWTAuthentication',
       'rest_framework.authentication.SessionAuthentication',
       'rest_framework.authentication.TokenAuthentication',
     ],
@@ -202,4 +244,67 @@ REST_FRAMEWORK = {
     ]
 }
 
-LOGIN_REDIRECT_URL = '/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/'
+
+# Рейтинг лучших туров (TourListView)
+TOUR_LEADERBOARD_SIZE = 4  # Количество туров по умолчанию
+TOUR_LEADERBOARD_MAX_SIZE = 50  # Максимальное значение параметра ?limit=
+# Записи живут до инвалидации сигналами (в памяти процесса — не дольше CACHE_LOCAL_TIMEOUT)
+TOUR_LEADERBOARD_TIMEOUT = None if CACHE_SHARED else CACHE_LOCAL_TIMEOUT
+
+# Кэш готовых ответов списков каталога (tour/response_cache.py): ключи версионируются сигналами
+# и командами, а версии из других процессов видны только через общий кэш
+RESPONSE_CACHE_TIMEOUT = None if CACHE_SHARED else CACHE_LOCAL_TIMEOUT
+
+# Удержание мест при бронировании (tour/inventory.py)
+SEAT_HOLD_TTL = timedelta(minutes=15)  # Сколько места удерживаются до подтверждения
+SEAT_HOLD_EXPIRE_BATCH = 500  # Размер пачки для expire_seat_holds
+
+# Уменьшенные копии изображений (tour/images.py): имя -> максимальная сторона в пикселях
+IMAGE_VARIANTS = {'thumb': 320, 'card': 640, 'full': 1280}
+IMAGE_VARIANT_QUALITY = 82
+IMAGE_WORKERS = 2  # Процессы для фоновой генерации копий после загрузки
+IMAGE_VARIANTS_MISS_TIMEOUT = 60  # Секунд кэшируется отсутствие готовых копий (tour/images.py)
+
+# Кэш пользователей для JWT-аутентификации (user/authentication.py)
+AUTH_USER_CACHE_SIZE = 10000  # Записей в памяти процесса
+AUTH_USER_CACHE_LOCAL_TTL = 30  # Секунд в LRU процесса: столько другие процессы видят старые данные при общем кэше
+# Секунд в кэше Django. Если он в памяти процесса, удаление записи до других процессов не доходит,
+# поэтому срок не больше AUTH_USER_CACHE_LOCAL_TTL (блокировка действует везде за 30 секунд)
+AUTH_USER_CACHE_TIMEOUT = 300 if CACHE_SHARED else AUTH_USER_CACHE_LOCAL_TTL
+
+# Замеры запросов (core/middleware.py): бюджет SQL-запросов по имени URL или классу представления
+QUERY_BUDGET_DEFAULT = 30
+QUERY_BUDGETS = {
+    'tour-list': 8,
+    'tour-season': 8,
+    'tour-search': 8,
+    'tour-detail': 8,
+    'region-landing': 6,
+    'favorite-tours': 7,
+    'favorite-status': 4,
+    'tour-similar': 2,
+    'tour-trending': 4,
+    'feedback-list': 6,
+    'feedback-thread': 6,
+    'user-bookings': 6,
+    'admin-user-list': 6,
+}
+QUERY_BUDGET_ACTION = 'log'  # Тесты бюджетов включают 'raise' через override_settings
+REQUEST_METRICS_SLOW_MS = 500  # Замеры более долгих запросов пишутся в лог на уровне INFO, остальных — DEBUG
+
+# Множество избранных туров пользователя в кэше (tour/favorites.py), секунд
+FAVORITES_CACHE_TIMEOUT = 300 if CACHE_SHARED else CACHE_LOCAL_TIMEOUT
+
+# Похожие туры (tour/similarity.py): веса взаимодействий и доля общих категорий и регионов в сходстве
+SIMILAR_TOURS_WEIGHTS = {'rating': 0.2, 'favorite': 1.0, 'booking': 2.0}  # Вес оценки — за одну звезду
+SIMILAR_TOURS_CATEGORY_WEIGHT = 0.15
+SIMILAR_TOURS_REGION_WEIGHT = 0.1
+
+# Популярность «сейчас» (tour/trending.py): вклад события уменьшается вдвое за половину жизни
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_WEIGHTS = {'booking': 3.0, 'favorite': 2.0, 'rating': 1.0, 'view': 0.1}  # Вес одного события
+TRENDING_VIEW_FLUSH_SECONDS = 30  # Фоновый поток веб-процесса пишет накопленные просмотры в БД раз в столько секунд
+
+# Границы ценовых диапазонов для фасета цены в поиске туров (tour/facets.py)
+TOUR_PRICE_BUCKETS = (0, 100, 250, 500, 1000, 2000)
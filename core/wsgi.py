@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Просмотры туров копятся в памяти процесса и пишутся в БД фоновым потоком (tour/trending.py)
+from tour.trending import view_buffer  # noqa: E402
+
+view_buffer.start()
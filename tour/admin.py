@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Tour, Category, RegionTour, DateTour, Booking, Rating, Feedback, FavoriteList, Banner, TourImage
+from .models import Tour, Category, RegionTour, DateTour, Booking, Rating, Feedback, FavoriteList, Banner, TourImage, \
+    TourInventory, SeatHold
 
 
 admin.site.register(Tour)
@@ -12,3 +13,5 @@ admin.site.register(Feedback)
 admin.site.register(FavoriteList)
 admin.site.register(Banner)
 admin.site.register(TourImage)
+admin.site.register(TourInventory)
+admin.site.register(SeatHold)
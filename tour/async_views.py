@@ -0,0 +1,230 @@
+"""Асинхронные версии публичных эндпоинтов каталога для запуска под ASGI (core/asgi.py).
+
+Данные читаются через async ORM (aiterator, aget, ain_bulk), поэтому поток сервера
+не блокируется на время запроса к БД. Ответы совпадают с синхронными представлениями
+из tour/views.py, включая курсоры пагинации; сериализаторы вызываются уже после того,
+как все связанные объекты загружены prefetch_related, и сами запросов не делают.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .facets import apply_filters, get_facets, has_filters, parse_filters, parse_price_range
+from .feedback import aattach_threads
+from .leaderboard import aget_top_rated_tours
+from .models import Banner, Feedback, RegionTour, Tour
+from .pagination import BannerCursorPagination, FeedbackThreadPagination, RegionCursorPagination, \
+    SearchCursorPagination, TourCursorPagination
+from .pricing import parse_price_ordering
+from .search import get_search_backend, search_tours
+from .serializers import BannerSerializer, FeedbackSerializer, RegionTourSerializer, TourSearchSerializer, \
+    TourSerializer
+from .trending import record_views
+from .views import _int_param, _priced_tours, _season_tours
+
+
+class AsyncCatalogView(View):
+    """Основа асинхронного представления: JSON-ответ и обработка исключений DRF."""
+    http_method_names = ['get', 'head', 'options']
+    serializer_class = None
+    pagination_class = None
+    renderer = JSONRenderer()
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(self.renderer.render(data), status=status_code, content_type='application/json')
+
+    def serialize(self, request, instance, many=False):
+        return self.serializer_class(instance, many=many, context={'request': request, 'view': self}).data
+
+    async def get(self, request, *args, **kwargs):
+        # DRF Request нужен пагинаторам и сериализаторам (query_params, build_absolute_uri)
+        request = Request(request)
+        try:
+            return self.render(await self.aget_data(request, *args, **kwargs))
+        except Http404 as exc:
+            return self.render({'detail': str(exc) or NotFound.default_detail}, status.HTTP_404_NOT_FOUND)
+        except APIException as exc:
+            return self.render({'detail': exc.detail} if isinstance(exc.detail, str) else exc.detail,
+                               exc.status_code)
+
+    async def aget_data(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+
+class AsyncListView(AsyncCatalogView):
+    def get_queryset(self, request):
+        raise NotImplementedError
+
+    async def aget_data(self, request, *args, **kwargs):
+        queryset = self.get_queryset(request)
+        if self.pagination_class is None:
+            return self.serialize(request, [obj async for obj in queryset], many=True)
+        paginator = self.pagination_class()
+        page = await self.apaginate(paginator, queryset, request)
+        return paginator.get_paginated_response(self.serialize(request, page, many=True)).data
+
+    async def apaginate(self, paginator, queryset, request):
+        return await paginator.apaginate_queryset(queryset, request, view=self)
+
+
+class AsyncDetailView(AsyncCatalogView):
+    lookup_url_kwarg = 'pk'
+
+    def get_queryset(self, request):
+        raise NotImplementedError
+
+    async def aget_data(self, request, *args, **kwargs):
+        queryset = self.get_queryset(request)
+        try:
+            instance = await queryset.aget(pk=kwargs[self.lookup_url_kwarg])
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        return self.serialize(request, await self.prepare(request, instance))
+
+    async def prepare(self, request, instance):
+        return instance
+
+
+class AsyncBannerIndexView(AsyncListView):
+    serializer_class = BannerSerializer
+    pagination_class = BannerCursorPagination
+
+    def get_queryset(self, request):
+        return Banner.objects.all()
+
+
+class AsyncBannerDetailView(AsyncDetailView):
+    serializer_class = BannerSerializer
+
+    def get_queryset(self, request):
+        return Banner.objects.all()
+
+
+class AsyncRegionTourListView(AsyncListView):
+    serializer_class = RegionTourSerializer
+    pagination_class = RegionCursorPagination
+
+    def get_queryset(self, request):
+        return RegionTour.objects.all()
+
+
+class AsyncRegionTourDetailView(AsyncDetailView):
+    serializer_class = RegionTourSerializer
+
+    def get_queryset(self, request):
+        return RegionTour.objects.all()
+
+
+class AsyncTourListView(AsyncCatalogView):
+    serializer_class = TourSerializer
+
+    async def aget_data(self, request, *args, **kwargs):
+        params = request.query_params
+        limit = _int_param(params, 'limit')
+        category = _int_param(params, 'category')
+        region = _int_param(params, 'region')
+        price_range = parse_price_range(params)
+        ordering = parse_price_ordering(params)
+        queryset = Tour.objects.prefetch_related('images', 'date_tour')
+        if ordering is None and price_range == (None, None):
+            tours = await aget_top_rated_tours(limit=limit, category=category, region=region, queryset=queryset)
+        else:
+            tours = [tour async for tour in _priced_tours(queryset, limit, category, region, price_range, ordering)]
+        return self.serialize(request, tours, many=True)
+
+
+class AsyncTourSeasonView(AsyncListView):
+    serializer_class = TourSerializer
+    pagination_class = TourCursorPagination
+
+    def get_queryset(self, request):
+        return _season_tours(request.query_params)
+
+
+class AsyncTourSearchView(AsyncListView):
+    serializer_class = TourSearchSerializer
+    pagination_class = TourCursorPagination
+
+    def get_queryset(self, request):
+        queryset = apply_filters(Tour.objects.prefetch_related('images', 'date_tour'), self.filters)
+        if self.query:
+            queryset = get_search_backend().filter(queryset, self.query)
+        return queryset
+
+    async def aget_data(self, request, *args, **kwargs):
+        params = request.query_params
+        self.filters = parse_filters(params)
+        self.query = params.get('search', '').strip()
+        if not self.query or parse_price_ordering(params):
+            data = await super().aget_data(request, *args, **kwargs)
+        else:
+            data = await self.search(request, self.query)
+        matched = Tour.objects.all()
+        if self.query:
+            matched = get_search_backend().filter(matched, self.query)
+
+        with_facets = params.get('facets') not in ('0', 'false')
+        if with_facets and not params.get(self.pagination_class.cursor_query_param):
+            data['facets'] = await sync_to_async(get_facets)(matched, self.filters)
+        return data
+
+    async def search(self, request, query):
+        # Поисковые бэкенды работают через курсор БД, у которого нет асинхронного API
+        paginator = SearchCursorPagination()
+        within = apply_filters(Tour.objects.all(), self.filters) if has_filters(self.filters) else None
+        hits = await sync_to_async(paginator.paginate_hits)(
+            lambda limit, after: search_tours(query, limit, after, within=within), request, view=self
+        )
+        tours = await Tour.objects.prefetch_related('images', 'date_tour').ain_bulk([hit.tour_id for hit in hits])
+        results = []
+        for hit in hits:
+            tour = tours.get(hit.tour_id)
+            if tour is not None:
+                tour.search_rank = hit.rank
+                tour.search_snippet = hit.snippet
+                results.append(tour)
+        return paginator.get_paginated_response(self.serialize(request, results, many=True)).data
+
+
+class AsyncTourDetailView(AsyncDetailView):
+    serializer_class = TourSerializer
+    lookup_url_kwarg = 'id'
+
+    def get_queryset(self, request):
+        return Tour.objects.prefetch_related('images', 'date_tour')
+
+    async def prepare(self, request, instance):
+        # Просмотр только попадает в буфер процесса, запросов к БД нет
+        record_views([instance.pk])
+        return instance
+
+
+class AsyncFeedbackListView(AsyncListView):
+    serializer_class = FeedbackSerializer
+    pagination_class = FeedbackThreadPagination
+
+    def get_queryset(self, request):
+        queryset = Feedback.objects.filter(depth=0)
+        tour_id = _int_param(request.query_params, 'tour')
+        if tour_id:
+            queryset = queryset.filter(tour_id=tour_id)
+        return queryset
+
+    async def apaginate(self, paginator, queryset, request):
+        page = await super().apaginate(paginator, queryset, request)
+        return await aattach_threads(page, max_depth=_int_param(request.query_params, 'depth'))
+
+
+class AsyncFeedbackThreadView(AsyncDetailView):
+    serializer_class = FeedbackSerializer
+
+    def get_queryset(self, request):
+        return Feedback.objects.all()
+
+    async def prepare(self, request, instance):
+        await aattach_threads([instance], max_depth=_int_param(request.query_params, 'depth'))
+        return instance
@@ -0,0 +1,51 @@
+"""Общие части команд замера производительности (benchmark_asgi, benchmark_api).
+
+Запросы выполняются WSGI-приложением в этом же процессе, без сети.
+"""
+import io
+import re
+import time
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+HOST = 'localhost'
+# Количество запросов к БД из заголовка Server-Timing (core/middleware.py)
+_QUERIES = re.compile(r'queries=(\d+)')
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def wsgi_get(application, url, headers=None):
+    """Выполняет GET и возвращает (время в секундах, код ответа, заголовки ответа)."""
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'HTTP_HOST': HOST,
+        'wsgi.input': io.BytesIO(),
+    }
+    for name, value in (headers or {}).items():
+        environ[f'HTTP_{name.upper().replace("-", "_")}'] = value
+    setup_testing_defaults(environ)
+    started_response = []
+    started = time.perf_counter()
+    body = application(environ, lambda status, headers, exc_info=None: started_response.append((status, headers)))
+    for _ in body:
+        pass
+    if hasattr(body, 'close'):
+        body.close()
+    latency = time.perf_counter() - started
+    status, response_headers = started_response[0]
+    return latency, int(status.split()[0]), dict(response_headers)
+
+
+def query_count(headers):
+    match = _QUERIES.search(headers.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
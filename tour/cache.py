@@ -0,0 +1,34 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+
+def get_version(namespace):
+    """Текущая версия пространства имён кэша. Входит в ключи, поэтому смена версии делает старые записи недоступными."""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Стартуем с отметки времени, чтобы после вытеснения ключа не переиспользовать старые версии
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    key = _version_key(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def bump_version_on_commit(namespace, using=None):
+    """Сдвигает версию после фиксации транзакции, чтобы читатели не закэшировали незафиксированные данные."""
+    transaction.on_commit(lambda: bump_version(namespace), using=using)
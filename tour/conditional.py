@@ -0,0 +1,83 @@
+"""Условные GET-запросы (ETag / Last-Modified) для детальных страниц.
+
+Состояние объекта читается одним лёгким запросом по первичному ключу, поэтому ответ 304
+отдаётся без загрузки связанных объектов и без сериализации.
+
+Валидаторы строятся только по колонкам самого объекта. Связанные данные, которые меняются
+без его сохранения (изображения и даты тура, готовые копии изображений), сдвигают
+updated_date затронутых объектов через touch (см. tour/signals.py) — так ETag меняется только
+у них и одинаково во всех процессах.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models.functions import Now
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Banner, RegionTour, Tour
+
+
+def touch(model, pks, using=None):
+    """Сдвигает updated_date объектов одним UPDATE без сигналов."""
+    pks = set(pks)
+    if pks:
+        model.objects.using(using).filter(pk__in=pks).update(updated_date=Now())
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_get(state_func):
+    """Декоратор метода get: state_func(request, **kwargs) возвращает (etag, last_modified) или None."""
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            state = state_func(request, **kwargs)
+            if state is None:
+                # Объекта нет — ответ 404 сформирует само представление
+                return method(self, request, *args, **kwargs)
+            etag, last_modified = state
+            timestamp = int(last_modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers['ETag'] = etag
+                response.headers['Last-Modified'] = http_date(timestamp)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _representation(request):
+    # Ссылки на изображения абсолютные, поэтому представление зависит от схемы и хоста
+    return f'{request.scheme}://{request.get_host()}'
+
+
+def tour_state(request, id, **kwargs):
+    row = Tour.objects.filter(pk=id).values_list('updated_date', 'rating_count', 'rating_sum').first()
+    if row is None:
+        return None
+    updated_date, rating_count, rating_sum = row
+    etag = make_etag('tour', id, updated_date.isoformat(), rating_count, rating_sum, _representation(request))
+    return etag, updated_date
+
+
+def region_state(request, pk, **kwargs):
+    updated_date = RegionTour.objects.filter(pk=pk).values_list('updated_date', flat=True).first()
+    if updated_date is None:
+        return None
+    return make_etag('region', pk, updated_date.isoformat(), _representation(request)), updated_date
+
+
+def banner_state(request, pk, **kwargs):
+    updated_date = Banner.objects.filter(pk=pk).values_list('updated_date', flat=True).first()
+    if updated_date is None:
+        return None
+    return make_etag('banner', pk, updated_date.isoformat(), _representation(request)), updated_date
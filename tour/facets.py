@@ -0,0 +1,171 @@
+"""Фильтры и счётчики фасетов для поиска туров (TourSearchView).
+
+Фильтры: ?category=, ?region=, ?season=, ?tour_type= (несколько значений через запятую)
+и ?price_min=, ?price_max=. Счётчики каждого фасета считаются по набору, отфильтрованному
+всеми остальными фасетами (выбранное значение не обнуляет соседние варианты того же фасета).
+
+Все фасеты считаются одним запросом: сгруппированные подзапросы объединяются через UNION ALL,
+каждый возвращает строки (фасет, ключ, подпись, количество).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Case, CharField, Count, Exists, F, OuterRef, Value, When
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+
+from .models import DateTour, Tour
+from .seasons import season_masks
+
+FACETS = ('category', 'region', 'season', 'tour_type', 'price')
+DEFAULT_PRICE_BUCKETS = (0, 100, 250, 500, 1000, 2000)
+# Цена с учётом действующей скидки (см. tour/pricing.py)
+PRICE_FIELD = 'effective_price'
+
+
+def get_price_buckets():
+    """Границы ценовых диапазонов: [0, 100), [100, 250), ..., [2000, ∞)."""
+    return tuple(Decimal(str(bound)) for bound in getattr(settings, 'TOUR_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS))
+
+
+def _split(params, name):
+    value = params.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+
+def _ids(params, name):
+    try:
+        return [int(item) for item in _split(params, name)]
+    except ValueError:
+        raise ValidationError({name: 'Ожидается ID или несколько ID через запятую.'})
+
+
+def _choices(params, name, allowed):
+    values = _split(params, name)
+    unknown = [value for value in values if value not in allowed]
+    if unknown:
+        raise ValidationError({name: f'Допустимые значения: {", ".join(allowed)}.'})
+    return values
+
+
+def _price(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'Ожидается число.'})
+
+
+def parse_price_range(params):
+    """(price_min, price_max) из ?price_min= и ?price_max=; отсутствующая граница — None."""
+    price_min, price_max = _price(params, 'price_min'), _price(params, 'price_max')
+    if price_min is not None and price_max is not None and price_min > price_max:
+        raise ValidationError({'price_min': 'Минимальная цена больше максимальной.'})
+    return price_min, price_max
+
+
+def filter_price(queryset, price_range):
+    price_min, price_max = price_range
+    if price_min is not None:
+        queryset = queryset.filter(**{f'{PRICE_FIELD}__gte': price_min})
+    if price_max is not None:
+        queryset = queryset.filter(**{f'{PRICE_FIELD}__lte': price_max})
+    return queryset
+
+
+def parse_filters(params):
+    return {
+        'category': _ids(params, 'category'),
+        'region': _ids(params, 'region'),
+        'season': _choices(params, 'season', list(DateTour.SEASON_BITS)),
+        'tour_type': _choices(params, 'tour_type', [value for value, _ in DateTour.TOUR_TYPES]),
+        'price': parse_price_range(params),
+    }
+
+
+def has_filters(filters):
+    return any(filters[name] for name in FACETS[:-1]) or any(bound is not None for bound in filters['price'])
+
+
+def apply_filters(queryset, filters, exclude=None):
+    """Применяет фильтры фасетов, кроме exclude. Связи проверяются через EXISTS, поэтому дублей нет."""
+    if filters['category'] and exclude != 'category':
+        queryset = queryset.filter(Exists(Tour.category.through.objects.filter(
+            tour_id=OuterRef('pk'), category_id__in=filters['category'],
+        )))
+    if filters['region'] and exclude != 'region':
+        queryset = queryset.filter(Exists(Tour.region.through.objects.filter(
+            tour_id=OuterRef('pk'), regiontour_id__in=filters['region'],
+        )))
+    if filters['season'] and exclude != 'season':
+        # Маска сезонов хранится в туре (tour/seasons.py), join по датам не нужен
+        masks = {mask for season in filters['season'] for mask in season_masks(season)}
+        queryset = queryset.filter(season_mask__in=sorted(masks))
+    if filters['tour_type'] and exclude != 'tour_type':
+        queryset = queryset.filter(Exists(Tour.date_tour.through.objects.filter(
+            tour_id=OuterRef('pk'), datetour__tour_type__in=filters['tour_type'],
+        )))
+    if exclude != 'price':
+        queryset = filter_price(queryset, filters['price'])
+    return queryset
+
+
+def _facet_rows(name, queryset, key, label, count):
+    return queryset.order_by().values(
+        facet=Value(name, output_field=CharField()),
+        key=Cast(key, CharField()),
+        label=label,
+    ).annotate(count=count)
+
+
+def get_facets(queryset, filters):
+    """Счётчики всех фасетов для QuerySet туров (уже ограниченного поисковым запросом)."""
+    def tours(facet):
+        return apply_filters(queryset, filters, exclude=facet).order_by().values('pk')
+
+    buckets = get_price_buckets()
+    price_bucket = Case(
+        *[When(**{f'{PRICE_FIELD}__lt': upper}, then=Value(index)) for index, upper in enumerate(buckets[1:])],
+        default=Value(len(buckets) - 1),
+    )
+    empty = Value('', output_field=CharField())
+    parts = [
+        _facet_rows('category', Tour.category.through.objects.filter(tour_id__in=tours('category')),
+                    F('category_id'), F('category__title'), Count('tour_id')),
+        _facet_rows('region', Tour.region.through.objects.filter(tour_id__in=tours('region')),
+                    F('regiontour_id'), F('regiontour__title'), Count('tour_id')),
+        _facet_rows('season', Tour.date_tour.through.objects.filter(tour_id__in=tours('season')),
+                    F('datetour__season'), empty, Count('tour_id', distinct=True)),
+        _facet_rows('tour_type', Tour.date_tour.through.objects.filter(tour_id__in=tours('tour_type')),
+                    F('datetour__tour_type'), empty, Count('tour_id', distinct=True)),
+        _facet_rows('price', Tour.objects.filter(pk__in=tours('price')), price_bucket, empty, Count('pk')),
+    ]
+    rows = parts[0].union(*parts[1:], all=True).values_list('facet', 'key', 'label', 'count')
+    return build_facets(rows, filters, buckets)
+
+
+def build_facets(rows, filters, buckets):
+    seasons = dict(DateTour.SEASON_CHOICES)
+    tour_types = dict(DateTour.TOUR_TYPES)
+    facets = {name: [] for name in FACETS}
+    for facet, key, label, count in rows:
+        if facet in ('category', 'region'):
+            pk = int(key)
+            facets[facet].append({'id': pk, 'title': label, 'count': count, 'selected': pk in filters[facet]})
+        elif facet in ('season', 'tour_type'):
+            labels = seasons if facet == 'season' else tour_types
+            facets[facet].append({'value': key, 'label': labels.get(key, key), 'count': count,
+                                  'selected': key in filters[facet]})
+        else:
+            index = int(key)
+            upper = buckets[index + 1] if index + 1 < len(buckets) else None
+            facets['price'].append({'min': buckets[index], 'max': upper, 'count': count})
+
+    for name in ('category', 'region'):
+        facets[name].sort(key=lambda item: (-item['count'], item['title'] or '', item['id']))
+    facets['season'].sort(key=lambda item: list(DateTour.SEASON_BITS).index(item['value']))
+    facets['tour_type'].sort(key=lambda item: item['value'])
+    facets['price'].sort(key=lambda item: item['min'])
+    return facets
@@ -0,0 +1,89 @@
+"""Избранные туры пользователей.
+
+Единственное хранилище — FavoriteList; MyUser.favorite_tours использует его как through-модель.
+Для каждого пользователя в кэше лежит множество ID избранных туров, поэтому отметки «в избранном»
+для целой страницы карточек берутся одним обращением к кэшу (при промахе — одним запросом).
+При изменении множество удаляется из кэша сразу и ещё раз после фиксации транзакции (сигналами
+FavoriteList и MyUser.favorite_tours и явно в set_favorites, где строки пишутся без сигналов;
+там же учитывается и популярность новых избранных туров). Следующее чтение загружает его
+заново одним запросом. Исправлять множество на месте нельзя: чтение и запись в кэш из двух
+запросов могут переставиться, и одно из изменений потеряется.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from .models import FavoriteList, Tour
+from .trending import FAVORITE, record_event
+
+FAVORITES_KEY = 'favorites:{user_id}'
+MAX_BATCH_SIZE = 100
+
+
+def _timeout():
+    return getattr(settings, 'FAVORITES_CACHE_TIMEOUT', 300)
+
+
+def get_favorite_ids(user_id, using=None):
+    key = FAVORITES_KEY.format(user_id=user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(FavoriteList.objects.using(using).filter(user_id=user_id).values_list('tour_id', flat=True))
+        cache.set(key, ids, _timeout())
+    return ids
+
+
+def favorite_flags(user_id, tour_ids):
+    favorites = get_favorite_ids(user_id)
+    return {tour_id: tour_id in favorites for tour_id in tour_ids}
+
+
+def forget_favorites(user_ids, using=None):
+    """Удаляет множества сразу и после фиксации, чтобы параллельное чтение не оставило в кэше старое."""
+    keys = [FAVORITES_KEY.format(user_id=user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using)
+
+
+def parse_tour_ids(value, name):
+    """Список ID из строки «1,2,3» или из списка; не больше MAX_BATCH_SIZE."""
+    if value in (None, ''):
+        return []
+    items = value.split(',') if isinstance(value, str) else value
+    try:
+        ids = list(dict.fromkeys(int(item) for item in items if str(item).strip()))
+    except (TypeError, ValueError):
+        raise ValidationError({name: 'Ожидается ID или несколько ID через запятую.'})
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValidationError({name: f'Не больше {MAX_BATCH_SIZE} ID за запрос.'})
+    return ids
+
+
+def set_favorites(user_id, add=(), remove=(), using=None):
+    """Добавляет и удаляет избранные туры пачкой за постоянное число запросов; возвращает добавленные ID."""
+    if set(add) & set(remove):
+        raise ValidationError({'add': 'Тур не может одновременно добавляться и удаляться.'})
+    with transaction.atomic(using=using):
+        added = []
+        if add:
+            # Уже избранные туры отмечаются тем же запросом: популярность учитывает только новые
+            rows = Tour.objects.using(using).filter(pk__in=add).annotate(
+                is_favorite=Exists(FavoriteList.objects.filter(user_id=user_id, tour_id=OuterRef('pk'))),
+            ).values_list('pk', 'is_favorite')
+            added, new = [], []
+            for tour_id, is_favorite in rows:
+                added.append(tour_id)
+                if not is_favorite:
+                    new.append(tour_id)
+            FavoriteList.objects.using(using).bulk_create(
+                [FavoriteList(user_id=user_id, tour_id=tour_id) for tour_id in new], ignore_conflicts=True,
+            )
+            record_event(new, FAVORITE, using=using)
+        if remove:
+            FavoriteList.objects.using(using).filter(user_id=user_id, tour_id__in=remove).delete()
+        # bulk_create не отправляет сигналы
+        forget_favorites([user_id], using=using)
+    return added
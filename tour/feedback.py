@@ -0,0 +1,97 @@
+from django.db.models import F, Max, Q, Value
+from django.db.models.functions import Concat, Substr
+from rest_framework.exceptions import ValidationError
+
+from .models import Feedback
+
+# Символ больше любой цифры и «/»: все потомки узла лежат в диапазоне [path, path + PATH_END)
+PATH_END = '~'
+
+
+def subtree_filter(node, max_depth=None, include_self=False):
+    condition = Q(path__gte=node.path) if include_self else Q(path__gt=node.path)
+    condition &= Q(path__lt=node.path + PATH_END)
+    if max_depth is not None:
+        condition &= Q(depth__lte=node.depth + max_depth)
+    return condition
+
+
+def _thread_queryset(nodes, max_depth, using):
+    condition = Q()
+    for node in nodes:
+        condition |= subtree_filter(node, max_depth)
+    # Сортировка по пути гарантирует, что родитель встречается раньше своих ответов
+    return Feedback.objects.using(using).filter(condition).order_by('path')
+
+
+def _assemble_threads(nodes, items):
+    by_id = {}
+    for node in nodes:
+        node.thread_children = []
+        by_id[node.pk] = node
+    for item in items:
+        item.thread_children = []
+        by_id[item.pk] = item
+        parent = by_id.get(item.parent_id)
+        if parent is not None:
+            parent.thread_children.append(item)
+    return nodes
+
+
+def attach_threads(nodes, max_depth=None, using=None):
+    """Загружает ответы для переданных отзывов одним запросом и раскладывает их по thread_children.
+
+    max_depth ограничивает глубину относительно каждого узла; у отзывов на границе
+    thread_children пуст, а reply_count показывает, сколько ответов осталось не загружено.
+    """
+    nodes = list(nodes)
+    if not nodes:
+        return nodes
+    return _assemble_threads(nodes, _thread_queryset(nodes, max_depth, using))
+
+
+async def aattach_threads(nodes, max_depth=None, using=None):
+    """Асинхронный вариант attach_threads для представлений под ASGI."""
+    nodes = list(nodes)
+    if not nodes:
+        return nodes
+    items = [item async for item in _thread_queryset(nodes, max_depth, using).aiterator()]
+    return _assemble_threads(nodes, items)
+
+
+def place_in_thread(feedback, using=None):
+    """Вычисляет путь отзыва по родителю; при переносе переписывает пути всей ветки и счётчики ответов."""
+    manager = Feedback.objects.using(using)
+    old_path = feedback.path
+    parent_path = manager.values_list('path', flat=True).get(pk=feedback.parent_id) if feedback.parent_id else ''
+
+    if old_path and parent_path.startswith(old_path):
+        raise ValidationError('Отзыв нельзя перенести в собственную ветку ответов.')
+
+    new_path = parent_path + Feedback.path_segment(feedback.pk)
+    new_depth = new_path.count('/') - 1
+    # Глубина самого глубокого ответа ветки после переноса
+    deepest = new_depth
+    if old_path:
+        deepest += manager.filter(path__startswith=old_path).aggregate(value=Max('depth'))['value'] - feedback.depth
+    if deepest > Feedback.MAX_DEPTH:
+        raise ValidationError(f'Ветка ответов не может быть глубже {Feedback.MAX_DEPTH} уровней.')
+
+    if not old_path:
+        manager.filter(pk=feedback.pk).update(path=new_path, depth=new_depth)
+        manager.filter(pk__in=_path_ids(parent_path)).update(reply_count=F('reply_count') + 1)
+    else:
+        moved = manager.values_list('reply_count', flat=True).get(pk=feedback.pk) + 1
+        manager.filter(path__startswith=old_path).update(
+            path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + (new_depth - feedback.depth),
+        )
+        manager.filter(pk__in=_path_ids(old_path)[:-1]).update(reply_count=F('reply_count') - moved)
+        manager.filter(pk__in=_path_ids(parent_path)).update(reply_count=F('reply_count') + moved)
+
+    feedback.path = new_path
+    feedback.depth = new_depth
+
+
+def _path_ids(path):
+    return [int(segment) for segment in path.split('/') if segment]
@@ -0,0 +1,159 @@
+"""Уменьшенные копии загруженных изображений (thumb/card/full в WebP и JPEG).
+
+Копии лежат рядом с оригиналом: tours_images/photo.jpg -> tours_images/photo.card.webp.
+Генерация выполняется в пуле процессов, поэтому модуль не импортирует модели:
+рабочая функция получает только пути к файлам и настройки.
+
+Готовность копий проверяется по файлу-маркеру, но не на каждую сериализацию: результат
+хранится в общем кэше (IMAGE_VARIANTS_MISS_TIMEOUT секунд для отсутствующих копий, без срока —
+для готовых), а после генерации отметка ставится сразу (mark_variants_ready).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_VARIANTS = {'thumb': 320, 'card': 640, 'full': 1280}
+FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+
+_executor = None
+
+
+def get_variants():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def get_quality():
+    return getattr(settings, 'IMAGE_VARIANT_QUALITY', 82)
+
+
+def variant_name(name, variant, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{variant}.{extension}'
+
+
+def _marker_name(name, variants):
+    # Последний записываемый файл: если он есть и свежее оригинала, остальные копии тоже готовы
+    return variant_name(name, list(variants)[-1], FORMATS[-1][0])
+
+
+def _ready_key(name):
+    return f'image-variants:{_marker_name(name, get_variants())}'
+
+
+def mark_variants_ready(name):
+    cache.set(_ready_key(name), True, None)
+
+
+def variants_ready(fieldfile):
+    """Есть ли готовые копии. Файловое хранилище (или S3) опрашивается только при промахе кэша."""
+    key = _ready_key(fieldfile.name)
+    ready = cache.get(key)
+    if ready is None:
+        ready = fieldfile.storage.exists(_marker_name(fieldfile.name, get_variants()))
+        # Имена загруженных файлов не переиспользуются, поэтому готовые копии кэшируются без срока
+        cache.set(key, ready, None if ready else getattr(settings, 'IMAGE_VARIANTS_MISS_TIMEOUT', 60))
+    return ready
+
+
+def generate_variants(path, variants, quality, force=False):
+    """Создаёт копии изображения по абсолютному пути. Возвращает количество записанных файлов."""
+    from PIL import Image, ImageOps
+
+    marker = _marker_name(path, variants)
+    if not force and os.path.exists(marker) and os.path.getmtime(marker) >= os.path.getmtime(path):
+        return 0
+
+    written = 0
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        for variant, size in variants.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            for extension, image_format in FORMATS:
+                target = variant_name(path, variant, extension)
+                frame = resized
+                if image_format == 'JPEG' and frame.mode == 'RGBA':
+                    frame = Image.new('RGB', frame.size, (255, 255, 255))
+                    frame.paste(resized, mask=resized.getchannel('A'))
+                # Запись через временный файл: клиент никогда не получит наполовину записанную копию,
+                # а pid в имени не даёт двум процессам писать в один и тот же временный файл
+                temporary = f'{target}.{os.getpid()}.tmp'
+                frame.save(temporary, format=image_format, quality=quality, optimize=True)
+                os.replace(temporary, target)
+                written += 1
+    return written
+
+
+def get_executor(reset=False):
+    global _executor
+    if _executor is None or reset:
+        # spawn: дочерние процессы не наследуют соединения с БД и потоки веб-сервера
+        _executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_WORKERS', 2), mp_context=get_context('spawn'),
+        )
+    return _executor
+
+
+def needs_variants(fieldfile):
+    if not fieldfile or not hasattr(fieldfile.storage, 'path'):
+        return False
+    path = fieldfile.path
+    if not os.path.exists(path):
+        return False
+    marker = _marker_name(path, get_variants())
+    return not os.path.exists(marker) or os.path.getmtime(marker) < os.path.getmtime(path)
+
+
+def schedule_variants(fieldfile, on_done=None):
+    """Ставит генерацию копий в пул процессов после фиксации транзакции.
+
+    on_done вызывается в текущем процессе, когда копии успешно записаны.
+    """
+    if not needs_variants(fieldfile):
+        return
+    path, name = fieldfile.path, fieldfile.name
+
+    def done(future):
+        if future.exception() is None:
+            mark_variants_ready(name)
+            if on_done is not None:
+                on_done()
+
+    def submit():
+        args = (generate_variants, path, get_variants(), get_quality())
+        try:
+            future = get_executor().submit(*args)
+        except BrokenProcessPool:
+            # Рабочий процесс упал (например, OOM на огромном файле) — пересоздаём пул
+            future = get_executor(reset=True).submit(*args)
+        future.add_done_callback(done)
+
+    transaction.on_commit(submit)
+
+
+def variant_urls(fieldfile, request=None):
+    """Словарь вида {'original': url, 'card': {'webp': url, 'jpeg': url}, ...} только с готовыми копиями."""
+    if not fieldfile:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request is not None else url
+
+    urls = {'original': absolute(fieldfile.url)}
+    if not variants_ready(fieldfile):
+        return urls
+    storage = fieldfile.storage
+    for variant in get_variants():
+        urls[variant] = {
+            extension: absolute(storage.url(variant_name(fieldfile.name, variant, extension)))
+            for extension, _ in FORMATS
+        }
+    return urls
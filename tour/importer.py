@@ -0,0 +1,288 @@
+"""Массовая загрузка туров из CSV/JSONL (manage.py import_tours).
+
+Туры создаются через bulk_create пачками, связи M2M пишутся напрямую в through-таблицы.
+Категории, регионы, даты и изображения сопоставляются по словарям в памяти, поэтому
+на пачку уходит постоянное число запросов независимо от количества связей.
+
+bulk_create не отправляет сигналы, поэтому то, что для одиночного тура делают
+tour/signals.py, выполняется здесь один раз на пачку: поисковый индекс, сводка по датам,
+версии кэшей и итоговые счётчики статистики (TOURS и PUBLISHED_TOURS).
+"""
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from .cache import bump_version_on_commit
+from .leaderboard import LEADERBOARD_NAMESPACE
+from .models import Category, DateTour, RegionTour, Tour, TourImage
+from .regions import invalidate_all_regions
+from .response_cache import model_namespace
+from .search import get_search_backend
+from .seasons import summarize_dates
+from .statistics import PUBLISHED_TOURS, TOURS, add_total
+
+LIST_SEPARATOR = '|'
+DATE_SEPARATOR = ':'
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+
+REQUIRED_FIELDS = ('title', 'description', 'route_tour', 'duration', 'price', 'participants_price',
+                   'max_participants')
+
+
+class ImportRecordError(ValueError):
+    def __init__(self, number, message):
+        super().__init__(f'Запись {number}: {message}')
+        self.number = number
+
+
+def read_records(stream, fmt):
+    """Построчно читает записи из открытого текстового потока, не загружая файл целиком.
+
+    Строки JSONL отдаются как есть и разбираются в TourImporter.parse: ошибка в одной строке
+    не должна останавливать чтение остальных (--skip-invalid).
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def decode_record(number, record):
+    """Запись CSV (словарь) или строка JSONL → словарь полей."""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError as exc:
+            raise ImportRecordError(number, f'некорректный JSON: {exc}')
+    if not isinstance(record, dict):
+        raise ImportRecordError(number, 'ожидается объект JSON')
+    return record
+
+
+def _split(value):
+    if value in (None, ''):
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [item.strip() for item in str(value).split(LIST_SEPARATOR) if item.strip()]
+
+
+def _decimal(value, field):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError):
+        raise ValueError(f'{field}: ожидается число')
+
+
+def _optional_decimal(value, field):
+    return None if value in (None, '') else _decimal(value, field)
+
+
+def _optional_datetime(value, field):
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise ValueError(f'{field}: ожидается дата и время в формате ISO 8601')
+    # Время без смещения считается местным (TIME_ZONE), иначе его нельзя сравнить с timezone.now()
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _date_key(value):
+    """Ключ даты тура: (start_date, end_date, tour_type, season).
+
+    В CSV дата записывается строкой 2025-06-01:2025-06-05:group:summer, в JSONL — объектом.
+    """
+    if isinstance(value, dict):
+        parts = [value.get('start_date'), value.get('end_date'), value.get('tour_type'), value.get('season')]
+    else:
+        parts = str(value).split(DATE_SEPARATOR)
+    if len(parts) != 4 or not all(parts):
+        raise ValueError(f'date_tour: ожидается начало{DATE_SEPARATOR}конец{DATE_SEPARATOR}тип{DATE_SEPARATOR}сезон')
+    start, end, tour_type, season = parts
+    try:
+        start, end = date.fromisoformat(str(start)), date.fromisoformat(str(end))
+    except ValueError:
+        raise ValueError('date_tour: даты ожидаются в формате ГГГГ-ММ-ДД')
+    if end < start:
+        raise ValueError('date_tour: дата окончания раньше даты начала')
+    if tour_type not in dict(DateTour.TOUR_TYPES):
+        raise ValueError(f'date_tour: неизвестный тип тура {tour_type}')
+    if season not in DateTour.SEASON_BITS:
+        raise ValueError(f'date_tour: неизвестный сезон {season}')
+    return start, end, tour_type, season
+
+
+class TourImporter:
+    """Загружает записи пачками. Каждая пачка фиксируется отдельной транзакцией."""
+
+    def __init__(self, using='default', author='import', create_missing=True):
+        self.using = using
+        self.author = author
+        self.create_missing = create_missing
+        self._categories = None
+        self._regions = None
+        self._dates = None
+        self._images = None
+
+    def load_lookups(self):
+        # Справочники небольшие, в отличие от туров, и читаются один раз на всю загрузку
+        self._categories = {}
+        for pk, slug, title in Category.objects.using(self.using).values_list('pk', 'slug', 'title'):
+            self._categories[title.lower()] = pk
+            if slug:
+                self._categories[slug.lower()] = pk
+        self._regions = {}
+        for pk, slug, title in RegionTour.objects.using(self.using).values_list('pk', 'slug', 'title'):
+            self._regions[title.lower()] = pk
+            if slug:
+                self._regions[slug.lower()] = pk
+        self._dates = {
+            (start, end, tour_type, season): pk
+            for pk, start, end, tour_type, season in DateTour.objects.using(self.using).values_list(
+                'pk', 'start_date', 'end_date', 'tour_type', 'season',
+            )
+        }
+        self._images = dict(TourImage.objects.using(self.using).values_list('image', 'pk'))
+
+    def parse(self, number, record):
+        """Проверяет запись и возвращает (Tour, категории, регионы, ключи дат, имена изображений)."""
+        record = decode_record(number, record)
+        try:
+            missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, '')]
+            if missing:
+                raise ValueError(f'не заполнены поля {", ".join(missing)}')
+            tour = Tour(
+                author=record.get('author') or self.author,
+                title=str(record['title'])[:100],
+                description=str(record['description']),
+                route_tour=str(record['route_tour'])[:200],
+                duration=int(record['duration']),
+                price=_decimal(record['price'], 'price'),
+                participants_price=_decimal(record['participants_price'], 'participants_price'),
+                max_participants=int(record['max_participants']),
+                discount_price=_optional_decimal(record.get('discount_price'), 'discount_price'),
+                discount_start_date=_optional_datetime(record.get('discount_start_date'), 'discount_start_date'),
+                discount_end_date=_optional_datetime(record.get('discount_end_date'), 'discount_end_date'),
+                is_published=str(record.get('is_published', '')).strip().lower() in TRUE_VALUES,
+            )
+            if tour.max_participants < 1:
+                raise ValueError('max_participants должно быть не меньше 1')
+            # bulk_create не вызывает Tour.save, где рассчитывается цена с учётом скидки
+            tour.effective_price = tour.get_effective_price()
+            dates = [_date_key(value) for value in _split(record.get('date_tour'))]
+        except (TypeError, ValueError) as exc:
+            raise ImportRecordError(number, exc)
+        return (
+            tour,
+            _split(record.get('category')),
+            _split(record.get('region')),
+            dates,
+            _split(record.get('images')),
+        )
+
+    def _resolve_named(self, lookup, model, names, number):
+        ids = []
+        for name in names:
+            pk = lookup.get(name.lower())
+            if pk is None:
+                # Другое написание того же названия (Issyk Kul и Issyk-Kul) даёт уже занятый slug
+                slug = slugify(name, allow_unicode=True)
+                pk = lookup.get(slug)
+                if pk is None:
+                    if not self.create_missing:
+                        raise ImportRecordError(number, f'не найден {model._meta.verbose_name}: {name}')
+                    if not slug:
+                        raise ImportRecordError(number, f'из названия «{name}» не получается slug')
+                    pk = self._create_named(model, name, slug)
+                lookup[name.lower()] = lookup[slug] = pk
+            if pk not in ids:
+                ids.append(pk)
+        return ids
+
+    def _create_named(self, model, name, slug):
+        # Справочники пополняются редко, поэтому создаются по одному (с сигналами)
+        try:
+            with transaction.atomic(using=self.using):
+                return model.objects.using(self.using).create(title=name, description='', slug=slug).pk
+        except IntegrityError:
+            # slug заняла параллельная загрузка после чтения справочников
+            return model.objects.using(self.using).get(slug=slug).pk
+
+    def import_chunk(self, rows):
+        """rows — список (номер записи, результат parse). Возвращает количество созданных туров."""
+        if self._categories is None:
+            self.load_lookups()
+        try:
+            return self._import_chunk(rows)
+        except Exception:
+            # Откат транзакции удаляет и созданные в ней справочники — словари нужно перечитать
+            self._categories = None
+            raise
+
+    def _import_chunk(self, rows):
+        with transaction.atomic(using=self.using):
+            # Новые даты и изображения создаются одним bulk_create на пачку
+            new_dates = {key for _, parsed in rows for key in parsed[3] if key not in self._dates}
+            if new_dates:
+                created = DateTour.objects.using(self.using).bulk_create([
+                    DateTour(start_date=start, end_date=end, tour_type=tour_type, season=season)
+                    for start, end, tour_type, season in new_dates
+                ])
+                for instance in created:
+                    self._dates[(instance.start_date, instance.end_date, instance.tour_type, instance.season)] = \
+                        instance.pk
+            new_images = {name for _, parsed in rows for name in parsed[4] if name not in self._images}
+            if new_images:
+                created = TourImage.objects.using(self.using).bulk_create([TourImage(image=name) for name in new_images])
+                for instance in created:
+                    self._images[instance.image.name] = instance.pk
+
+            relations = []
+            for number, (tour, categories, regions, dates, images) in rows:
+                # Сводка по датам считается до вставки, повторное чтение through-таблицы не нужно
+                tour.season_mask, tour.next_start_date, tour.last_start_date = summarize_dates(
+                    [(season, start) for start, _, _, season in dates]
+                )
+                relations.append((
+                    self._resolve_named(self._categories, Category, categories, number),
+                    self._resolve_named(self._regions, RegionTour, regions, number),
+                    list(dict.fromkeys(self._dates[key] for key in dates)),
+                    list(dict.fromkeys(self._images[name] for name in images)),
+                ))
+
+            tours = Tour.objects.using(self.using).bulk_create([parsed[0] for _, parsed in rows])
+
+            category_links, region_links, date_links, image_links = [], [], [], []
+            for tour, (categories, regions, dates, images) in zip(tours, relations):
+                category_links += [Tour.category.through(tour_id=tour.pk, category_id=pk) for pk in categories]
+                region_links += [Tour.region.through(tour_id=tour.pk, regiontour_id=pk) for pk in regions]
+                date_links += [Tour.date_tour.through(tour_id=tour.pk, datetour_id=pk) for pk in dates]
+                image_links += [Tour.images.through(tour_id=tour.pk, tourimage_id=pk) for pk in images]
+            for links in (category_links, region_links, date_links, image_links):
+                if links:
+                    type(links[0]).objects.using(self.using).bulk_create(links)
+
+            get_search_backend(self.using).index_tours(tours)
+            bump_version_on_commit(model_namespace(Tour), using=self.using)
+            bump_version_on_commit(LEADERBOARD_NAMESPACE, using=self.using)
+            invalidate_all_regions(using=self.using)
+
+            published = sum(1 for tour in tours if tour.is_published)
+            transaction.on_commit(lambda: self._add_totals(len(tours), published), using=self.using)
+        return len(tours)
+
+    def _add_totals(self, total, published):
+        add_total(TOURS, count=total, using=self.using)
+        add_total(PUBLISHED_TOURS, count=published, using=self.using)
@@ -0,0 +1,222 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Booking, SeatHold, TourInventory
+
+REJECTED_BOOKING = 3
+
+
+class SeatsUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Недостаточно свободных мест на выбранную дату.'
+    default_code = 'seats_unavailable'
+
+
+class HoldNotActive(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Бронь мест истекла или уже обработана.'
+    default_code = 'hold_not_active'
+
+
+class HoldConfirmed(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Места уже подтверждены бронированием; освободить их можно только отменой бронирования.'
+    default_code = 'hold_confirmed'
+
+
+def get_hold_ttl():
+    return getattr(settings, 'SEAT_HOLD_TTL', timedelta(minutes=15))
+
+
+def get_availability(tour):
+    """Остатки мест по всем датам тура: строки TourInventory плюс расчёт для дат, по которым их ещё нет."""
+    inventories = {inventory.date_id: inventory for inventory in tour.inventories.all()}
+    dates = list(tour.date_tour.all())
+    missing = [date.pk for date in dates if date.pk not in inventories]
+    legacy = {}
+    if missing:
+        legacy = dict(
+            Booking.objects.filter(tour=tour, date_id__in=missing, seat_hold__isnull=True)
+            .exclude(status=REJECTED_BOOKING)
+            .values('date_id').annotate(total=Sum('participants')).values_list('date_id', 'total')
+        )
+
+    availability = []
+    for date in dates:
+        inventory = inventories.get(date.pk)
+        if inventory is None:
+            inventory = TourInventory(tour=tour, date=date, capacity=tour.max_participants,
+                                      reserved=legacy.get(date.pk) or 0)
+        availability.append(inventory)
+    return availability
+
+
+def get_inventory(tour, date, exclude_booking=None):
+    """Возвращает строку остатка для (тур, дата), создавая её при первом обращении.
+
+    Брони, появившиеся до учёта остатков, не связаны с SeatHold и учитываются один раз при создании строки.
+    """
+    inventory = TourInventory.objects.filter(tour=tour, date=date).first()
+    if inventory is not None:
+        return inventory
+
+    legacy = Booking.objects.filter(tour=tour, date=date, seat_hold__isnull=True).exclude(status=REJECTED_BOOKING)
+    if exclude_booking is not None:
+        legacy = legacy.exclude(pk=exclude_booking.pk)
+    legacy_reserved = legacy.aggregate(total=Sum('participants'))['total'] or 0
+    try:
+        with transaction.atomic():
+            return TourInventory.objects.create(
+                tour=tour, date=date, capacity=tour.max_participants, reserved=legacy_reserved,
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        return TourInventory.objects.get(tour=tour, date=date)
+
+
+def _take_seats(inventory_id, seats):
+    # Условный UPDATE атомарен в любой СУБД: строка меняется, только если места ещё есть.
+    # В PostgreSQL конкурирующий UPDATE ждёт блокировку строки и перепроверяет условие,
+    # поэтому отдельный select_for_update не нужен.
+    updated = TourInventory.objects.filter(
+        pk=inventory_id, reserved__lte=F('capacity') - seats,
+    ).update(reserved=F('reserved') + seats)
+    if not updated:
+        raise SeatsUnavailable()
+
+
+def return_seats(inventory_id, seats):
+    TourInventory.objects.filter(pk=inventory_id).update(reserved=F('reserved') - seats)
+
+
+def reserve_seats(tour, date, user, seats, ttl=None):
+    """Удерживает места на время ttl. Бросает SeatsUnavailable, если свободных мест не хватает."""
+    inventory = get_inventory(tour, date)
+    with transaction.atomic():
+        _take_seats(inventory.pk, seats)
+        return SeatHold.objects.create(
+            inventory=inventory,
+            user=user,
+            seats=seats,
+            expires_at=timezone.now() + (ttl or get_hold_ttl()),
+        )
+
+
+def confirm_hold(hold):
+    """Превращает удерживаемые места в бронирование. Места остаются занятыми."""
+    with transaction.atomic():
+        updated = SeatHold.objects.filter(
+            pk=hold.pk, status=SeatHold.HELD, expires_at__gt=timezone.now(),
+        ).update(status=SeatHold.CONFIRMED)
+        if not updated:
+            raise HoldNotActive()
+
+        inventory = hold.inventory
+        booking = Booking(
+            tour_id=inventory.tour_id,
+            user_id=hold.user_id,
+            date_id=inventory.date_id,
+            participants=hold.seats,
+            total_price=inventory.tour.participants_price * hold.seats,
+            status=1,
+        )
+        # Места уже учтены удержанием, сигнал бронирования не должен занимать их повторно
+        booking._seat_hold = hold
+        booking.save()
+
+        hold.status = SeatHold.CONFIRMED
+        hold.booking = booking
+        SeatHold.objects.filter(pk=hold.pk).update(booking=booking)
+        return booking
+
+
+def release_hold(hold, new_status=SeatHold.RELEASED, statuses=SeatHold.ACTIVE_STATUSES):
+    """Освобождает места удержания в одном из statuses. Повторный вызов ничего не меняет.
+
+    По умолчанию освобождаются и подтверждённые места — это путь отмены бронирования.
+    """
+    with transaction.atomic():
+        updated = SeatHold.objects.filter(pk=hold.pk, status__in=statuses).update(status=new_status)
+        if updated:
+            return_seats(hold.inventory_id, hold.seats)
+            hold.status = new_status
+        return bool(updated)
+
+
+def cancel_hold(hold):
+    """Отмена удержания пользователем: освобождаются только ещё не подтверждённые места.
+
+    Места подтверждённого удержания принадлежат бронированию и возвращаются только при его
+    отклонении или удалении, иначе дату можно продать повторно при живом бронировании.
+    """
+    if release_hold(hold, statuses=(SeatHold.HELD,)):
+        return True
+    if SeatHold.objects.filter(pk=hold.pk, status=SeatHold.CONFIRMED).exists():
+        raise HoldConfirmed()
+    return False
+
+
+def attach_booking(booking):
+    """Учитывает места бронирования, созданного в обход удержания (например, из админки)."""
+    inventory = get_inventory(booking.tour, booking.date, exclude_booking=booking)
+    with transaction.atomic():
+        _take_seats(inventory.pk, booking.participants)
+        return SeatHold.objects.create(
+            inventory=inventory,
+            user_id=booking.user_id,
+            seats=booking.participants,
+            status=SeatHold.CONFIRMED,
+            expires_at=timezone.now(),
+            booking=booking,
+        )
+
+
+def _stale_holds(now, batch_size):
+    stale = SeatHold.objects.filter(status=SeatHold.HELD, expires_at__lte=now).order_by('expires_at')
+    locked = transaction.get_connection().features.has_select_for_update_skip_locked
+    if locked:
+        # Удержания, которые прямо сейчас подтверждаются, пропускаем до следующего прохода
+        stale = stale.select_for_update(skip_locked=True)
+    return list(stale.values_list('pk', 'inventory_id', 'seats')[:batch_size]), locked
+
+
+def expire_holds(batch_size=None, now=None):
+    """Освобождает просроченные удержания пачками. Возвращает количество истёкших удержаний."""
+    batch_size = batch_size or getattr(settings, 'SEAT_HOLD_EXPIRE_BATCH', 500)
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            batch, locked = _stale_holds(now, batch_size)
+            if not batch:
+                break
+
+            if locked:
+                # Строки заблокированы до конца транзакции: параллельный release_hold дождётся
+                # блокировки и уже не найдёт удержание в статусе HELD
+                SeatHold.objects.filter(
+                    pk__in=[pk for pk, _, _ in batch], status=SeatHold.HELD,
+                ).update(status=SeatHold.EXPIRED)
+                expired = batch
+            else:
+                # Без блокировки удержание могли отменить между SELECT и UPDATE: места возвращаются
+                # только за строки, которые изменил этот UPDATE, как в release_hold
+                expired = [
+                    row for row in batch
+                    if SeatHold.objects.filter(pk=row[0], status=SeatHold.HELD).update(status=SeatHold.EXPIRED)
+                ]
+            released = {}
+            for _, inventory_id, seats in expired:
+                released[inventory_id] = released.get(inventory_id, 0) + seats
+            for inventory_id, seats in released.items():
+                return_seats(inventory_id, seats)
+        total += len(expired)
+        if len(batch) < batch_size:
+            break
+    return total
@@ -0,0 +1,59 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .cache import get_version
+from .models import Tour
+
+LEADERBOARD_NAMESPACE = 'tour-leaderboard'
+
+
+def get_leaderboard_size(limit=None):
+    size = getattr(settings, 'TOUR_LEADERBOARD_SIZE', 4)
+    max_size = getattr(settings, 'TOUR_LEADERBOARD_MAX_SIZE', 50)
+    if limit is None:
+        return size
+    return max(1, min(limit, max_size))
+
+
+def get_top_rated_ids(limit=None, category=None, region=None):
+    """ID опубликованных туров с лучшим рейтингом. Список хранится в кэше до изменения оценок или публикации."""
+    limit = get_leaderboard_size(limit)
+    key = ':'.join([
+        LEADERBOARD_NAMESPACE,
+        str(get_version(LEADERBOARD_NAMESPACE)),
+        str(category or '*'),
+        str(region or '*'),
+        str(limit),
+    ])
+    ids = cache.get(key)
+    if ids is None:
+        queryset = Tour.objects.filter(is_published=True)
+        if category:
+            queryset = queryset.filter(category=category)
+        if region:
+            queryset = queryset.filter(region=region)
+        ids = list(
+            queryset.order_by(F('average_rating').desc(nulls_last=True), '-rating_count', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        cache.set(key, ids, getattr(settings, 'TOUR_LEADERBOARD_TIMEOUT', None))
+    return ids
+
+
+def get_top_rated_tours(limit=None, category=None, region=None, queryset=None):
+    ids = get_top_rated_ids(limit, category, region)
+    if queryset is None:
+        queryset = Tour.objects.all()
+    tours = queryset.in_bulk(ids)
+    return [tours[pk] for pk in ids if pk in tours]
+
+
+async def aget_top_rated_tours(limit=None, category=None, region=None, queryset=None):
+    # Список ID почти всегда берётся из кэша, поэтому он читается синхронной функцией в отдельном потоке
+    ids = await sync_to_async(get_top_rated_ids)(limit, category, region)
+    if queryset is None:
+        queryset = Tour.objects.all()
+    tours = await queryset.ain_bulk(ids)
+    return [tours[pk] for pk in ids if pk in tours]
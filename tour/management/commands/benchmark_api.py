@@ -0,0 +1,188 @@
+import inspect
+import json
+import statistics
+import subprocess
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.urls import URLPattern
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tour import urls as tour_urls
+from tour.benchmark import percentile, query_count, wsgi_get
+from tour.models import Banner, Booking, Feedback, RegionTour, SeatHold, Tour
+from user import urls as user_urls
+from user.models import MyUser
+
+URL_MODULES = (('/api/', tour_urls), ('/api/user/', user_urls))
+# Параметры строки запроса для эндпоинтов, которым без них нечего искать
+ROUTE_QUERIES = {
+    'tour-season': 'season=summer',
+    'async-tour-season': 'season=summer',
+    'tour-search': 'search=горы',
+    'async-tour-search': 'search=горы',
+    'admin-export': 'type=ndjson',
+}
+# Модель для параметра pk по имени маршрута
+PK_MODELS = {
+    'banner-detail': Banner,
+    'async-banner-detail': Banner,
+    'region-detail': RegionTour,
+    'async-region-detail': RegionTour,
+    'feedback-thread': Feedback,
+    'async-feedback-thread': Feedback,
+    'seat-hold-detail': SeatHold,
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер всех GET-эндпоинтов tour/urls.py и user/urls.py: пропускная способность, '
+            'задержки p50/p95/p99 и количество запросов к БД. Результат сохраняется в JSON для сравнения '
+            'между коммитами. Данные удобно подготовить командой generate_synthetic_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Количество запросов на эндпоинт')
+        parser.add_argument('--concurrency', type=int, default=8, help='Одновременных запросов')
+        parser.add_argument('--route', action='append', help='Имя маршрута (по умолчанию все)')
+        parser.add_argument('--output', default='benchmark.json', help='Файл с результатами')
+
+    def handle(self, *args, **options):
+        user = MyUser.objects.filter(is_admin=True, is_blocked=False).order_by('pk').first()
+        if user is None:
+            raise CommandError('Нужен администратор: запросы к закрытым эндпоинтам выполняются от его имени')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        application = get_wsgi_application()
+
+        results = {}
+        started = time.perf_counter()
+        for name, url, skipped in self.collect_routes(user, options['route']):
+            if skipped:
+                results[name] = {'url': url, 'skipped': skipped}
+                self.stdout.write(f'{name:<28} пропущен: {skipped}')
+                continue
+            results[name] = row = self.measure(application, url, headers, options['requests'],
+                                               options['concurrency'])
+            self.stdout.write(
+                f'{name:<28} {row["rps"]:>8} rps  p50 {row["p50_ms"]:>7} мс  p95 {row["p95_ms"]:>7} мс  '
+                f'p99 {row["p99_ms"]:>7} мс  запросов к БД: {row["queries"]}  ошибок: {row["errors"]}'
+            )
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'revision': self.git_revision(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'duration_s': round(time.perf_counter() - started, 2),
+            'dataset': {
+                'users': MyUser.objects.count(),
+                'tours': Tour.objects.count(),
+                'feedback': Feedback.objects.count(),
+                'bookings': Booking.objects.count(),
+            },
+            'routes': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {options["output"]}'))
+
+    def collect_routes(self, user, names):
+        """Возвращает (имя маршрута, URL, причина пропуска или None) для каждого маршрута."""
+        for prefix, module in URL_MODULES:
+            for pattern in module.urlpatterns:
+                if not isinstance(pattern, URLPattern) or (names and pattern.name not in names):
+                    continue
+                view_class = getattr(pattern.callback, 'view_class', None)
+                if view_class is not None and not hasattr(view_class, 'get'):
+                    yield pattern.name, prefix + str(pattern.pattern), 'нет обработчика GET'
+                    continue
+                kwargs = {}
+                for argument in pattern.pattern.converters:
+                    kwargs[argument] = self.sample_value(pattern.name, argument, user)
+                route = str(pattern.pattern)
+                if view_class is not None and not self.accepts(view_class.get, kwargs):
+                    yield pattern.name, prefix + route, 'GET не принимает параметры маршрута'
+                    continue
+                missing = [argument for argument, value in kwargs.items() if value is None]
+                if missing:
+                    yield pattern.name, prefix + route, f'нет данных для {", ".join(missing)}'
+                    continue
+                for argument, value in kwargs.items():
+                    route = route.replace(f'<{argument}>', str(value))
+                    for converter in ('int', 'str', 'slug'):
+                        route = route.replace(f'<{converter}:{argument}>', str(value))
+                url = prefix + route
+                if pattern.name in ROUTE_QUERIES:
+                    url += '?' + ROUTE_QUERIES[pattern.name]
+                # Строка запроса передаётся в percent-encoding, как её отправил бы клиент
+                yield pattern.name, quote(url, safe='/?=&'), None
+
+    @staticmethod
+    def accepts(handler, kwargs):
+        parameters = inspect.signature(handler).parameters
+        if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+            return True
+        return set(kwargs) <= set(parameters)
+
+    @staticmethod
+    def sample_value(route_name, argument, user):
+        if argument == 'name':
+            return 'tours'
+        if argument in ('id', 'tour_id'):
+            return Tour.objects.filter(is_published=True).order_by('pk').values_list('pk', flat=True).first()
+        if argument == 'slug':
+            return RegionTour.objects.filter(slug__isnull=False).order_by('pk').values_list('slug', flat=True).first()
+        if argument == 'user_id':
+            return MyUser.objects.exclude(pk=user.pk).order_by('pk').values_list('pk', flat=True).first()
+        if argument == 'booking_id':
+            return Booking.objects.order_by('pk').values_list('pk', flat=True).first()
+        model = PK_MODELS.get(route_name)
+        if argument != 'pk' or model is None:
+            return None
+        queryset = model.objects.order_by('pk')
+        if model is Feedback:
+            # Самая большая ветка — худший случай для загрузки ответов
+            queryset = Feedback.objects.filter(depth=0).order_by('-reply_count', 'pk')
+        elif model is SeatHold:
+            queryset = queryset.filter(user=user)
+        return queryset.values_list('pk', flat=True).first()
+
+    @staticmethod
+    def measure(application, url, headers, total, concurrency):
+        def call(_):
+            latency, status, response_headers = wsgi_get(application, url, headers)
+            return latency, status, query_count(response_headers), response_headers.get('X-Cache')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(call, range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for latency, _, _, _ in outcomes]
+        queries = [count for _, _, count, _ in outcomes if count is not None]
+        return {
+            'url': url,
+            'requests': total,
+            'errors': sum(status >= 400 for _, status, _, _ in outcomes),
+            'statuses': dict(Counter(status for _, status, _, _ in outcomes)),
+            'rps': round(total / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+            'queries': max(queries) if queries else None,
+            'queries_min': min(queries) if queries else None,
+            'cache_hits': sum(cache == 'HIT' for _, _, _, cache in outcomes),
+        }
+
+    @staticmethod
+    def git_revision():
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
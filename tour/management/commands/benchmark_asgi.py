@@ -0,0 +1,131 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+
+from tour.benchmark import HOST, percentile, wsgi_get
+from tour.models import Feedback, Tour
+
+# Режимы: синхронные представления под WSGI (пул потоков), те же представления под ASGI
+# (Django выполняет их через sync_to_async) и асинхронные представления из tour/async_views.py.
+# Запросы выполняются в этом же процессе без сети; синхронные списки каталога отдаются
+# из кэша ответов (tour/response_cache.py), асинхронные всегда читают БД.
+MODES = ('wsgi', 'asgi-sync', 'asgi-async')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность и задержки эндпоинтов каталога под WSGI и ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Количество запросов на режим')
+        parser.add_argument('--concurrency', type=int, default=64, help='Одновременных запросов')
+        parser.add_argument('--mode', choices=MODES, action='append', help='Режимы (по умолчанию все)')
+        parser.add_argument('--path', action='append', help='Путь без префикса /api/, например tours/season/')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def default_paths(self):
+        paths = ['banners/', 'regions/', 'tours/', 'tours/season/?season=summer', 'tours/search/?search=тур',
+                 'feedbacks/']
+        tour_id = Tour.objects.order_by('pk').values_list('pk', flat=True).first()
+        if tour_id:
+            paths.append(f'tours/{tour_id}/')
+        feedback_id = Feedback.objects.filter(depth=0).order_by('pk').values_list('pk', flat=True).first()
+        if feedback_id:
+            paths.append(f'feedbacks/{feedback_id}/')
+        return paths
+
+    def handle(self, *args, **options):
+        paths = options['path'] or self.default_paths()
+        total, concurrency = options['requests'], options['concurrency']
+        results = {}
+        for mode in options['mode'] or MODES:
+            prefix = '/api/async/' if mode == 'asgi-async' else '/api/'
+            # Строка запроса передаётся серверу в percent-encoding, как её отправил бы клиент
+            urls = [quote(prefix + paths[i % len(paths)], safe='/?=&') for i in range(total)]
+            runner = self.run_wsgi if mode == 'wsgi' else self.run_asgi
+            started = time.perf_counter()
+            latencies, errors = runner(urls, concurrency)
+            elapsed = time.perf_counter() - started
+            results[mode] = {
+                'requests': total,
+                'concurrency': concurrency,
+                'errors': errors,
+                'rps': round(total / elapsed, 1),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps({'paths': paths, 'results': results}, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(f'Пути: {", ".join(paths)}')
+        for mode, row in results.items():
+            self.stdout.write(
+                f'{mode:<11} {row["rps"]:>9} rps  p50 {row["p50_ms"]:>8} мс  p99 {row["p99_ms"]:>8} мс  '
+                f'ошибок: {row["errors"]}'
+            )
+
+    def run_wsgi(self, urls, concurrency):
+        application = get_wsgi_application()
+
+        def call(url):
+            latency, status, _ = wsgi_get(application, url)
+            return latency, status >= 300
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(call, urls))
+        return [latency for latency, _ in outcomes], sum(failed for _, failed in outcomes)
+
+    def run_asgi(self, urls, concurrency):
+        application = get_asgi_application()
+
+        async def call(url, semaphore):
+            parts = urlsplit(url)
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': parts.path,
+                'raw_path': parts.path.encode(),
+                'query_string': parts.query.encode(),
+                'root_path': '',
+                'headers': [(b'host', HOST.encode())],
+                'client': ('127.0.0.1', 0),
+                'server': (HOST, 80),
+            }
+            messages = []
+            body_sent = False
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Клиент не отключается: Django отменит ожидание после отправки ответа
+                await asyncio.Future()
+
+            async def send(message):
+                messages.append(message)
+
+            async with semaphore:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                latency = time.perf_counter() - started
+            status = next(message['status'] for message in messages if message['type'] == 'http.response.start')
+            return latency, status >= 300
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(call(url, semaphore) for url in urls))
+
+        outcomes = asyncio.run(run_all())
+        return [latency for latency, _ in outcomes], sum(failed for _, failed in outcomes)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from tour.similarity import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_USER_ITEMS, DEFAULT_TOP_K, SimilarityBuilder
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие туры по оценкам, избранному и бронированиям с учётом общих категорий '
+            'и регионов. Запускать по расписанию, например раз в сутки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Соседей на тур')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Туров за один проход; ограничивает расход памяти')
+        parser.add_argument('--max-user-items', type=int, default=DEFAULT_MAX_USER_ITEMS,
+                            help='Наибольшее количество туров одного пользователя в расчёте')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Алиас базы данных')
+
+    def handle(self, *args, **options):
+        builder = SimilarityBuilder(
+            top_k=options['top_k'], chunk_size=options['chunk_size'], max_user_items=options['max_user_items'],
+            using=options['database'],
+        )
+        started = time.monotonic()
+        result = builder.build(progress=lambda done, total: self.stdout.write(f'Обработано туров: {done} из {total}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с: туров {result["tours"]}, соседей {result["rows"]}'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from tour.inventory import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Освобождает места просроченных удержаний (запускать по расписанию, например раз в минуту)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Количество удержаний в одной транзакции')
+
+    def handle(self, *args, **options):
+        expired = expire_holds(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Истекло удержаний: {expired}'))
@@ -0,0 +1,71 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from tour.cache import bump_version
+from tour.images import generate_variants, get_quality, get_variants, mark_variants_ready
+from tour.models import Banner, RegionTour, TourImage
+from tour.response_cache import model_namespace
+from tour.signals import touch_image_owners
+from user.models import MyUser
+
+IMAGE_FIELDS = [
+    (TourImage, 'image'),
+    (Banner, 'banner_image'),
+    (RegionTour, 'image'),
+    (MyUser, 'avatar'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии (thumb/card/full, WebP и JPEG) для уже загруженных изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Количество процессов')
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии, даже если они актуальны')
+
+    def iter_paths(self):
+        for model, field in IMAGE_FIELDS:
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            for pk, name in rows.values_list('pk', field).iterator(chunk_size=2000):
+                path = default_storage.path(name)
+                if os.path.exists(path):
+                    yield model, pk, name, path
+                else:
+                    self.stderr.write(f'Файл не найден: {name}')
+
+    def handle(self, *args, **options):
+        variants, quality = get_variants(), get_quality()
+        processed = written = failed = 0
+        ready = defaultdict(list)
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=get_context('spawn')) as executor:
+            futures = {
+                executor.submit(generate_variants, path, variants, quality, options['force']): (model, pk, name, path)
+                for model, pk, name, path in self.iter_paths()
+            }
+            for future in as_completed(futures):
+                processed += 1
+                model, pk, name, path = futures[future]
+                try:
+                    count = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{os.path.relpath(path, settings.MEDIA_ROOT)}: {exc}')
+                else:
+                    written += count
+                    mark_variants_ready(name)
+                    if count and model is not MyUser:
+                        ready[model].append(pk)
+
+        # Новые копии меняют srcset: сдвигаем updated_date владельцев (ETag) и версии кэша списков
+        for model, pks in ready.items():
+            touch_image_owners(model, pks)
+            bump_version(model_namespace(model))
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {processed}, создано файлов: {written}, ошибок: {failed}'
+        ))
@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from tour.importer import ImportRecordError, TourImporter, read_records
+
+
+class Command(BaseCommand):
+    help = ('Загружает туры из CSV или JSONL пачками. Списки в CSV разделяются «|», дата тура '
+            'записывается как начало:конец:тип:сезон. После каждой пачки смещение сохраняется '
+            'в файл состояния, поэтому прерванную загрузку можно продолжить')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV/JSONL или «-» для чтения из stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Формат (по умолчанию по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Количество туров в одной транзакции')
+        parser.add_argument('--offset', type=int, help='Пропустить первые N записей')
+        parser.add_argument('--state-file', help='Файл смещения (по умолчанию <path>.offset)')
+        parser.add_argument('--author', default='import', help='Автор для записей без поля author')
+        parser.add_argument('--skip-invalid', action='store_true', help='Пропускать ошибочные записи')
+        parser.add_argument('--no-create', action='store_true',
+                            help='Не создавать отсутствующие категории и регионы, а считать запись ошибочной')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Алиас базы данных')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        state_file = options['state_file'] or (None if path == '-' else f'{path}.offset')
+        offset = options['offset']
+        if offset is None:
+            offset = self.read_offset(state_file)
+        if offset:
+            self.stdout.write(f'Продолжение с записи {offset + 1}')
+
+        importer = TourImporter(
+            using=options['database'], author=options['author'], create_missing=not options['no_create'],
+        )
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        try:
+            self.run(importer, stream, fmt, offset, state_file, options)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def run(self, importer, stream, fmt, offset, state_file, options):
+        chunk_size = options['chunk_size']
+        records = enumerate(islice(read_records(stream, fmt), offset, None), start=offset + 1)
+        imported = skipped = 0
+        position = offset
+        started = time.monotonic()
+        while True:
+            batch = list(islice(records, chunk_size))
+            if not batch:
+                break
+            rows = []
+            for number, record in batch:
+                try:
+                    rows.append((number, importer.parse(number, record)))
+                except ImportRecordError as exc:
+                    if not options['skip_invalid']:
+                        raise CommandError(f'{exc}. Загружено записей до ошибки: {position}')
+                    skipped += 1
+                    self.stderr.write(str(exc))
+            if rows:
+                try:
+                    imported += importer.import_chunk(rows)
+                except ImportRecordError as exc:
+                    raise CommandError(f'{exc}. Загружено записей до ошибки: {position}')
+
+            # Смещение сохраняется только после фиксации пачки
+            position = batch[-1][0]
+            self.write_offset(state_file, position)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Записей: {position}, загружено туров: {imported}, пропущено: {skipped}, '
+                f'{imported / elapsed if elapsed else 0:.0f} туров/с'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: загружено туров {imported}, пропущено {skipped}, за {time.monotonic() - started:.1f} с'
+        ))
+
+    def read_offset(self, state_file):
+        if not state_file or not os.path.exists(state_file):
+            return 0
+        try:
+            with open(state_file, encoding='utf-8') as handle:
+                return int(json.load(handle)['offset'])
+        except (ValueError, KeyError, TypeError):
+            raise CommandError(f'Не удалось прочитать смещение из {state_file}')
+
+    def write_offset(self, state_file, offset):
+        if not state_file:
+            return
+        temporary = f'{state_file}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump({'offset': offset}, handle)
+        os.replace(temporary, state_file)
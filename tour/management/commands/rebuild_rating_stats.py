@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tour.models import Tour
+from tour.ratings import rebuild_rating_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает rating_count, rating_sum и average_rating туров по таблице Rating'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tour', type=int, action='append', dest='tour_ids',
+                            help='ID тура для пересчёта (можно указать несколько раз)')
+
+    def handle(self, *args, **options):
+        queryset = Tour.objects.all()
+        if options['tour_ids']:
+            queryset = queryset.filter(pk__in=options['tour_ids'])
+
+        with transaction.atomic():
+            updated = rebuild_rating_stats(queryset)
+
+        self.stdout.write(self.style.SUCCESS(f'Пересчитаны рейтинги {updated} туров'))
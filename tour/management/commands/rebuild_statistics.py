@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from tour.statistics import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводки BookingStat и счётчики StatTotal по бронированиям, турам и пользователям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Алиас базы данных')
+
+    def handle(self, *args, **options):
+        rows = rebuild_statistics(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано строк сводок: {rows}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from tour.trending import rebuild_trending_scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает популярность туров (Tour.trending_score) по бронированиям, оценкам и избранному. '
+            'Накопленные просмотры при этом теряются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Алиас базы данных')
+
+    def handle(self, *args, **options):
+        tours = rebuild_trending_scores(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Пересчитана популярность туров: {tours}'))
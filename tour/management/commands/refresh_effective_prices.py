@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from tour.pricing import DEFAULT_BATCH_SIZE, PriceScheduler, refresh_stale_prices
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает действующие цены туров на границах окон скидки. Без --loop выполняет один '
+            'проход по всем турам с окном скидки (для cron); с --loop работает постоянно и просыпается '
+            'ровно к началу или концу ближайшей скидки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Количество туров в одном UPDATE')
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+        parser.add_argument('--max-sleep', type=float, default=60,
+                            help='Наибольшая пауза между проходами в режиме --loop, секунды')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            updated = refresh_stale_prices(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Обновлено цен: {updated}'))
+            return
+
+        def report(checked, updated):
+            if updated:
+                self.stdout.write(f'{checked.isoformat()}: обновлено цен: {updated}')
+
+        scheduler = PriceScheduler(batch_size=options['batch_size'], max_sleep=options['max_sleep'])
+        try:
+            scheduler.run(callback=report)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Остановлено'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tour.models import Tour
+from tour.seasons import refresh_tour_dates
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сезоны и ближайшие даты начала туров. Запускать раз в сутки: '
+            'прошедшие даты перестают быть предстоящими без изменений в БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Количество туров в одной пачке')
+        parser.add_argument('--all', action='store_true',
+                            help='Пересчитать все туры, а не только те, у которых ближайшая дата уже прошла')
+
+    def handle(self, *args, **options):
+        queryset = Tour.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(next_start_date__lt=timezone.localdate())
+
+        total = 0
+        last_pk = 0
+        while True:
+            ids = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            total += refresh_tour_dates(ids)
+            last_pk = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Обновлено туров: {total}'))
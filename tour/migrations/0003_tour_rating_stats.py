@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-18 17:17
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_stats(apps, schema_editor):
+    Tour = apps.get_model('tour', 'Tour')
+    Rating = apps.get_model('tour', 'Rating')
+    ratings = Rating.objects.filter(tour=OuterRef('pk')).order_by().values('tour')
+    Tour.objects.using(schema_editor.connection.alias).update(
+        rating_count=Coalesce(
+            Subquery(ratings.annotate(value=Count('pk')).values('value'), output_field=IntegerField()), 0
+        ),
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(value=Sum('score')).values('value'), output_field=IntegerField()), 0
+        ),
+        average_rating=Subquery(ratings.annotate(value=Avg('score')).values('value'), output_field=FloatField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='average_rating',
+            field=models.FloatField(blank=True, db_index=True, null=True, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0003_tour_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['is_published', '-average_rating'], name='tour_published_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1 on 2026-10-18 17:40
+
+from django.db import migrations
+
+SQLITE_TABLE = 'tour_tour_fts'
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('russian'::regconfig, translate(coalesce(title, ''), 'ёЁ', 'еЕ')), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, translate(coalesce(route_tour, ''), 'ёЁ', 'еЕ')), 'B') || "
+    "setweight(to_tsvector('russian'::regconfig, translate(coalesce(description, ''), 'ёЁ', 'еЕ')), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+                return
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {SQLITE_TABLE} USING fts5('
+            f"title, route_tour, description, tokenize='unicode61 remove_diacritics 2', prefix='3 4')"
+        )
+        # Заголовок важнее маршрута, маршрут важнее описания
+        schema_editor.execute(f"INSERT INTO {SQLITE_TABLE} ({SQLITE_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')")
+        schema_editor.execute(
+            f'INSERT INTO {SQLITE_TABLE} (rowid, title, route_tour, description) '
+            "SELECT id, replace(replace(title, 'ё', 'е'), 'Ё', 'Е'), "
+            "replace(replace(route_tour, 'ё', 'е'), 'Ё', 'Е'), "
+            "replace(replace(description, 'ё', 'е'), 'Ё', 'Е') FROM tour_tour"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'ALTER TABLE tour_tour ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({POSTGRES_VECTOR}) STORED'
+        )
+        schema_editor.execute('CREATE INDEX tour_tour_search_vector_idx ON tour_tour USING GIN (search_vector)')
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS tour_tour_search_vector_idx')
+        schema_editor.execute('ALTER TABLE tour_tour DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0004_tour_published_rating_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
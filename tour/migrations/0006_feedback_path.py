@@ -0,0 +1,59 @@
+# Generated by Django 5.1 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+def fill_feedback_paths(apps, schema_editor):
+    Feedback = apps.get_model('tour', 'Feedback')
+    manager = Feedback.objects.using(schema_editor.connection.alias)
+    parents = dict(manager.values_list('pk', 'parent_id'))
+
+    paths = {}
+
+    def build_path(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (build_path(parent_id) if parent_id else '') + f'{pk:010d}/'
+        return paths[pk]
+
+    reply_counts = dict.fromkeys(parents, 0)
+    for pk in parents:
+        for ancestor_id in [int(segment) for segment in build_path(pk).split('/') if segment][:-1]:
+            reply_counts[ancestor_id] += 1
+
+    feedbacks = list(manager.only('pk'))
+    for feedback in feedbacks:
+        feedback.path = paths[feedback.pk]
+        feedback.depth = feedback.path.count('/') - 1
+        feedback.reply_count = reply_counts[feedback.pk]
+    manager.bulk_update(feedbacks, ['path', 'depth', 'reply_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0005_tour_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedback',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=1024, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество ответов'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['tour', 'depth', '-id'], name='feedback_thread_idx'),
+        ),
+        migrations.RunPython(fill_feedback_paths, migrations.RunPython.noop),
+    ]
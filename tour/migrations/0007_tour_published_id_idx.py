@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0006_feedback_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['is_published', '-id'], name='tour_published_id_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1 on 2026-10-18 17:25
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0007_tour_published_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TourInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('capacity', models.PositiveIntegerField(verbose_name='Вместимость')),
+                ('reserved', models.PositiveIntegerField(default=0, verbose_name='Занято мест')),
+                ('date', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventories', to='tour.datetour')),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventories', to='tour.tour')),
+            ],
+            options={
+                'verbose_name': 'Остаток мест',
+                'verbose_name_plural': 'Остатки мест',
+            },
+        ),
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seats', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Количество мест')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'Удерживается'), (2, 'Подтверждено'), (3, 'Освобождено'), (4, 'Истекло')], default=1, verbose_name='Статус')),
+                ('expires_at', models.DateTimeField(verbose_name='Удерживается до')),
+                ('created_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='seat_hold', to='tour.booking')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to=settings.AUTH_USER_MODEL)),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='tour.tourinventory')),
+            ],
+            options={
+                'verbose_name': 'Бронь мест',
+                'verbose_name_plural': 'Брони мест',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tourinventory',
+            constraint=models.CheckConstraint(condition=models.Q(('reserved__lte', models.F('capacity'))), name='inventory_not_oversold'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tourinventory',
+            unique_together={('tour', 'date')},
+        ),
+        migrations.AddIndex(
+            model_name='seathold',
+            index=models.Index(fields=['status', 'expires_at'], name='seathold_expiry_idx'),
+        ),
+    ]
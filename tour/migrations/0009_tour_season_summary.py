@@ -0,0 +1,58 @@
+# Generated by Django 5.1 on 2026-10-18 17:28
+
+from django.db import migrations, models
+from django.utils import timezone
+
+SEASON_BITS = {'spring': 1, 'summer': 2, 'autumn': 4, 'winter': 8}
+
+
+def fill_season_summary(apps, schema_editor):
+    Tour = apps.get_model('tour', 'Tour')
+    alias = schema_editor.connection.alias
+    today = timezone.localdate()
+
+    summary = {}
+    rows = Tour.date_tour.through.objects.using(alias).values_list('tour_id', 'datetour__season', 'datetour__start_date')
+    for tour_id, season, start_date in rows:
+        mask, next_start, last_start = summary.get(tour_id, (0, None, None))
+        mask |= SEASON_BITS.get(season, 0)
+        if start_date >= today:
+            next_start = start_date if next_start is None else min(next_start, start_date)
+            last_start = start_date if last_start is None else max(last_start, start_date)
+        summary[tour_id] = (mask, next_start, last_start)
+
+    tours = [
+        Tour(pk=tour_id, season_mask=mask, next_start_date=next_start, last_start_date=last_start)
+        for tour_id, (mask, next_start, last_start) in summary.items()
+    ]
+    Tour.objects.using(alias).bulk_update(tours, ['season_mask', 'next_start_date', 'last_start_date'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0008_seat_inventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='last_start_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Последняя дата начала'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='next_start_date',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='Ближайшая дата начала'),
+        ),
+        migrations.AddField(
+            model_name='tour',
+            name='season_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Сезоны'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['is_published', 'season_mask'], name='tour_published_season_idx'),
+        ),
+        migrations.RunPython(fill_season_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def build_statistics(apps, schema_editor):
+    from tour.statistics import rebuild_statistics
+
+    rebuild_statistics(using=schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0010_banner_region_updated_date'),
+        ('user', '0003_myuser_groups_myuser_user_permissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='created_date',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата создания'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='BookingStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('day', 'День'), ('tour', 'Тур'), ('region', 'Регион')], max_length=10, verbose_name='Измерение')),
+                ('key', models.PositiveIntegerField(default=0, verbose_name='ID объекта')),
+                ('day', models.DateField(verbose_name='День')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'В ожидании'), (2, 'Подтверждено'), (3, 'Отклонено')], verbose_name='Статус бронирования')),
+                ('bookings', models.IntegerField(default=0, verbose_name='Бронирований')),
+                ('participants', models.IntegerField(default=0, verbose_name='Участников')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+            ],
+            options={
+                'verbose_name': 'Статистика бронирований',
+                'verbose_name_plural': 'Статистика бронирований',
+                'unique_together': {('dimension', 'key', 'day', 'status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StatTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Счётчик')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Количество')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='Сумма')),
+            ],
+            options={
+                'verbose_name': 'Итоговый счётчик',
+                'verbose_name_plural': 'Итоговые счётчики',
+            },
+        ),
+        migrations.RunPython(build_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-18 18:04
+
+from django.db import migrations, models
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+
+def fill_effective_price(apps, schema_editor):
+    Tour = apps.get_model('tour', 'Tour')
+    now = timezone.now()
+    Tour.objects.using(schema_editor.connection.alias).update(effective_price=Case(
+        When(
+            Q(discount_price__isnull=False)
+            & (Q(discount_start_date__isnull=True) | Q(discount_start_date__lte=now))
+            & (Q(discount_end_date__isnull=True) | Q(discount_end_date__gt=now)),
+            then=F('discount_price'),
+        ),
+        default=F('price'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0011_booking_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Действующая цена'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['is_published', 'effective_price'], name='tour_published_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['discount_start_date'], name='tour_discount_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['discount_end_date'], name='tour_discount_end_idx'),
+        ),
+        migrations.RunPython(fill_effective_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 19:02
+
+from django.db import migrations
+
+
+def copy_favorite_tours(apps, schema_editor):
+    # Избранное из MyUser.favorite_tours переносится в FavoriteList, который становится
+    # through-моделью этого поля (user/migrations/0004_favorite_tours_through.py)
+    MyUser = apps.get_model('user', 'MyUser')
+    FavoriteList = apps.get_model('tour', 'FavoriteList')
+    alias = schema_editor.connection.alias
+    rows = MyUser.favorite_tours.through.objects.using(alias).values_list('myuser_id', 'tour_id')
+    FavoriteList.objects.using(alias).bulk_create(
+        [FavoriteList(user_id=user_id, tour_id=tour_id) for user_id, tour_id in rows],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0012_tour_effective_price'),
+        ('user', '0003_myuser_groups_myuser_user_permissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_favorite_tours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0013_copy_user_favorite_tours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarTour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tour.tour')),
+                ('tour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_tours', to='tour.tour')),
+            ],
+            options={
+                'unique_together': {('tour', 'rank')},
+            },
+        ),
+    ]
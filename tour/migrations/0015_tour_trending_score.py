@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 18:21
+
+from django.db import migrations, models
+
+
+def fill_trending_scores(apps, schema_editor):
+    from tour.trending import rebuild_trending_scores
+
+    rebuild_trending_scores(using=schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0014_similar_tours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tour',
+            name='trending_score',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='tour',
+            index=models.Index(fields=['is_published', '-trending_score'], name='tour_published_trending_idx'),
+        ),
+        migrations.RunPython(fill_trending_scores, migrations.RunPython.noop),
+    ]
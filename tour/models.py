@@ -1,16 +1,28 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from django.utils.text import slugify
 from rest_framework.exceptions import ValidationError
 
 User = get_user_model()
 
 
+class LoadedValuesMixin:
+    """Запоминает значения полей, загруженные из БД, чтобы сигналы могли сравнить их с новыми."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
 class Banner(models.Model):
     title = models.CharField('Название', max_length=100)
     banner_image = models.ImageField('Изображение', upload_to='banners/')
     is_asset = models.BooleanField('Активность', default=True)
+    updated_date = models.DateTimeField('Дата обновления', auto_now=True)
 
     def __str__(self):
         return self.title
@@ -39,6 +51,7 @@ class RegionTour(models.Model):
     description = models.TextField('Описание региона')
     image = models.ImageField(upload_to='images/', blank=True, null=True)  # Убедитесь, что это поле существует
     slug = models.SlugField(unique=True, blank=True, null=True, max_length=100)
+    updated_date = models.DateTimeField('Дата обновления', auto_now=True)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -49,7 +62,7 @@ class RegionTour(models.Model):
         return self.title
 
 
-class DateTour(models.Model):
+class DateTour(LoadedValuesMixin, models.Model):
     start_date = models.DateField('Дата начала тура')
     end_date = models.DateField('Дата окончания тура')
 
@@ -66,6 +79,7 @@ class DateTour(models.Model):
         ('winter', 'Зима'),
     ]
     season = models.CharField('Сезон', max_length=100, choices=SEASON_CHOICES)
+    SEASON_BITS = {'spring': 1, 'summer': 2, 'autumn': 4, 'winter': 8}
 
     def clean(self):
         if self.end_date < self.start_date:
@@ -75,7 +89,7 @@ class DateTour(models.Model):
         return f"{self.start_date} - {self.end_date} ({self.get_season_display()})"
 
 
-class Tour(models.Model):
+class Tour(LoadedValuesMixin, models.Model):
     author = models.CharField('Автор', max_length=100)
     title = models.CharField('Название', max_length=100)
     description = models.TextField('Описание тура', max_length=500)
@@ -96,6 +110,69 @@ class Tour(models.Model):
     is_published = models.BooleanField('Опубликован', default=False)
     is_admin = models.BooleanField('Админская', default=False)
 
+    # Денормализованные агрегаты рейтинга, поддерживаются сигналами Rating (см. tour/signals.py)
+    rating_count = models.PositiveIntegerField('Количество оценок', default=0)
+    rating_sum = models.PositiveIntegerField('Сумма оценок', default=0)
+    average_rating = models.FloatField('Средний рейтинг', blank=True, null=True, db_index=True)
+
+    # Сводка по датам тура (см. tour/seasons.py): битовая маска сезонов DateTour.SEASON_BITS
+    # и ближайшая/последняя предстоящая дата начала. Обновляется сигналами date_tour и DateTour.
+    season_mask = models.PositiveSmallIntegerField('Сезоны', default=0, editable=False)
+    next_start_date = models.DateField('Ближайшая дата начала', blank=True, null=True, editable=False, db_index=True)
+    last_start_date = models.DateField('Последняя дата начала', blank=True, null=True, editable=False)
+
+    # Действующая цена с учётом окна скидки (см. tour/pricing.py). Пересчитывается при сохранении,
+    # а на границах окон скидки — командой refresh_effective_prices.
+    effective_price = models.DecimalField('Действующая цена', max_digits=10, decimal_places=2, default=0,
+                                          editable=False)
+
+    # log2 суммы событий с затуханием, приведённой к эпохе (см. tour/trending.py). Обновляется сигналами.
+    trending_score = models.FloatField('Популярность', blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_published', '-average_rating'], name='tour_published_rating_idx'),
+            models.Index(fields=['is_published', '-id'], name='tour_published_id_idx'),
+            models.Index(fields=['is_published', 'season_mask'], name='tour_published_season_idx'),
+            models.Index(fields=['is_published', 'effective_price'], name='tour_published_price_idx'),
+            models.Index(fields=['discount_start_date'], name='tour_discount_start_idx'),
+            models.Index(fields=['discount_end_date'], name='tour_discount_end_idx'),
+            models.Index(fields=['is_published', '-trending_score'], name='tour_published_trending_idx'),
+        ]
+
+    # Агрегаты, которые поддерживаются сигналами и не пишутся при полном сохранении тура
+    DERIVED_FIELDS = (
+        'rating_count', 'rating_sum', 'average_rating', 'season_mask', 'next_start_date', 'last_start_date',
+        'trending_score',
+    )
+
+    # Поля, от которых зависит effective_price
+    PRICE_FIELDS = ('price', 'discount_price', 'discount_start_date', 'discount_end_date')
+
+    def get_effective_price(self, now=None):
+        """Цена со скидкой, если момент now попадает в [discount_start_date, discount_end_date), иначе price."""
+        if self.discount_price is None:
+            return self.price
+        now = now or timezone.now()
+        if self.discount_start_date is not None and now < self.discount_start_date:
+            return self.price
+        if self.discount_end_date is not None and now >= self.discount_end_date:
+            return self.price
+        return self.discount_price
+
+    def save(self, *args, **kwargs):
+        self.effective_price = self.get_effective_price()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(self.PRICE_FIELDS):
+            kwargs['update_fields'] = {*update_fields, 'effective_price'}
+        elif update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # Эти поля меняются UPDATE-ами в обход объекта, полное сохранение не должно их затирать
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
@@ -107,7 +184,7 @@ class TourImage(models.Model):
         return f"Image {self.id}"
 
 
-class Booking(models.Model):
+class Booking(LoadedValuesMixin, models.Model):
     tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='bookings')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_bookings')
     date = models.ForeignKey(DateTour, on_delete=models.CASCADE, related_name='bookings')
@@ -120,12 +197,119 @@ class Booking(models.Model):
         (3, 'Отклонено'),
     ]
     status = models.PositiveSmallIntegerField('Статус бронирования', choices=STATUS_CHOICES)
+    created_date = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        # Бронирование и занятие мест в TourInventory фиксируются вместе
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Booking {self.id} for {self.tour.title or 'Untitled Tour'}"
 
 
-class Rating(models.Model):
+class BookingStat(models.Model):
+    """Сводка бронирований за день в разрезе измерения. Поддерживается сигналами (см. tour/statistics.py).
+
+    key — ID тура или региона; для измерения DAY всегда 0.
+    """
+    DAY = 'day'
+    TOUR = 'tour'
+    REGION = 'region'
+    DIMENSION_CHOICES = [
+        (DAY, 'День'),
+        (TOUR, 'Тур'),
+        (REGION, 'Регион'),
+    ]
+
+    dimension = models.CharField('Измерение', max_length=10, choices=DIMENSION_CHOICES)
+    key = models.PositiveIntegerField('ID объекта', default=0)
+    day = models.DateField('День')
+    status = models.PositiveSmallIntegerField('Статус бронирования', choices=Booking.STATUS_CHOICES)
+    bookings = models.IntegerField('Бронирований', default=0)
+    participants = models.IntegerField('Участников', default=0)
+    revenue = models.DecimalField('Выручка', max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('dimension', 'key', 'day', 'status')
+        verbose_name = 'Статистика бронирований'
+        verbose_name_plural = 'Статистика бронирований'
+
+    def __str__(self):
+        return f"{self.dimension}:{self.key} {self.day} ({self.status}): {self.bookings}"
+
+
+class StatTotal(models.Model):
+    """Итоговый счётчик (пользователи, туры, бронирования по статусам). Читается за O(1)."""
+    name = models.CharField('Счётчик', max_length=50, unique=True)
+    count = models.BigIntegerField('Количество', default=0)
+    amount = models.DecimalField('Сумма', max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Итоговый счётчик'
+        verbose_name_plural = 'Итоговые счётчики'
+
+    def __str__(self):
+        return f"{self.name}: {self.count}"
+
+
+class TourInventory(models.Model):
+    """Остаток мест на конкретную дату тура. Меняется только условными UPDATE (см. tour/inventory.py)."""
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='inventories')
+    date = models.ForeignKey(DateTour, on_delete=models.CASCADE, related_name='inventories')
+    capacity = models.PositiveIntegerField('Вместимость')
+    reserved = models.PositiveIntegerField('Занято мест', default=0)
+
+    class Meta:
+        unique_together = ('tour', 'date')
+        constraints = [
+            models.CheckConstraint(condition=models.Q(reserved__lte=models.F('capacity')), name='inventory_not_oversold'),
+        ]
+        verbose_name = 'Остаток мест'
+        verbose_name_plural = 'Остатки мест'
+
+    @property
+    def available(self):
+        return max(self.capacity - self.reserved, 0)
+
+    def __str__(self):
+        return f"{self.tour_id} / {self.date_id}: {self.reserved}/{self.capacity}"
+
+
+class SeatHold(models.Model):
+    HELD = 1
+    CONFIRMED = 2
+    RELEASED = 3
+    EXPIRED = 4
+    STATUS_CHOICES = [
+        (HELD, 'Удерживается'),
+        (CONFIRMED, 'Подтверждено'),
+        (RELEASED, 'Освобождено'),
+        (EXPIRED, 'Истекло'),
+    ]
+    # Статусы, в которых места учтены в TourInventory.reserved
+    ACTIVE_STATUSES = (HELD, CONFIRMED)
+
+    inventory = models.ForeignKey(TourInventory, on_delete=models.CASCADE, related_name='holds')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seat_holds')
+    seats = models.PositiveIntegerField('Количество мест', validators=[MinValueValidator(1)])
+    status = models.PositiveSmallIntegerField('Статус', choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField('Удерживается до')
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='seat_hold', blank=True, null=True)
+    created_date = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='seathold_expiry_idx'),
+        ]
+        verbose_name = 'Бронь мест'
+        verbose_name_plural = 'Брони мест'
+
+    def __str__(self):
+        return f"Hold {self.id}: {self.seats} seats ({self.get_status_display()})"
+
+
+class Rating(LoadedValuesMixin, models.Model):
     tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='ratings')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ratings')
     score = models.PositiveSmallIntegerField('Оценка', validators=[MinValueValidator(1), MaxValueValidator(5)])
@@ -137,24 +321,61 @@ class Rating(models.Model):
             models.Index(fields=['tour', 'user']),
         ]
 
+    def save(self, *args, **kwargs):
+        # Сохранение оценки и пересчёт агрегатов тура выполняются в одной транзакции
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Rating {self.id} for {self.tour.title}"
 
 
-class Feedback(models.Model):
+class Feedback(LoadedValuesMixin, models.Model):
+    PATH_SEGMENT_WIDTH = 10
+
     tour = models.ForeignKey(Tour, on_delete=models.CASCADE)
     email = models.EmailField(blank=True, null=True)
     user_name = models.CharField(max_length=100, blank=True, null=True)
     comment = models.TextField()
     parent = models.ForeignKey('self', on_delete=models.PROTECT, related_name='children', blank=True, null=True)
+    # Материализованный путь: ID предков и самого отзыва, например "0000000007/0000000042/".
+    # Поддерживается сигналами (см. tour/signals.py), позволяет загрузить ветку одним запросом.
+    path = models.CharField('Путь в ветке', max_length=1024, blank=True, default='', editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField('Глубина', default=0, editable=False)
+    reply_count = models.PositiveIntegerField('Количество ответов', default=0, editable=False)
+
+    # Наибольшая глубина, при которой путь помещается в path (92 при сегменте из 11 символов)
+    MAX_DEPTH = 1024 // (PATH_SEGMENT_WIDTH + 1) - 1
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tour', 'depth', '-id'], name='feedback_thread_idx'),
+        ]
+
+    @classmethod
+    def path_segment(cls, pk):
+        return f'{pk:0{cls.PATH_SEGMENT_WIDTH}d}/'
+
+    @property
+    def ancestor_ids(self):
+        return [int(segment) for segment in self.path.split('/') if segment][:-1]
+
+    # Поля ветки поддерживаются UPDATE-ами в place_in_thread и сигналах; сохранение объекта их не перезаписывает
+    THREAD_FIELDS = ('path', 'depth', 'reply_count')
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None and not self._state.adding and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.THREAD_FIELDS
+            ]
+        # Путь и счётчики ответов обновляются в той же транзакции, что и сам отзыв
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
-        full_path = [self.comment]
-        k = self.parent
-        while k is not None:
-            full_path.append(k.comment)
-            k = k.parent
-        return ' -> '.join(full_path[::-1])
+        ancestors = Feedback.objects.filter(pk__in=self.ancestor_ids).order_by('depth').values_list('comment', flat=True)
+        return ' -> '.join([*ancestors, self.comment])
 
 
 class FavoriteList(models.Model):
@@ -164,3 +385,15 @@ class FavoriteList(models.Model):
 
     class Meta:
         unique_together = ('tour', 'user')
+
+
+class SimilarTour(models.Model):
+    """Похожий тур и его место в списке соседей. Таблицу заполняет build_similar_tours (см. tour/similarity.py)."""
+    tour = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='similar_tours')
+    similar = models.ForeignKey(Tour, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField('Место')
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        # Индекс (tour, rank) отдаёт список соседей тура одним упорядоченным чтением
+        unique_together = ('tour', 'rank')
@@ -0,0 +1,192 @@
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+
+from .pricing import parse_price_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация: следующая страница читается по индексу от последнего ключа, без OFFSET.
+
+    Логика CursorPagination.paginate_queryset разделена на подготовку запроса и разбор
+    результата, чтобы асинхронные представления (tour/async_views.py) читали страницу
+    через async ORM и получали те же курсоры, что и синхронные.
+
+    CursorPagination хранит в курсоре только первое поле сортировки и пропускает строки
+    с тем же значением через OFFSET. Здесь позиция — значения всех полей сортировки через «|»;
+    последнее поле уникально (id), поэтому при одинаковых ценах и рейтингах следующая страница
+    читается по составному индексу без OFFSET.
+    """
+    POSITION_SEPARATOR = '|'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._build_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._build_page([obj async for obj in queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def _page_queryset(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+        self._cursor_state = (offset, reverse, current_position)
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self._position_filter(current_position, self.cursor.reverse))
+
+        # Лишняя строка показывает, есть ли следующая страница
+        return queryset[offset:offset + self.page_size + 1]
+
+    def _position_filter(self, position, reverse):
+        """Строки после позиции: (a, b) > (x, y) ⇔ a ≥ x И (a > x ИЛИ a = x И b > y).
+
+        Условие a ≥ x задаёт диапазон по первому полю составного индекса.
+        """
+        values = position.split(self.POSITION_SEPARATOR)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        lookups = []
+        for order, value in zip(self.ordering, values):
+            lookup = 'lt' if reverse != order.startswith('-') else 'gt'
+            lookups.append((order.lstrip('-'), lookup, value))
+
+        condition = None
+        for attr, lookup, value in reversed(lookups):
+            step = Q(**{f'{attr}__{lookup}': value})
+            if condition is not None:
+                step |= Q(**{attr: value}) & condition
+            condition = step
+        if len(lookups) > 1:
+            attr, lookup, value = lookups[0]
+            condition = Q(**{f'{attr}__{lookup}e': value}) & condition
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field_name = order.lstrip('-')
+            values.append(str(instance[field_name] if isinstance(instance, dict) else getattr(instance, field_name)))
+        return self.POSITION_SEPARATOR.join(values)
+
+    def _build_page(self, results):
+        offset, reverse, current_position = self._cursor_state
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class TourCursorPagination(KeysetPagination):
+    # Индекс tour_published_id_idx покрывает фильтр is_published и сортировку
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        # ?ordering=price / -price идёт по индексу tour_published_price_idx, курсор — (effective_price, id)
+        return parse_price_ordering(request.query_params) or super().get_ordering(request, queryset, view)
+
+
+class RegionLandingPagination(KeysetPagination):
+    # rating_rank — рейтинг без NULL (см. tour/regions.py region_tours); курсор хранит и id,
+    # поэтому туры без оценок с одинаковым rating_rank = 0 листаются без OFFSET
+    ordering = ('-rating_rank', '-id')
+
+
+class BannerCursorPagination(KeysetPagination):
+    ordering = 'id'
+
+
+class RegionCursorPagination(KeysetPagination):
+    ordering = 'id'
+
+
+class FeedbackThreadPagination(KeysetPagination):
+    """Корневые отзывы: новые ветки первыми (индекс feedback_thread_idx)."""
+    ordering = '-id'
+
+
+class SearchCursorPagination(KeysetPagination):
+    """Пагинация результатов полнотекстового поиска по ключу (rank, id) последнего результата.
+
+    Поиск возвращает совпадения, уже упорядоченные по релевантности, поэтому курсор
+    хранит ранг и ID последней строки и передаётся в поисковый бэкенд как after.
+    Ссылка на предыдущую страницу не поддерживается.
+    """
+    ordering = None
+
+    def paginate_hits(self, search, request, view=None):
+        """search(limit, after) -> список SearchHit; возвращает совпадения текущей страницы."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        after = self._decode_position(self.cursor.position) if self.cursor else None
+        hits = search(limit=self.page_size + 1, after=after)
+        self.has_next = len(hits) > self.page_size
+        self.page = hits[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = f'{last.rank!r}|{last.tour_id}'
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        return None
+
+    def _decode_position(self, position):
+        try:
+            rank, tour_id = position.split('|')
+            return (None if rank == 'None' else float(rank)), int(tour_id)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
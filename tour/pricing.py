@@ -0,0 +1,153 @@
+"""Действующая цена тура (Tour.effective_price) с учётом окна скидки.
+
+Скидка действует, если задана discount_price и момент попадает в
+[discount_start_date, discount_end_date); пустая граница окно не ограничивает.
+Цена хранится в самом туре под индексом tour_published_price_idx, поэтому фильтры
+?price_min= / ?price_max= и сортировка ?ordering=price не вычисляют CASE по всей таблице.
+
+Для одиночного тура цену пересчитывает Tour.save, а со временем она меняется только на
+границах окон скидки. Их обрабатывает PriceScheduler (manage.py refresh_effective_prices):
+туры, у которых граница попала в прошедший интервал, выбираются по индексам дат скидки
+и обновляются пачками одним UPDATE, после чего планировщик спит ровно до следующей границы.
+"""
+import time
+
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_version_on_commit
+from .models import Tour
+from .regions import invalidate_all_regions
+from .response_cache import model_namespace
+
+# ?ordering= для списков туров; id делает порядок однозначным для курсора
+PRICE_ORDERINGS = {
+    'price': ('effective_price', 'id'),
+    '-price': ('-effective_price', '-id'),
+}
+DEFAULT_BATCH_SIZE = 500
+
+
+def parse_price_ordering(params, name='ordering'):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    if value not in PRICE_ORDERINGS:
+        raise ValidationError({name: f'Допустимые значения: {", ".join(PRICE_ORDERINGS)}.'})
+    return PRICE_ORDERINGS[value]
+
+
+def effective_price_expression(now):
+    """Та же логика, что в Tour.get_effective_price, для UPDATE и сравнения в БД."""
+    return Case(
+        When(
+            Q(discount_price__isnull=False)
+            & (Q(discount_start_date__isnull=True) | Q(discount_start_date__lte=now))
+            & (Q(discount_end_date__isnull=True) | Q(discount_end_date__gt=now)),
+            then=F('discount_price'),
+        ),
+        default=F('price'),
+    )
+
+
+def refresh_effective_prices(tour_ids, now=None, using=None):
+    """Пересчитывает цену указанных туров одним UPDATE; возвращает количество изменившихся."""
+    if not tour_ids:
+        return 0
+    now = now or timezone.now()
+    expression = effective_price_expression(now)
+    updated = (
+        Tour.objects.using(using).filter(pk__in=tour_ids).exclude(effective_price=expression)
+        # updated_date меняется вместе с ценой, чтобы ETag детальной страницы стал другим
+        .update(effective_price=expression, updated_date=now)
+    )
+    if updated:
+        # UPDATE не отправляет сигналы, а от цены зависят фильтры и сортировка списков
+        bump_version_on_commit(model_namespace(Tour), using=using)
+        invalidate_all_regions(using=using)
+    return updated
+
+
+def boundary_filter(since, now):
+    """Туры, у которых начало или конец скидки попали в интервал (since, now]."""
+    return (
+        Q(discount_start_date__gt=since, discount_start_date__lte=now)
+        | Q(discount_end_date__gt=since, discount_end_date__lte=now)
+    )
+
+
+def stale_tours(since=None, now=None, using=None):
+    """QuerySet туров, чья цена могла устареть. Без since проверяются все туры с окном скидки."""
+    queryset = Tour.objects.using(using)
+    if since is None:
+        return queryset.filter(Q(discount_start_date__isnull=False) | Q(discount_end_date__isnull=False))
+    return queryset.filter(boundary_filter(since, now))
+
+
+def next_boundary(now, using=None):
+    """Ближайшая будущая граница окна скидки или None. Два запроса по индексам дат скидки."""
+    candidates = []
+    for field in ('discount_start_date', 'discount_end_date'):
+        value = (
+            Tour.objects.using(using).filter(**{f'{field}__gt': now}).order_by(field)
+            .values_list(field, flat=True).first()
+        )
+        if value is not None:
+            candidates.append(value)
+    return min(candidates, default=None)
+
+
+def refresh_stale_prices(since=None, now=None, batch_size=DEFAULT_BATCH_SIZE, using=None):
+    """Пересчитывает цены устаревших туров пачками по первичному ключу; возвращает количество изменившихся."""
+    now = now or timezone.now()
+    queryset = stale_tours(since, now, using).order_by('pk')
+    total = 0
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        total += refresh_effective_prices(ids, now=now, using=using)
+        last_pk = ids[-1]
+    return total
+
+
+class PriceScheduler:
+    """Пересчитывает цены на границах окон скидки.
+
+    Первый проход сверяет все туры с окном скидки, дальше каждый проход обрабатывает только
+    границы из интервала (предыдущий проход, сейчас]. Ожидание ограничено max_sleep: границы
+    туров, созданных или изменённых во время сна, планировщик узнаёт не позже чем через max_sleep
+    (сама цена при сохранении тура уже рассчитана верно).
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, max_sleep=60, using=None, clock=None, sleep=None):
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.using = using
+        self.clock = clock or timezone.now
+        self.sleep = sleep or time.sleep
+        self.checked = None
+
+    def run_once(self):
+        now = self.clock()
+        updated = refresh_stale_prices(self.checked, now, batch_size=self.batch_size, using=self.using)
+        self.checked = now
+        return updated
+
+    def seconds_until_next(self):
+        boundary = next_boundary(self.checked, using=self.using)
+        if boundary is None:
+            return self.max_sleep
+        return max(0.0, min((boundary - self.clock()).total_seconds(), self.max_sleep))
+
+    def run(self, iterations=None, callback=None):
+        iteration = 0
+        while iterations is None or iteration < iterations:
+            updated = self.run_once()
+            if callback is not None:
+                callback(self.checked, updated)
+            iteration += 1
+            if iterations is None or iteration < iterations:
+                self.sleep(self.seconds_until_next())
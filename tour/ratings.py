@@ -0,0 +1,42 @@
+from django.db.models import Avg, Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Now
+
+from .models import Tour, Rating
+
+
+def apply_rating_delta(tour_id, count_delta, sum_delta, using=None):
+    """Атомарно сдвигает агрегаты рейтинга тура одним UPDATE без чтения строки.
+
+    updated_date тоже сдвигается: средний рейтинг входит в представление тура (см. tour/conditional.py).
+    """
+    if not count_delta and not sum_delta:
+        return
+    new_count = F('rating_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    Tour.objects.using(using).filter(pk=tour_id).update(
+        rating_count=new_count,
+        rating_sum=new_sum,
+        updated_date=Now(),
+        average_rating=Case(
+            When(rating_count=-count_delta, then=Value(None)),
+            default=Cast(new_sum, FloatField()) / Cast(new_count, FloatField()),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def rebuild_rating_stats(queryset=None):
+    """Пересчитывает агрегаты рейтинга по таблице Rating. Возвращает количество обновлённых туров."""
+    if queryset is None:
+        queryset = Tour.objects.all()
+    ratings = Rating.objects.filter(tour=OuterRef('pk')).order_by().values('tour')
+    return queryset.update(
+        rating_count=Coalesce(
+            Subquery(ratings.annotate(value=Count('pk')).values('value'), output_field=IntegerField()), 0
+        ),
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(value=Sum('score')).values('value'), output_field=IntegerField()), 0
+        ),
+        average_rating=Subquery(ratings.annotate(value=Avg('score')).values('value'), output_field=FloatField()),
+        updated_date=Now(),
+    )
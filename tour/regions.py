@@ -0,0 +1,51 @@
+"""Версии кэша страниц регионов (RegionLandingView).
+
+У каждого региона своё пространство имён по slug: изменение тура, его оценок, дат, фотографий
+или связей с регионами сдвигает версию только тех регионов, в которые тур входит. Массовые
+операции без сигналов (импорт, пересчёт цен, синтетические данные) сдвигают общую версию
+REGION_TOURS_NAMESPACE, которая тоже входит в ключ.
+"""
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+
+from .cache import bump_version_on_commit
+from .models import Tour
+
+REGION_TOURS_NAMESPACE = 'region-tours'
+
+
+def region_namespace(slug):
+    return f'{REGION_TOURS_NAMESPACE}:{slug}'
+
+
+def region_slugs(tour_ids, using=None):
+    """Slug регионов, в которые входят туры, одним запросом к through-таблице."""
+    links = Tour.region.through.objects.using(using).filter(tour_id__in=tour_ids, regiontour__slug__isnull=False)
+    return set(links.values_list('regiontour__slug', flat=True))
+
+
+def invalidate_regions(slugs, using=None):
+    for slug in slugs:
+        if slug:
+            bump_version_on_commit(region_namespace(slug), using=using)
+
+
+def invalidate_tour_regions(tour_ids, using=None):
+    invalidate_regions(region_slugs(tour_ids, using), using=using)
+
+
+def invalidate_all_regions(using=None):
+    bump_version_on_commit(REGION_TOURS_NAMESPACE, using=using)
+
+
+def region_tours(region, using=None):
+    """Опубликованные туры региона для RegionLandingPagination.
+
+    average_rating у туров без оценок пустой, а курсору нужно значение, поэтому сортировка
+    идёт по rating_rank, где отсутствующий рейтинг равен нулю.
+    """
+    return (
+        Tour.objects.using(using).filter(is_published=True, region=region)
+        .annotate(rating_rank=Coalesce('average_rating', Value(0.0)))
+        .prefetch_related('images', 'date_tour')
+    )
@@ -0,0 +1,110 @@
+"""Кэш готовых JSON-ответов публичных списков каталога.
+
+Ключ ответа содержит версии моделей, от которых зависит представление (tour/cache.py).
+Сигналы сдвигают версию при любом изменении модели, поэтому при общем кэше (CACHE_URL) записи
+не устаревают и не нуждаются в TTL: старые ключи просто перестают запрашиваться и вытесняются.
+Кэш в памяти процесса не видит версий, сдвинутых другими процессами, поэтому там записи живут
+RESPONSE_CACHE_TIMEOUT секунд (см. core/caches.py).
+
+Промах кэша читает основную базу, даже если представление разрешено читать из реплики
+(core/routers.py): иначе отстающая реплика попала бы в кэш под уже сдвинутой версией.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from core.routers import read_from_primary
+
+from .cache import get_version
+
+STATS_KEY = 'response-cache:stats:{view}:{kind}'
+STATS_VIEWS_KEY = 'response-cache:views'
+
+
+def model_namespace(model):
+    return f'model:{model._meta.label_lower}'
+
+
+def _count(view_name, kind):
+    key = STATS_KEY.format(view=view_name, kind=kind)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_stats():
+    """Счётчики попаданий и промахов по представлениям: {'BannerIndexView': {'hits': 10, 'misses': 1}}."""
+    views = cache.get(STATS_VIEWS_KEY) or []
+    keys = {
+        STATS_KEY.format(view=view, kind=kind): (view, kind)
+        for view in views for kind in ('hits', 'misses')
+    }
+    values = cache.get_many(list(keys))
+    stats = {view: {'hits': 0, 'misses': 0} for view in views}
+    for key, value in values.items():
+        view, kind = keys[key]
+        stats[view][kind] = value
+    return stats
+
+
+def _register_view(view_name):
+    views = cache.get(STATS_VIEWS_KEY) or []
+    if view_name not in views:
+        cache.set(STATS_VIEWS_KEY, sorted([*views, view_name]), None)
+
+
+class CachedListMixin:
+    """Отдаёт GET-ответ списка из кэша, пока не изменилась ни одна модель из cache_models.
+
+    Кэшируются только JSON-ответы со статусом 200; ответ содержит заголовок X-Cache: HIT/MISS.
+    """
+    cache_models = ()
+
+    def get_cache_key_parts(self, request):
+        # Ссылки в ответе абсолютные, поэтому хост и схема входят в ключ
+        return [f'{request.scheme}://{request.get_host()}', *sorted(request.query_params.lists())]
+
+    def get_cache_namespaces(self, request):
+        return [model_namespace(model) for model in self.cache_models]
+
+    def get_response_cache_key(self, request):
+        versions = [get_version(namespace) for namespace in self.get_cache_namespaces(request)]
+        raw = repr([self.__class__.__name__, versions, self.get_cache_key_parts(request)])
+        return f'response:{self.__class__.__name__}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+    def get(self, request, *args, **kwargs):
+        self._response_cache_key = None
+        if request.accepted_renderer.format != 'json':
+            # Browsable API содержит данные пользователя и CSRF-токен
+            return super().get(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        view_name = self.__class__.__name__
+        if cached is not None:
+            _count(view_name, 'hits')
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count(view_name, 'misses')
+        _register_view(view_name)
+        self._response_cache_key = key
+        # Реплика может отставать от сдвинутой версии, а ответ живёт в кэше до следующего сдвига
+        with read_from_primary():
+            return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key and response.status_code == 200:
+            response.render()
+            cache.set(key, (response.content, response['Content-Type']),
+                      getattr(settings, 'RESPONSE_CACHE_TIMEOUT', None))
+            response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,294 @@
+import re
+from collections import namedtuple
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import Tour
+
+SEARCH_TABLE = 'tour_tour_fts'
+SNIPPET_START = '<b>'
+SNIPPET_END = '</b>'
+# Сниппет строится СУБД по неэкранированному тексту тура, поэтому совпадения сначала отмечаются
+# управляющими символами, а теги подставляются уже после экранирования (highlight)
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+SearchHit = namedtuple('SearchHit', ['tour_id', 'rank', 'snippet'])
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Окончания русских и кыргызских словоформ, которые отбрасываются у слов запроса.
+# Полноценного стеммера для кыргызского нет ни в SQLite, ни в PostgreSQL, поэтому
+# основа ищется по префиксу: «походы» -> «поход*», «тоолордо» -> «тоолор*».
+_SUFFIXES = sorted([
+    # русский
+    'иями', 'ями', 'ами', 'ией', 'иях', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ом', 'ем', 'ию', 'ия',
+    'а', 'я', 'ы', 'и', 'у', 'ю', 'е', 'о', 'ь',
+    # кыргызский
+    'лардын', 'лердин', 'лордун', 'лөрдүн', 'лар', 'лер', 'лор', 'лөр', 'дар', 'дер', 'дор', 'дөр',
+    'тар', 'тер', 'тор', 'төр', 'дын', 'дин', 'дун', 'дүн', 'нын', 'нин', 'нун', 'нүн', 'га', 'ге',
+    'го', 'гө', 'ка', 'ке', 'ко', 'кө', 'да', 'де', 'до', 'дө', 'та', 'те', 'то', 'тө', 'дан', 'ден',
+    'дон', 'дөн', 'тан', 'тен', 'тон', 'төн',
+], key=len, reverse=True)
+_MIN_STEM = 3
+
+
+def normalize_text(value):
+    """Приводит «ё» к «е»: unicode61 в SQLite снимает диакритику только у латиницы.
+
+    Управляющие символы-метки сниппета из текста удаляются.
+    """
+    value = (value or '').replace('ё', 'е').replace('Ё', 'Е')
+    return value.replace(_MARK_START, '').replace(_MARK_END, '')
+
+
+def highlight(snippet):
+    """HTML сниппета: текст экранирован, совпадения обёрнуты в SNIPPET_START / SNIPPET_END."""
+    if snippet is None:
+        return None
+    return escape(snippet).replace(_MARK_START, SNIPPET_START).replace(_MARK_END, SNIPPET_END)
+
+
+def stem(word):
+    word = normalize_text(word).lower()
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def query_terms(query):
+    return [stem(word) for word in _WORD_RE.findall(query or '')]
+
+
+class BaseSearchBackend:
+    def __init__(self, using):
+        self.using = using
+        self.connection = connections[using]
+
+    def search(self, query, limit, after=None, within=None):
+        """Возвращает до limit совпадений, упорядоченных по (rank, tour_id); after — ключ последней строки.
+
+        within — QuerySet туров, которыми ограничивается поиск (фильтры фасетов).
+        """
+        raise NotImplementedError
+
+    def filter(self, queryset, query):
+        """Ограничивает QuerySet туров совпадениями запроса без ранжирования (для подсчёта фасетов)."""
+        raise NotImplementedError
+
+    def _within_sql(self, within):
+        return within.using(self.using).order_by().values('pk').query.get_compiler(self.using).as_sql()
+
+    def index_tours(self, tours):
+        """Обновляет индекс для переданных туров. По умолчанию индекс поддерживается самой БД."""
+
+    def remove_tours(self, tour_ids):
+        pass
+
+    def rebuild(self, chunk_size=1000):
+        return 0
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    """FTS5: отдельная виртуальная таблица, синхронизируется сигналами Tour (см. tour/signals.py)."""
+
+    @staticmethod
+    def _match(query):
+        terms = query_terms(query)
+        return ' '.join(f'"{term}"*' for term in terms) if terms else None
+
+    def filter(self, queryset, query):
+        match = self._match(query)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match]))
+
+    def search(self, query, limit, after=None, within=None):
+        match = self._match(query)
+        if match is None:
+            return []
+        # rank нельзя сравнивать в WHERE самого FTS-запроса, поэтому ключ страницы проверяется во внешнем SELECT
+        condition = f'{SEARCH_TABLE} MATCH %s'
+        params = [match]
+        if within is not None:
+            within_sql, within_params = self._within_sql(within)
+            condition += f' AND rowid IN ({within_sql})'
+            params += within_params
+        sql = f'SELECT id, score FROM (SELECT rowid AS id, rank AS score FROM {SEARCH_TABLE} WHERE {condition})'
+        if after is not None:
+            sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score, id LIMIT %s'
+        params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ranked = cursor.fetchall()
+            if not ranked:
+                return []
+            # Сниппеты строятся только для строк текущей страницы
+            placeholders = ', '.join(['%s'] * len(ranked))
+            cursor.execute(
+                f'SELECT rowid, snippet({SEARCH_TABLE}, -1, %s, %s, %s, 16) FROM {SEARCH_TABLE} '
+                f'WHERE {SEARCH_TABLE} MATCH %s AND rowid IN ({placeholders})',
+                [_MARK_START, _MARK_END, '…', match, *[tour_id for tour_id, _ in ranked]],
+            )
+            snippets = {tour_id: highlight(snippet) for tour_id, snippet in cursor.fetchall()}
+        return [SearchHit(tour_id, rank, snippets.get(tour_id)) for tour_id, rank in ranked]
+
+    def index_tours(self, tours):
+        tours = list(tours)
+        if not tours:
+            return
+        self.remove_tours([tour.pk for tour in tours])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, route_tour, description) VALUES (%s, %s, %s, %s)',
+                [
+                    (tour.pk, normalize_text(tour.title), normalize_text(tour.route_tour),
+                     normalize_text(tour.description))
+                    for tour in tours
+                ],
+            )
+
+    def remove_tours(self, tour_ids):
+        tour_ids = list(tour_ids)
+        if not tour_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(tour_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', tour_ids)
+
+    def rebuild(self, chunk_size=1000):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        total = 0
+        queryset = Tour.objects.using(self.using).only('pk', 'title', 'route_tour', 'description').order_by('pk')
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            self.index_tours(chunk)
+            total += len(chunk)
+            last_pk = chunk[-1].pk
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        return total
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector: генерируемая колонка tour_tour.search_vector с GIN-индексом, обновляется самой БД."""
+
+    config = 'russian'
+
+    @staticmethod
+    def _tsquery(query):
+        terms = query_terms(query)
+        return ' & '.join(f"'{term}':*" for term in terms) if terms else None
+
+    def filter(self, queryset, query):
+        tsquery = self._tsquery(query)
+        if tsquery is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            'SELECT id FROM tour_tour WHERE search_vector @@ to_tsquery(%s::regconfig, %s)', [self.config, tsquery],
+        ))
+
+    def search(self, query, limit, after=None, within=None):
+        tsquery = self._tsquery(query)
+        if tsquery is None:
+            return []
+        condition = 'search_vector @@ query'
+        params = [self.config, tsquery]
+        if within is not None:
+            within_sql, within_params = self._within_sql(within)
+            condition += f' AND id IN ({within_sql})'
+            params += within_params
+        # Ранг берётся со знаком минус, чтобы порядок страниц совпадал с SQLite: чем меньше, тем релевантнее
+        sql = (
+            'SELECT id, score FROM ('
+            '  SELECT id, -ts_rank_cd(search_vector, query)::float8 AS score'
+            '  FROM tour_tour, to_tsquery(%s::regconfig, %s) AS query'
+            f'  WHERE {condition}'
+            ') AS hits'
+        )
+        if after is not None:
+            sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score, id LIMIT %s'
+        params.append(limit)
+        options = f'StartSel="{_MARK_START}", StopSel="{_MARK_END}", MaxWords=24, MinWords=8'
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ranked = cursor.fetchall()
+            if not ranked:
+                return []
+            placeholders = ', '.join(['%s'] * len(ranked))
+            cursor.execute(
+                f'SELECT id, ts_headline(%s::regconfig, description, to_tsquery(%s::regconfig, %s), %s) '
+                f'FROM tour_tour WHERE id IN ({placeholders})',
+                [self.config, self.config, tsquery, options, *[tour_id for tour_id, _ in ranked]],
+            )
+            snippets = {tour_id: highlight(snippet) for tour_id, snippet in cursor.fetchall()}
+        return [SearchHit(tour_id, rank, snippets.get(tour_id)) for tour_id, rank in ranked]
+
+    def rebuild(self, chunk_size=1000):
+        # Генерируемую колонку достаточно перестроить индексом
+        with self.connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX tour_tour_search_vector_idx')
+        return Tour.objects.using(self.using).count()
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Запасной вариант для СУБД без полнотекстового индекса: icontains по полям, без ранжирования."""
+
+    fields = ('title', 'description', 'route_tour')
+
+    def filter(self, queryset, query):
+        words = _WORD_RE.findall(query or '')
+        if not words:
+            return queryset.none()
+        for word in words:
+            condition = Q()
+            for field in self.fields:
+                condition |= Q(**{f'{field}__icontains': word})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def search(self, query, limit, after=None, within=None):
+        queryset = self.filter(Tour.objects.using(self.using), query)
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after[1])
+        if within is not None:
+            queryset = queryset.filter(pk__in=within.order_by().values('pk'))
+        ids = queryset.order_by('pk').values_list('pk', flat=True)[:limit]
+        return [SearchHit(pk, None, None) for pk in ids]
+
+
+_sqlite_fts_databases = {}
+
+
+def _sqlite_has_search_table(connection):
+    name = connection.settings_dict['NAME']
+    if not _sqlite_fts_databases.get(name):
+        _sqlite_fts_databases[name] = SEARCH_TABLE in connection.introspection.table_names()
+    return _sqlite_fts_databases[name]
+
+
+def get_search_backend(using=None):
+    using = using or router.db_for_read(Tour)
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend(using)
+    if connection.vendor == 'sqlite' and _sqlite_has_search_table(connection):
+        return SqliteSearchBackend(using)
+    return LikeSearchBackend(using)
+
+
+def search_tours(query, limit, after=None, using=None, within=None):
+    return get_search_backend(using).search(query, limit, after, within=within)
@@ -0,0 +1,54 @@
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_version_on_commit
+from .models import DateTour, Tour
+from .response_cache import model_namespace
+
+ALL_SEASONS_MASK = sum(DateTour.SEASON_BITS.values())
+
+
+def season_masks(season):
+    """Все значения season_mask, в которых есть сезон: фильтр season_mask IN (...) идёт по индексу."""
+    bit = DateTour.SEASON_BITS[season]
+    return [mask for mask in range(ALL_SEASONS_MASK + 1) if mask & bit]
+
+
+def season_filter(season):
+    return Q(season_mask__in=season_masks(season))
+
+
+def summarize_dates(dates, today=None):
+    """(season_mask, next_start_date, last_start_date) по парам (season, start_date) дат тура."""
+    today = today or timezone.localdate()
+    mask, next_start, last_start = 0, None, None
+    for season, start_date in dates:
+        mask |= DateTour.SEASON_BITS.get(season, 0)
+        if start_date >= today:
+            next_start = start_date if next_start is None else min(next_start, start_date)
+            last_start = start_date if last_start is None else max(last_start, start_date)
+    return mask, next_start, last_start
+
+
+def refresh_tour_dates(tour_ids, today=None, using=None):
+    """Пересчитывает season_mask, next_start_date и last_start_date для туров одним чтением through-таблицы."""
+    tour_ids = set(tour_ids)
+    if not tour_ids:
+        return 0
+    today = today or timezone.localdate()
+
+    dates = {tour_id: [] for tour_id in tour_ids}
+    rows = Tour.date_tour.through.objects.using(using).filter(tour_id__in=tour_ids).values_list(
+        'tour_id', 'datetour__season', 'datetour__start_date',
+    )
+    for tour_id, season, start_date in rows:
+        dates[tour_id].append((season, start_date))
+
+    tours = []
+    for tour_id, items in dates.items():
+        mask, next_start, last_start = summarize_dates(items, today)
+        tours.append(Tour(pk=tour_id, season_mask=mask, next_start_date=next_start, last_start_date=last_start))
+    Tour.objects.using(using).bulk_update(tours, ['season_mask', 'next_start_date', 'last_start_date'], batch_size=500)
+    # bulk_update не отправляет сигналы, а от этих полей зависят фильтры списков туров
+    bump_version_on_commit(model_namespace(Tour), using=using)
+    return len(tours)
@@ -1,30 +1,89 @@
-from django.db.models import Avg
 from rest_framework import serializers
-from .models import Banner, Tour, Feedback, Rating, RegionTour
+from .favorites import MAX_BATCH_SIZE
+from .feedback import attach_threads
+from .images import variant_urls
+from .models import Banner, Tour, TourImage, Feedback, Rating, RegionTour, DateTour, TourInventory, SeatHold, \
+    SimilarTour
+from .trending import current_score
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URL оригинала и готовых уменьшенных копий изображения (см. tour/images.py)."""
+
+    def to_representation(self, value):
+        return variant_urls(value, self.context.get('request'))
 
 
 class BannerSerializer(serializers.ModelSerializer):
+    srcset = ImageVariantsField(source='banner_image')
+
     class Meta:
         model = Banner
-        fields = ['title', 'banner_image']
+        fields = ['title', 'banner_image', 'srcset']
 
 
 class RegionTourSerializer(serializers.ModelSerializer):
+    srcset = ImageVariantsField(source='image')
+
     class Meta:
         model = RegionTour
-        fields = ['title', 'description', 'slug', 'image']
+        fields = ['title', 'description', 'slug', 'image', 'srcset']
+
+
+class TourImageSerializer(serializers.ModelSerializer):
+    srcset = ImageVariantsField(source='image')
+
+    class Meta:
+        model = TourImage
+        fields = ['id', 'image', 'srcset']
+
+
+class DateTourSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DateTour
+        fields = ['id', 'start_date', 'end_date', 'tour_type', 'season']
 
 
 class TourSerializer(serializers.ModelSerializer):
-    average_rating = serializers.SerializerMethodField()
-    date_tour = RegionTourSerializer(many=True)
+    # Средний рейтинг хранится в самом туре и не требует запросов к Rating
+    average_rating = serializers.FloatField(read_only=True)
+    date_tour = DateTourSerializer(many=True)
+    gallery = TourImageSerializer(source='images', many=True, read_only=True)
 
     class Meta:
         model = Tour
-        fields = ['title', 'description', 'images', 'price', 'average_rating', 'date_tour']
+        fields = ['title', 'description', 'images', 'gallery', 'price', 'effective_price', 'average_rating', 'date_tour']
+
+
+class TourSearchSerializer(TourSerializer):
+    snippet = serializers.CharField(source='search_snippet', read_only=True, default=None)
+
+    class Meta(TourSerializer.Meta):
+        fields = TourSerializer.Meta.fields + ['snippet']
+
+
+class TrendingTourSerializer(TourSerializer):
+    # Текущее значение с учётом затухания; в БД хранится log2 суммы, приведённой к эпохе
+    trending = serializers.SerializerMethodField()
 
-    def get_average_rating(self, obj):
-        return obj.ratings.aggregate(average=Avg('score'))['average'] or None
+    class Meta(TourSerializer.Meta):
+        fields = TourSerializer.Meta.fields + ['trending']
+
+    def get_trending(self, obj):
+        return round(current_score(obj.trending_score, self.context.get('now')), 4)
+
+
+class SimilarTourSerializer(serializers.ModelSerializer):
+    # Карточка соседа читается тем же запросом через select_related, без фото и дат
+    id = serializers.IntegerField(source='similar_id')
+    title = serializers.CharField(source='similar.title')
+    price = serializers.DecimalField(source='similar.price', max_digits=10, decimal_places=2)
+    effective_price = serializers.DecimalField(source='similar.effective_price', max_digits=10, decimal_places=2)
+    average_rating = serializers.FloatField(source='similar.average_rating')
+
+    class Meta:
+        model = SimilarTour
+        fields = ['id', 'title', 'price', 'effective_price', 'average_rating', 'score']
 
 
 class FeedbackSerializer(serializers.ModelSerializer):
@@ -32,15 +91,17 @@ class FeedbackSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Feedback
-        fields = ['user_name', 'comment', 'children']
+        fields = ['id', 'user_name', 'comment', 'reply_count', 'children']
 
     def get_children(self, obj):
-        # Используем "self" для рекурсивного вызова сериализатора
-        return FeedbackSerializer(obj.children.all(), many=True).data if obj.children.exists() else None
+        # Ветка собирается в памяти (tour.feedback.attach_threads), запрос нужен только если её не загрузили заранее
+        if not hasattr(obj, 'thread_children'):
+            attach_threads([obj])
+        return FeedbackSerializer(obj.thread_children, many=True, context=self.context).data or None
 
 
 class DetailSerializer(serializers.ModelSerializer):
-    rating = serializers.SerializerMethodField()  # Для вычисления среднего рейтинга
+    rating = serializers.SerializerMethodField()  # Средний рейтинг из денормализованного поля тура
 
     class Meta:
         model = Tour
@@ -54,7 +115,37 @@ class DetailSerializer(serializers.ModelSerializer):
                   'max_participants']
 
     def get_rating(self, obj):
-        # Получаем средний рейтинг из модели Rating, связанной с туром
-        average_rating = obj.ratings.aggregate(Avg('score'))['score__avg']
-        return average_rating if average_rating is not None else 0  # Возвращаем 0, если нет рейтингов
+        return obj.average_rating if obj.average_rating is not None else 0  # Возвращаем 0, если нет рейтингов
+
+
+class TourAvailabilitySerializer(serializers.ModelSerializer):
+    date = DateTourSerializer()
+    available = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = TourInventory
+        fields = ['date', 'capacity', 'reserved', 'available']
+
+
+class SeatHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SeatHold
+        fields = ['id', 'seats', 'status', 'expires_at', 'booking']
+        read_only_fields = fields
+
+
+class FavoriteChangeSerializer(serializers.Serializer):
+    add = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list,
+                                max_length=MAX_BATCH_SIZE)
+    remove = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list,
+                                   max_length=MAX_BATCH_SIZE)
+
+
+class SeatHoldCreateSerializer(serializers.Serializer):
+    date = serializers.PrimaryKeyRelatedField(queryset=DateTour.objects.all())
+    seats = serializers.IntegerField(min_value=1)
 
+    def validate_date(self, value):
+        if not self.context['tour'].date_tour.filter(pk=value.pk).exists():
+            raise serializers.ValidationError('Тур не проводится в выбранную дату.')
+        return value
@@ -0,0 +1,509 @@
+import threading
+
+from django.db import close_old_connections
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_version, bump_version_on_commit
+from .conditional import touch
+from .favorites import forget_favorites
+from .feedback import place_in_thread
+from .images import schedule_variants
+from .inventory import REJECTED_BOOKING, attach_booking, release_hold, return_seats
+from .leaderboard import LEADERBOARD_NAMESPACE
+from .models import (
+    Banner, Booking, BookingStat, Category, DateTour, FavoriteList, Feedback, Rating, RegionTour, SeatHold, Tour,
+    TourImage,
+)
+from .ratings import apply_rating_delta
+from .regions import invalidate_regions, invalidate_tour_regions, region_slugs
+from .response_cache import model_namespace
+from .search import get_search_backend
+from .seasons import refresh_tour_dates
+from .statistics import (
+    PUBLISHED_TOURS, STAT_FIELDS, TOURS, add_total, record_booking, shift_region_stats, tour_region_ids,
+)
+from .trending import BOOKING, FAVORITE, RATING, record_event
+
+SEARCH_FIELDS = ('title', 'route_tour', 'description')
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, raw, using, **kwargs):
+    if raw or instance.pk is None:
+        return
+    if {'tour_id', 'score'} <= getattr(instance, '_loaded_values', {}).keys():
+        return
+    # Объект создан не из БД (например, Rating(id=..., ...)) — берём прежние значения одним запросом
+    previous = sender.objects.using(using).filter(pk=instance.pk).values('tour_id', 'score').first()
+    instance._loaded_values = previous or {}
+
+
+@receiver(post_save, sender=Rating)
+def update_tour_rating_on_save(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    previous = {} if created else getattr(instance, '_loaded_values', {})
+    old_tour_id, old_score = previous.get('tour_id'), previous.get('score')
+
+    if old_tour_id is None:
+        apply_rating_delta(instance.tour_id, 1, instance.score, using=using)
+    elif old_tour_id != instance.tour_id:
+        apply_rating_delta(old_tour_id, -1, -old_score, using=using)
+        apply_rating_delta(instance.tour_id, 1, instance.score, using=using)
+    else:
+        apply_rating_delta(instance.tour_id, 0, instance.score - old_score, using=using)
+
+    instance._loaded_values = {'tour_id': instance.tour_id, 'score': instance.score}
+    bump_version_on_commit(LEADERBOARD_NAMESPACE, using=using)
+
+
+@receiver(post_delete, sender=Rating)
+def update_tour_rating_on_delete(sender, instance, using, **kwargs):
+    apply_rating_delta(instance.tour_id, -1, -instance.score, using=using)
+    bump_version_on_commit(LEADERBOARD_NAMESPACE, using=using)
+
+
+@receiver(post_save, sender=Tour)
+def invalidate_leaderboard_on_publish(sender, instance, created, raw, using, **kwargs):
+    previous = getattr(instance, '_loaded_values', {})
+    if created or previous.get('is_published', instance.is_published) != instance.is_published:
+        bump_version_on_commit(LEADERBOARD_NAMESPACE, using=using)
+    instance._loaded_values = {**previous, 'is_published': instance.is_published}
+
+
+@receiver(post_save, sender=Tour)
+def update_search_index(sender, instance, created, raw, using, update_fields, **kwargs):
+    if raw or (update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS)):
+        return
+    previous = getattr(instance, '_loaded_values', {})
+    if not created and all(previous.get(field) == getattr(instance, field) for field in SEARCH_FIELDS):
+        return
+    get_search_backend(using).index_tours([instance])
+    instance._loaded_values = {**previous, **{field: getattr(instance, field) for field in SEARCH_FIELDS}}
+
+
+@receiver(post_delete, sender=Tour)
+def invalidate_leaderboard_on_tour_delete(sender, instance, using, **kwargs):
+    bump_version_on_commit(LEADERBOARD_NAMESPACE, using=using)
+
+
+@receiver(post_delete, sender=Tour)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    get_search_backend(using).remove_tours([instance.pk])
+
+
+@receiver(m2m_changed, sender=Tour.category.through)
+@receiver(m2m_changed, sender=Tour.region.through)
+def invalidate_leaderboard_on_membership(sender, action, using, **kwargs):
+    # Рейтинги по категориям и регионам зависят от состава M2M
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version_on_commit(LEADERBOARD_NAMESPACE, using=using)
+
+
+@receiver(post_save, sender=Feedback)
+def update_feedback_path(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_values', {})
+    if instance.path and previous.get('parent_id', instance.parent_id) == instance.parent_id:
+        return
+    place_in_thread(instance, using=using)
+    instance._loaded_values = {**previous, 'parent_id': instance.parent_id, 'path': instance.path}
+
+
+@receiver(post_delete, sender=Feedback)
+def update_reply_counts_on_delete(sender, instance, using, **kwargs):
+    # Каждый отзыв учтён ровно один раз в reply_count каждого предка
+    sender.objects.using(using).filter(pk__in=instance.ancestor_ids).update(reply_count=F('reply_count') - 1)
+
+
+@receiver(post_save, sender=Booking)
+def sync_booking_seats(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_values', {})
+    if created and not hasattr(instance, '_seat_hold') and instance.status != REJECTED_BOOKING:
+        instance._seat_hold = attach_booking(instance)
+    elif previous.get('status') != REJECTED_BOOKING and instance.status == REJECTED_BOOKING:
+        hold = SeatHold.objects.filter(booking=instance).first()
+        if hold is not None:
+            release_hold(hold)
+    instance._loaded_values = {**previous, 'status': instance.status}
+
+
+@receiver(post_delete, sender=SeatHold)
+def return_seats_on_hold_delete(sender, instance, **kwargs):
+    # Удаление бронирования каскадно удаляет удержание — места возвращаются в остаток
+    if instance.status in SeatHold.ACTIVE_STATUSES:
+        return_seats(instance.inventory_id, instance.seats)
+
+
+@receiver(m2m_changed, sender=Tour.date_tour.through)
+def refresh_dates_on_membership(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_tour_dates([instance.pk], using=using)
+        return
+    # Изменение со стороны DateTour (date.tours.add/remove/clear): pk_set содержит ID туров
+    if action == 'pre_clear':
+        instance._cleared_tour_ids = list(instance.tours.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        refresh_tour_dates(pk_set, using=using)
+    elif action == 'post_clear':
+        refresh_tour_dates(getattr(instance, '_cleared_tour_ids', []), using=using)
+
+
+@receiver(post_save, sender=DateTour)
+def refresh_dates_on_date_change(sender, instance, created, raw, using, **kwargs):
+    previous = getattr(instance, '_loaded_values', {})
+    changed = any(previous.get(field) != getattr(instance, field) for field in ('season', 'start_date'))
+    if not created and not raw and changed:
+        refresh_tour_dates(instance.tours.values_list('pk', flat=True), using=using)
+    instance._loaded_values = {**previous, 'season': instance.season, 'start_date': instance.start_date}
+
+
+@receiver(pre_delete, sender=DateTour)
+def remember_tours_of_deleted_date(sender, instance, **kwargs):
+    instance._deleted_tour_ids = list(instance.tours.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=DateTour)
+def refresh_dates_on_date_delete(sender, instance, using, **kwargs):
+    refresh_tour_dates(getattr(instance, '_deleted_tour_ids', []), using=using)
+
+
+IMAGE_FIELDS = {TourImage: 'image', Banner: 'banner_image', RegionTour: 'image'}
+
+
+def touch_image_owners(sender, pks):
+    if sender is TourImage:
+        tour_ids = list(Tour.objects.filter(images__in=pks).values_list('pk', flat=True))
+        touch(Tour, tour_ids)
+        invalidate_tour_regions(tour_ids)
+    else:
+        touch(sender, pks)
+        if sender is RegionTour:
+            invalidate_regions(RegionTour.objects.filter(pk__in=pks).values_list('slug', flat=True))
+
+
+@receiver(post_save, sender=TourImage)
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=RegionTour)
+def generate_image_variants(sender, instance, raw, **kwargs):
+    if not raw:
+        # Готовые копии появляются в srcset, поэтому ETag детальных страниц и кэш списков должны смениться
+        def on_done():
+            # Колбэк выполняется в служебном потоке пула, где Django сам не проверяет соединения
+            close_old_connections()
+            touch_image_owners(sender, [instance.pk])
+            bump_version(model_namespace(sender))
+
+        schedule_variants(getattr(instance, IMAGE_FIELDS[sender]), on_done=on_done)
+
+
+@receiver(pre_delete, sender=TourImage)
+def remember_tours_of_deleted_image(sender, instance, **kwargs):
+    instance._deleted_tour_ids = list(instance.tours.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=TourImage)
+@receiver(post_save, sender=DateTour)
+def touch_tours_on_related_change(sender, instance, created, raw, using, **kwargs):
+    # Изображения и даты входят в детальное представление тура, но хранятся отдельно
+    if not created and not raw:
+        touch(Tour, instance.tours.values_list('pk', flat=True), using=using)
+
+
+@receiver(post_delete, sender=TourImage)
+@receiver(post_delete, sender=DateTour)
+def touch_tours_on_related_delete(sender, instance, using, **kwargs):
+    touch(Tour, getattr(instance, '_deleted_tour_ids', []), using=using)
+
+
+@receiver(m2m_changed, sender=Tour.images.through)
+@receiver(m2m_changed, sender=Tour.date_tour.through)
+def touch_tours_on_membership(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch(Tour, [instance.pk], using=using)
+        return
+    if action == 'pre_clear':
+        instance._cleared_tour_ids = list(instance.tours.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        touch(Tour, pk_set, using=using)
+    elif action == 'post_clear':
+        touch(Tour, getattr(instance, '_cleared_tour_ids', []), using=using)
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=RegionTour)
+@receiver(post_save, sender=Tour)
+@receiver(post_save, sender=DateTour)
+@receiver(post_save, sender=TourImage)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Banner)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=RegionTour)
+@receiver(post_delete, sender=Tour)
+@receiver(post_delete, sender=DateTour)
+@receiver(post_delete, sender=TourImage)
+@receiver(post_delete, sender=Rating)
+def invalidate_response_cache(sender, using, **kwargs):
+    bump_version_on_commit(model_namespace(sender), using=using)
+
+
+@receiver(m2m_changed, sender=Tour.category.through)
+@receiver(m2m_changed, sender=Tour.region.through)
+@receiver(m2m_changed, sender=Tour.date_tour.through)
+@receiver(m2m_changed, sender=Tour.images.through)
+def invalidate_response_cache_on_membership(sender, action, using, **kwargs):
+    # Состав связей входит в представление тура и в фильтры списков
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version_on_commit(model_namespace(Tour), using=using)
+
+
+# Страницы регионов (tour/regions.py): сдвигаются версии только тех регионов, в которые входит тур
+@receiver(post_save, sender=Tour)
+def invalidate_regions_on_tour_save(sender, instance, created, raw, using, **kwargs):
+    # У только что созданного тура ещё нет регионов, они появятся через m2m_changed
+    if not raw and not created:
+        invalidate_tour_regions([instance.pk], using=using)
+
+
+@receiver(pre_delete, sender=Tour)
+def remember_tour_regions(sender, instance, using, **kwargs):
+    # Связи с регионами удаляются раньше post_delete
+    instance._landing_regions = region_slugs([instance.pk], using)
+
+
+@receiver(post_delete, sender=Tour)
+def invalidate_regions_on_tour_delete(sender, instance, using, **kwargs):
+    invalidate_regions(getattr(instance, '_landing_regions', ()), using=using)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_regions_on_rating_change(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        invalidate_tour_regions([instance.tour_id], using=using)
+
+
+@receiver(m2m_changed, sender=Tour.region.through)
+def invalidate_regions_on_membership(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_regions([instance.slug], using=using)
+    elif action == 'pre_clear':
+        instance._landing_cleared_regions = region_slugs([instance.pk], using)
+    elif action == 'post_clear':
+        invalidate_regions(getattr(instance, '_landing_cleared_regions', ()), using=using)
+    elif action in ('post_add', 'post_remove'):
+        slugs = RegionTour.objects.using(using).filter(pk__in=pk_set).values_list('slug', flat=True)
+        invalidate_regions(slugs, using=using)
+
+
+@receiver(m2m_changed, sender=Tour.date_tour.through)
+@receiver(m2m_changed, sender=Tour.images.through)
+def invalidate_regions_on_tour_content(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_tour_regions([instance.pk], using=using)
+    elif action == 'post_clear':
+        # Туры, очищенные со стороны даты или фото, запомнил touch_tours_on_membership на pre_clear
+        invalidate_tour_regions(getattr(instance, '_cleared_tour_ids', []), using=using)
+    else:
+        invalidate_tour_regions(pk_set, using=using)
+
+
+@receiver(post_save, sender=DateTour)
+@receiver(post_save, sender=TourImage)
+def invalidate_regions_on_content_change(sender, instance, created, raw, using, **kwargs):
+    if not created and not raw:
+        invalidate_tour_regions(instance.tours.values_list('pk', flat=True), using=using)
+
+
+@receiver(post_delete, sender=DateTour)
+@receiver(post_delete, sender=TourImage)
+def invalidate_regions_on_content_delete(sender, instance, using, **kwargs):
+    invalidate_tour_regions(getattr(instance, '_deleted_tour_ids', []), using=using)
+
+
+@receiver(pre_save, sender=RegionTour)
+def remember_region_slug(sender, instance, raw, using, **kwargs):
+    if not raw and instance.pk is not None:
+        instance._previous_slug = RegionTour.objects.using(using).filter(pk=instance.pk).values_list(
+            'slug', flat=True,
+        ).first()
+
+
+@receiver(post_save, sender=RegionTour)
+@receiver(post_delete, sender=RegionTour)
+def invalidate_region_page(sender, instance, using, raw=False, **kwargs):
+    # Заголовок страницы — сам регион; после удаления или смены slug старый ответ не должен отдаваться
+    if not raw:
+        invalidate_regions({instance.slug, getattr(instance, '_previous_slug', None)}, using=using)
+
+
+# Кэш избранного (tour/favorites.py). FavoriteList — through-модель MyUser.favorite_tours,
+# поэтому изменения через менеджер поля приходят и как m2m_changed
+@receiver(post_save, sender=FavoriteList)
+@receiver(post_delete, sender=FavoriteList)
+def forget_cached_favorites(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        forget_favorites([instance.user_id], using=using)
+
+
+@receiver(m2m_changed, sender=FavoriteList)
+def forget_cached_favorites_on_membership(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._favorite_user_ids = list(sender.objects.using(using).filter(tour=instance).values_list(
+            'user_id', flat=True,
+        ))
+    elif action == 'post_clear':
+        forget_favorites(getattr(instance, '_favorite_user_ids', []) if reverse else [instance.pk], using=using)
+    elif action in ('post_add', 'post_remove'):
+        forget_favorites(pk_set if reverse else [instance.pk], using=using)
+
+
+# Сводная статистика (tour/statistics.py). Приёмники объявлены после sync_booking_seats и
+# invalidate_leaderboard_on_publish: те перезаписывают _loaded_values, поэтому прежние значения
+# запоминаются отдельно в pre_save.
+_deleting_tours = threading.local()
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_stats(sender, instance, raw, using, **kwargs):
+    instance._stats_previous = None
+    if raw or instance.pk is None:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if set(STAT_FIELDS) <= loaded.keys():
+        instance._stats_previous = {field: loaded[field] for field in STAT_FIELDS}
+    else:
+        instance._stats_previous = sender.objects.using(using).filter(pk=instance.pk).values(*STAT_FIELDS).first()
+
+
+@receiver(post_save, sender=Booking)
+def update_booking_stats_on_save(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    current = {field: getattr(instance, field) for field in STAT_FIELDS}
+    previous = None if created else getattr(instance, '_stats_previous', None)
+    if previous != current:
+        if previous is not None:
+            record_booking(previous, -1, using=using)
+        record_booking(current, 1, using=using)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **current}
+
+
+@receiver(post_delete, sender=Booking)
+def update_booking_stats_on_delete(sender, instance, using, **kwargs):
+    values = {field: getattr(instance, field) for field in STAT_FIELDS}
+    # Сводки удаляемого тура по регионам уже сняты в remove_tour_region_stats
+    deleting = getattr(_deleting_tours, 'ids', set())
+    record_booking(values, -1, using=using, region_ids=() if instance.tour_id in deleting else None)
+
+
+@receiver(pre_save, sender=Tour)
+def remember_tour_published(sender, instance, raw, using, **kwargs):
+    instance._stats_was_published = None
+    if raw or instance.pk is None:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if 'is_published' in loaded:
+        instance._stats_was_published = loaded['is_published']
+    else:
+        instance._stats_was_published = sender.objects.using(using).filter(pk=instance.pk).values_list(
+            'is_published', flat=True,
+        ).first()
+
+
+@receiver(post_save, sender=Tour)
+def update_tour_totals_on_save(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    if created:
+        add_total(TOURS, count=1, using=using)
+        if instance.is_published:
+            add_total(PUBLISHED_TOURS, count=1, using=using)
+        return
+    was_published = getattr(instance, '_stats_was_published', None)
+    if was_published is not None and was_published != instance.is_published:
+        add_total(PUBLISHED_TOURS, count=1 if instance.is_published else -1, using=using)
+
+
+@receiver(pre_delete, sender=Tour)
+def remove_tour_region_stats(sender, instance, using, **kwargs):
+    # Связи с регионами удаляются раньше каскадно удаляемых бронирований
+    shift_region_stats(instance.pk, tour_region_ids(instance.pk, using), -1, using=using)
+    if not hasattr(_deleting_tours, 'ids'):
+        _deleting_tours.ids = set()
+    _deleting_tours.ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=Tour)
+def update_tour_totals_on_delete(sender, instance, using, **kwargs):
+    getattr(_deleting_tours, 'ids', set()).discard(instance.pk)
+    add_total(TOURS, count=-1, using=using)
+    if instance.is_published:
+        add_total(PUBLISHED_TOURS, count=-1, using=using)
+    BookingStat.objects.using(using).filter(dimension=BookingStat.TOUR, key=instance.pk).delete()
+
+
+@receiver(post_delete, sender=RegionTour)
+def remove_region_stats(sender, instance, using, **kwargs):
+    BookingStat.objects.using(using).filter(dimension=BookingStat.REGION, key=instance.pk).delete()
+
+
+@receiver(m2m_changed, sender=Tour.region.through)
+def shift_region_stats_on_membership(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._stats_cleared_ids = list(instance.tours.values_list('pk', flat=True))
+        else:
+            instance._stats_cleared_ids = tour_region_ids(instance.pk, using)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    sign = -1 if action in ('post_remove', 'post_clear') else 1
+    ids = getattr(instance, '_stats_cleared_ids', []) if action == 'post_clear' else pk_set
+    if not reverse:
+        shift_region_stats(instance.pk, ids, sign, using=using)
+        return
+    # Изменение со стороны RegionTour: pk_set содержит ID туров
+    for tour_id in ids or ():
+        shift_region_stats(tour_id, [instance.pk], sign, using=using)
+
+
+# Популярность «сейчас» (tour/trending.py). Учитываются только новые события: отмена брони или
+# удаление оценки не уменьшают счёт, он и так затухает
+@receiver(post_save, sender=Booking)
+def record_booking_trend(sender, instance, created, raw, using, **kwargs):
+    if created and not raw and instance.status != REJECTED_BOOKING:
+        record_event([instance.tour_id], BOOKING, using=using)
+
+
+@receiver(post_save, sender=Rating)
+def record_rating_trend(sender, instance, created, raw, using, **kwargs):
+    if created and not raw:
+        record_event([instance.tour_id], RATING, using=using)
+
+
+@receiver(post_save, sender=FavoriteList)
+def record_favorite_trend(sender, instance, created, raw, using, **kwargs):
+    if created and not raw:
+        record_event([instance.tour_id], FAVORITE, using=using)
+
+
+@receiver(m2m_changed, sender=FavoriteList)
+def record_favorite_trend_on_membership(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        record_event([instance.pk], FAVORITE, count=len(pk_set), using=using)
+    else:
+        record_event(pk_set, FAVORITE, using=using)
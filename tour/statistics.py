@@ -0,0 +1,196 @@
+"""Сводная статистика для AdminStatisticsView.
+
+Итоговые счётчики (StatTotal) и дневные сводки бронирований (BookingStat) обновляются
+сигналами Booking, Tour и MyUser (tour/signals.py, user/signals.py) атомарными
+UPDATE ... SET x = x + d, поэтому запрос статистики не сканирует транзакционные таблицы.
+Если сводки разошлись с данными, их пересобирает manage.py rebuild_statistics.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps as django_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Booking, BookingStat, StatTotal, Tour
+
+STAT_FIELDS = ('tour_id', 'status', 'participants', 'total_price', 'created_date')
+
+USERS = 'users'
+TOURS = 'tours'
+PUBLISHED_TOURS = 'published_tours'
+BOOKINGS_PREFIX = 'bookings:'
+
+SERIES_DIMENSIONS = (BookingStat.DAY, BookingStat.TOUR, BookingStat.REGION)
+# Поле бронирования, по которому группируется каждое измерение при пересчёте
+DIMENSION_KEYS = ((BookingStat.DAY, None), (BookingStat.TOUR, 'tour_id'), (BookingStat.REGION, 'tour__region'))
+DEFAULT_SERIES_DAYS = 30
+MAX_SERIES_DAYS = 366
+TOP_LIMIT = 50
+
+
+def bookings_total_name(status):
+    return f'{BOOKINGS_PREFIX}{status}'
+
+
+def _upsert(model, lookup, deltas, using=None):
+    """Прибавляет deltas к строке lookup, создавая её при первом обращении."""
+    manager = model.objects.using(using)
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if manager.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic(using=using):
+            manager.create(**lookup, **deltas)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        manager.filter(**lookup).update(**updates)
+
+
+def add_total(name, count=0, amount=0, using=None):
+    if count or amount:
+        _upsert(StatTotal, {'name': name}, {'count': count, 'amount': amount}, using=using)
+
+
+def booking_day(created_date):
+    return timezone.localdate(created_date) if timezone.is_aware(created_date) else created_date.date()
+
+
+def tour_region_ids(tour_id, using=None):
+    links = Tour.region.through.objects.using(using).filter(tour_id=tour_id)
+    return list(links.values_list('regiontour_id', flat=True))
+
+
+def record_booking(values, sign, using=None, region_ids=None):
+    """Учитывает бронирование (sign=1) или снимает его учёт (sign=-1).
+
+    values — словарь с tour_id, status, participants, total_price и created_date.
+    region_ids по умолчанию читаются из связей тура.
+    """
+    day = booking_day(values['created_date'])
+    status = values['status']
+    deltas = {
+        'bookings': sign,
+        'participants': sign * values['participants'],
+        'revenue': sign * Decimal(values['total_price']),
+    }
+    keys = [(BookingStat.DAY, 0), (BookingStat.TOUR, values['tour_id'])]
+    if region_ids is None:
+        region_ids = tour_region_ids(values['tour_id'], using)
+    keys += [(BookingStat.REGION, region_id) for region_id in region_ids]
+    for dimension, key in keys:
+        _upsert(BookingStat, {'dimension': dimension, 'key': key, 'day': day, 'status': status}, deltas, using=using)
+    add_total(bookings_total_name(status), count=sign, amount=deltas['revenue'], using=using)
+
+
+def shift_region_stats(tour_id, region_ids, sign, using=None):
+    """Переносит сводки тура в регионы (sign=1) или убирает их оттуда (sign=-1) при изменении M2M region."""
+    region_ids = list(region_ids or [])
+    if not region_ids:
+        return
+    rows = BookingStat.objects.using(using).filter(dimension=BookingStat.TOUR, key=tour_id).values_list(
+        'day', 'status', 'bookings', 'participants', 'revenue',
+    )
+    for day, status, bookings, participants, revenue in rows:
+        deltas = {'bookings': sign * bookings, 'participants': sign * participants, 'revenue': sign * revenue}
+        for region_id in region_ids:
+            _upsert(BookingStat, {'dimension': BookingStat.REGION, 'key': region_id, 'day': day, 'status': status},
+                    deltas, using=using)
+
+
+def rebuild_statistics(using=None, apps=None):
+    """Пересчитывает все сводки по транзакционным таблицам. Возвращает количество строк BookingStat.
+
+    apps передаётся из миграций, чтобы работать с историческими моделями.
+    """
+    apps = apps or django_apps
+    booking_model = apps.get_model('tour', 'Booking')
+    stat_model = apps.get_model('tour', 'BookingStat')
+    total_model = apps.get_model('tour', 'StatTotal')
+    tour_model = apps.get_model('tour', 'Tour')
+    user_model = apps.get_model('user', 'MyUser')
+
+    aggregates = {
+        'bookings': Count('pk'),
+        'participants': Coalesce(Sum('participants'), 0),
+        'revenue': Coalesce(Sum('total_price'), Decimal('0')),
+    }
+    bookings = booking_model.objects.using(using).annotate(
+        stat_day=TruncDate('created_date', tzinfo=timezone.get_current_timezone()),
+    ).order_by()
+    with transaction.atomic(using=using):
+        stat_model.objects.using(using).all().delete()
+        total_model.objects.using(using).all().delete()
+        stats = []
+        for dimension, key_field in DIMENSION_KEYS:
+            queryset = bookings
+            fields = ['stat_day', 'status']
+            if key_field:
+                queryset = queryset.filter(**{f'{key_field}__isnull': False})
+                fields.append(key_field)
+            for row in queryset.values(*fields).annotate(**aggregates):
+                stats.append(stat_model(
+                    dimension=dimension, key=row[key_field] if key_field else 0, day=row['stat_day'],
+                    status=row['status'], bookings=row['bookings'], participants=row['participants'],
+                    revenue=row['revenue'],
+                ))
+        stat_model.objects.using(using).bulk_create(stats, batch_size=1000)
+
+        tours = tour_model.objects.using(using).aggregate(
+            total=Count('pk'), published=Count('pk', filter=Q(is_published=True)),
+        )
+        totals = [
+            total_model(name=USERS, count=user_model.objects.using(using).count()),
+            total_model(name=TOURS, count=tours['total']),
+            total_model(name=PUBLISHED_TOURS, count=tours['published']),
+        ]
+        for row in bookings.values('status').annotate(**aggregates):
+            totals.append(total_model(name=bookings_total_name(row['status']), count=row['bookings'],
+                                      amount=row['revenue']))
+        total_model.objects.using(using).bulk_create(totals)
+    return len(stats)
+
+
+def get_totals():
+    totals = {name: (count, amount) for name, count, amount in StatTotal.objects.values_list('name', 'count', 'amount')}
+    by_status = {}
+    for status, label in Booking.STATUS_CHOICES:
+        count, amount = totals.get(bookings_total_name(status), (0, Decimal('0')))
+        by_status[status] = {'label': label, 'bookings': count, 'revenue': amount}
+    return {
+        'total_users': totals.get(USERS, (0, 0))[0],
+        'total_tours': totals.get(TOURS, (0, 0))[0],
+        'published_tours': totals.get(PUBLISHED_TOURS, (0, 0))[0],
+        'total_bookings': sum(item['bookings'] for item in by_status.values()),
+        'total_revenue': sum((item['revenue'] for item in by_status.values()), Decimal('0')),
+        'bookings_by_status': by_status,
+    }
+
+
+def default_range(today=None):
+    today = today or timezone.localdate()
+    return today - timedelta(days=DEFAULT_SERIES_DAYS - 1), today
+
+
+def get_series(date_from, date_to, dimension=BookingStat.DAY, key=None, status=None):
+    """Ряд по дням (для DAY или конкретного тура/региона) либо топ туров/регионов за период."""
+    queryset = BookingStat.objects.filter(dimension=dimension, day__range=(date_from, date_to))
+    if status is not None:
+        queryset = queryset.filter(status=status)
+    sums = {'bookings': Sum('bookings'), 'participants': Sum('participants'), 'revenue': Sum('revenue')}
+
+    if dimension == BookingStat.DAY or key is not None:
+        if key is not None:
+            queryset = queryset.filter(key=key)
+        return [
+            {'date': row['day'], 'bookings': row['bookings'], 'participants': row['participants'],
+             'revenue': row['revenue']}
+            for row in queryset.values('day').annotate(**sums).order_by('day')
+        ]
+    return [
+        {'id': row['key'], 'bookings': row['bookings'], 'participants': row['participants'],
+         'revenue': row['revenue']}
+        for row in queryset.values('key').annotate(**sums).order_by('-revenue', 'key')[:TOP_LIMIT]
+    ]
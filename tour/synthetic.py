@@ -0,0 +1,256 @@
+"""Воспроизводимые синтетические данные для замеров производительности (manage.py generate_synthetic_data).
+
+Все значения выбираются генератором random.Random(seed), поэтому одинаковые параметры дают
+одинаковый набор данных. Строки вставляются через bulk_create, а производные данные, которые
+для одиночных объектов поддерживают сигналы (агрегаты рейтинга, сводка по датам, поисковый
+индекс, пути отзывов, сводная статистика), пересчитываются один раз в конце.
+"""
+import random
+from collections import Counter
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from user.models import MyUser
+
+from .cache import bump_version_on_commit
+from .leaderboard import LEADERBOARD_NAMESPACE
+from .models import Banner, Booking, Category, DateTour, FavoriteList, Feedback, Rating, RegionTour, Tour
+from .ratings import rebuild_rating_stats
+from .regions import invalidate_all_regions
+from .response_cache import model_namespace
+from .search import get_search_backend
+from .seasons import refresh_tour_dates
+from .statistics import rebuild_statistics
+from .trending import rebuild_trending_scores
+
+WORDS = (
+    'горы', 'озеро', 'ущелье', 'перевал', 'юрта', 'водопад', 'каньон', 'ледник', 'степь', 'кумыс',
+    'конный', 'треккинг', 'рассвет', 'ночёвка', 'источник', 'тропа', 'долина', 'пик', 'базар', 'каравансарай',
+)
+SEASONS_BY_MONTH = {12: 'winter', 1: 'winter', 2: 'winter', 3: 'spring', 4: 'spring', 5: 'spring',
+                    6: 'summer', 7: 'summer', 8: 'summer', 9: 'autumn', 10: 'autumn', 11: 'autumn'}
+PASSWORD = 'benchmark'
+
+
+@dataclass
+class SyntheticSizes:
+    users: int = 200
+    banners: int = 5
+    categories: int = 10
+    regions: int = 8
+    dates: int = 60
+    tours: int = 500
+    ratings: int = 3000
+    favorites: int = 1000
+    feedback_threads: int = 300
+    feedback_replies: int = 4  # Ответов на каждом уровне ветки
+    feedback_depth: int = 4  # Глубина ветки, включая корневой отзыв
+    bookings: int = 2000
+
+
+class SyntheticDataGenerator:
+    def __init__(self, seed=0, sizes=None, using='default', today=None, prefix='bench'):
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.sizes = sizes or SyntheticSizes()
+        self.using = using
+        self.today = today or date.today()
+        self.prefix = f'{prefix}-{seed}'
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
+
+    def sample(self, population, count):
+        return self.random.sample(population, min(count, len(population)))
+
+    def generate(self):
+        """Создаёт данные одной транзакцией и возвращает количество созданных строк по моделям."""
+        with transaction.atomic(using=self.using):
+            users = self.create_users()
+            banners = Banner.objects.using(self.using).bulk_create([
+                Banner(title=f'Баннер {self.prefix} {number}', banner_image=f'banners/{self.prefix}-{number}.jpg')
+                for number in range(self.sizes.banners)
+            ])
+            categories = self.create_named(Category, 'Категория', self.sizes.categories)
+            regions = self.create_named(RegionTour, 'Регион', self.sizes.regions)
+            dates = self.create_dates()
+            tours = self.create_tours(categories, regions, dates)
+            counts = {
+                'users': len(users),
+                'banners': len(banners),
+                'categories': len(categories),
+                'regions': len(regions),
+                'dates': len(dates),
+                'tours': len(tours),
+                'ratings': self.create_ratings(tours, users),
+                'favorites': self.create_favorites(tours, users),
+                'feedback': self.create_feedback(tours),
+                'bookings': self.create_bookings(tours, users),
+            }
+            self.rebuild_derived(tours)
+        return counts
+
+    def create_users(self):
+        password = make_password(PASSWORD)
+        users = [
+            MyUser(email=f'{self.prefix}-user{number}@example.com', username=f'Пользователь {number}',
+                   phone_number=f'+996{self.random.randrange(10 ** 8, 10 ** 9)}', password=password,
+                   status=self.random.choice((1, 1, 1, 2, 5)))
+            for number in range(self.sizes.users)
+        ]
+        if users:
+            users[0].is_admin = users[0].is_superuser = True
+        return MyUser.objects.using(self.using).bulk_create(users)
+
+    def create_named(self, model, label, count):
+        return model.objects.using(self.using).bulk_create([
+            model(title=f'{label} {self.prefix} {number}', description=self.text(12),
+                  slug=f'{self.prefix}-{model._meta.model_name}-{number}')
+            for number in range(count)
+        ])
+
+    def create_dates(self):
+        dates = []
+        for _ in range(self.sizes.dates):
+            start = self.today + timedelta(days=self.random.randrange(-60, 300))
+            dates.append(DateTour(
+                start_date=start, end_date=start + timedelta(days=self.random.randrange(1, 10)),
+                tour_type=self.random.choice(DateTour.TOUR_TYPES)[0], season=SEASONS_BY_MONTH[start.month],
+            ))
+        return DateTour.objects.using(self.using).bulk_create(dates)
+
+    def create_tours(self, categories, regions, dates):
+        tours = []
+        for number in range(self.sizes.tours):
+            price = Decimal(self.random.randrange(50, 2000))
+            discounted = self.random.random() < 0.2
+            tours.append(Tour(
+                author=f'{self.prefix}-author{self.random.randrange(20)}',
+                title=f'{self.text(3).capitalize()} {number}',
+                description=self.text(40),
+                route_tour=' - '.join(self.random.choice(WORDS) for _ in range(3)),
+                duration=self.random.randrange(1, 15),
+                price=price,
+                participants_price=(price / 2).quantize(Decimal('0.01')),
+                max_participants=self.random.randrange(5, 40),
+                discount_price=(price * Decimal('0.8')).quantize(Decimal('0.01')) if discounted else None,
+                is_published=self.random.random() < 0.9,
+            ))
+        for tour in tours:
+            tour.effective_price = tour.get_effective_price()
+        tours = Tour.objects.using(self.using).bulk_create(tours)
+
+        links = {Tour.category.through: [], Tour.region.through: [], Tour.date_tour.through: []}
+        for tour in tours:
+            links[Tour.category.through] += [
+                Tour.category.through(tour_id=tour.pk, category_id=category.pk)
+                for category in self.sample(categories, self.random.randint(1, 3))
+            ]
+            links[Tour.region.through] += [
+                Tour.region.through(tour_id=tour.pk, regiontour_id=region.pk)
+                for region in self.sample(regions, self.random.randint(1, 2))
+            ]
+            links[Tour.date_tour.through] += [
+                Tour.date_tour.through(tour_id=tour.pk, datetour_id=item.pk)
+                for item in self.sample(dates, self.random.randint(1, 4))
+            ]
+        for through, rows in links.items():
+            through.objects.using(self.using).bulk_create(rows, batch_size=1000)
+        return tours
+
+    def create_ratings(self, tours, users):
+        if not tours or not users:
+            return 0
+        pairs = {(self.random.choice(tours).pk, self.random.choice(users).pk) for _ in range(self.sizes.ratings)}
+        ratings = [
+            Rating(tour_id=tour_id, user_id=user_id, score=self.random.choices((1, 2, 3, 4, 5), (1, 1, 3, 5, 6))[0])
+            for tour_id, user_id in sorted(pairs)
+        ]
+        return len(Rating.objects.using(self.using).bulk_create(ratings, batch_size=1000))
+
+    def create_favorites(self, tours, users):
+        if not tours or not users:
+            return 0
+        pairs = {(self.random.choice(tours).pk, self.random.choice(users).pk) for _ in range(self.sizes.favorites)}
+        favorites = [FavoriteList(tour_id=tour_id, user_id=user_id) for tour_id, user_id in sorted(pairs)]
+        return len(FavoriteList.objects.using(self.using).bulk_create(favorites, batch_size=1000))
+
+    def create_feedback(self, tours):
+        """Ветки отзывов создаются по уровням; пути и счётчики ответов вычисляются здесь же."""
+        if not tours:
+            return 0
+        manager = Feedback.objects.using(self.using)
+        level = [None] * self.sizes.feedback_threads
+        paths = []
+        for depth in range(self.sizes.feedback_depth):
+            rows = []
+            for parent in level:
+                rows.append(Feedback(
+                    tour_id=parent.tour_id if parent else self.random.choice(tours).pk,
+                    email=f'{self.prefix}-{self.random.randrange(10 ** 6)}@example.com',
+                    user_name=self.text(1).capitalize(), comment=self.text(15), parent=parent, depth=depth,
+                ))
+            created = manager.bulk_create(rows, batch_size=1000)
+            for feedback in created:
+                parent_path = feedback.parent.path if feedback.parent else ''
+                feedback.path = parent_path + Feedback.path_segment(feedback.pk)
+            manager.bulk_update(created, ['path'], batch_size=1000)
+            paths += [feedback.path for feedback in created]
+            level = [feedback for feedback in created for _ in range(self.sizes.feedback_replies)]
+
+        # reply_count — количество всех потомков, а не только прямых ответов
+        counts = Counter(int(segment) for path in paths for segment in path.split('/')[:-2])
+        manager.bulk_update(
+            [Feedback(pk=pk, reply_count=count) for pk, count in counts.items()], ['reply_count'], batch_size=1000,
+        )
+        return len(paths)
+
+    def create_bookings(self, tours, users):
+        if not tours or not users:
+            return 0
+        tour_dates = {}
+        for tour_id, date_id in Tour.date_tour.through.objects.using(self.using).filter(
+            tour_id__in=[tour.pk for tour in tours],
+        ).values_list('tour_id', 'datetour_id'):
+            tour_dates.setdefault(tour_id, []).append(date_id)
+        tours_with_dates = [tour for tour in tours if tour.pk in tour_dates]
+        if not tours_with_dates:
+            return 0
+
+        bookings = []
+        for _ in range(self.sizes.bookings):
+            tour = self.random.choice(tours_with_dates)
+            participants = self.random.randint(1, 4)
+            bookings.append(Booking(
+                tour_id=tour.pk, user_id=self.random.choice(users).pk,
+                date_id=self.random.choice(tour_dates[tour.pk]), participants=participants,
+                total_price=tour.price + tour.participants_price * (participants - 1),
+                status=self.random.choices((1, 2, 3), weights=(3, 6, 1))[0],
+            ))
+        # Брони без SeatHold учитываются в TourInventory при первом обращении (см. tour/inventory.py)
+        bookings = Booking.objects.using(self.using).bulk_create(bookings, batch_size=1000)
+        MyUser.bookings.through.objects.using(self.using).bulk_create(
+            [MyUser.bookings.through(myuser_id=booking.user_id, booking_id=booking.pk) for booking in bookings],
+            batch_size=1000,
+        )
+        return len(bookings)
+
+    def rebuild_derived(self, tours):
+        tour_ids = [tour.pk for tour in tours]
+        rebuild_rating_stats(Tour.objects.using(self.using).filter(pk__in=tour_ids))
+        refresh_tour_dates(tour_ids, today=self.today, using=self.using)
+        get_search_backend(self.using).index_tours(tours)
+        rebuild_statistics(using=self.using)
+        rebuild_trending_scores(using=self.using)
+        bump_version_on_commit(model_namespace(Tour), using=self.using)
+        bump_version_on_commit(LEADERBOARD_NAMESPACE, using=self.using)
+        invalidate_all_regions(using=self.using)
+
+
+def sizes_from_options(options):
+    defaults = asdict(SyntheticSizes())
+    return SyntheticSizes(**{name: options.get(name, value) for name, value in defaults.items()})
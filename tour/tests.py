@@ -1,3 +1,1495 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, ProtectedError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from scipy import sparse
+
+from core.caches import CacheConfigError, cache_settings
+from core.databases import database_settings
+from core.middleware import QueryBudgetExceeded
+from core.routers import DATABASE_PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from user.authentication import local_users
+
+from .images import mark_variants_ready, variant_urls
+from .inventory import (
+    REJECTED_BOOKING, SeatsUnavailable, _stale_holds, confirm_hold, expire_holds, release_hold, reserve_seats,
+)
+from .leaderboard import get_top_rated_ids
+from .models import (
+    Banner, Booking, BookingStat, Category, DateTour, FavoriteList, Feedback, Rating, RegionTour, SeatHold,
+    SimilarTour, StatTotal, Tour, TourImage, TourInventory,
+)
+from .pricing import PriceScheduler
+from .ratings import rebuild_rating_stats
+from .search import highlight, stem
+from .seasons import refresh_tour_dates
+from .similarity import SimilarityBuilder, cap_user_items, get_weights
+from .statistics import rebuild_statistics
+from .synthetic import SyntheticDataGenerator, SyntheticSizes
+from .trending import (
+    BOOKING, RATING, VIEW, ViewBuffer, current_score, flush_views, rebuild_trending_scores, record_event, record_views,
+    view_buffer,
+)
+
+User = get_user_model()
+
+
+def create_tour(**kwargs):
+    defaults = {
+        'author': 'author',
+        'title': 'Тур',
+        'description': 'Описание',
+        'route_tour': 'Бишкек - Каракол',
+        'duration': 3,
+        'price': Decimal('100.00'),
+        'participants_price': Decimal('50.00'),
+        'max_participants': 10,
+        'is_published': True,
+    }
+    defaults.update(kwargs)
+    return Tour.objects.create(**defaults)
+
+
+def create_date(**kwargs):
+    defaults = {
+        'start_date': date.today() + timedelta(days=30),
+        'end_date': date.today() + timedelta(days=33),
+        'tour_type': 'group',
+        'season': 'summer',
+    }
+    defaults.update(kwargs)
+    return DateTour.objects.create(**defaults)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'rater{number}@example.com', f'rater{number}', 'password')
+                      for number in range(3)]
+        self.tour, self.other = create_tour(), create_tour(title='Другой')
+
+    def aggregates(self, tour):
+        return tuple(Tour.objects.filter(pk=tour.pk).values_list('rating_count', 'rating_sum', 'average_rating')[0])
+
+    def assertMatchesRebuild(self):
+        current = [self.aggregates(tour) for tour in (self.tour, self.other)]
+        rebuild_rating_stats()
+        self.assertEqual([self.aggregates(tour) for tour in (self.tour, self.other)], current)
+
+    def test_aggregates_follow_create_update_delete(self):
+        self.assertEqual(self.aggregates(self.tour), (0, 0, None))
+        first = Rating.objects.create(tour=self.tour, user=self.users[0], score=5)
+        Rating.objects.create(tour=self.tour, user=self.users[1], score=2)
+        self.assertEqual(self.aggregates(self.tour), (2, 7, 3.5))
+
+        first.score = 3
+        first.save()
+        self.assertEqual(self.aggregates(self.tour), (2, 5, 2.5))
+        self.assertMatchesRebuild()
+
+        # Перенос оценки на другой тур объектом, загруженным из БД
+        moved = Rating.objects.get(pk=first.pk)
+        moved.tour, moved.score = self.other, 4
+        moved.save()
+        self.assertEqual(self.aggregates(self.tour), (1, 2, 2.0))
+        self.assertEqual(self.aggregates(self.other), (1, 4, 4.0))
+        self.assertMatchesRebuild()
+
+        Rating.objects.get(tour=self.tour).delete()
+        self.assertEqual(self.aggregates(self.tour), (0, 0, None))
+        self.assertMatchesRebuild()
+
+    def test_saving_stale_tour_keeps_aggregates(self):
+        stale = Tour.objects.get(pk=self.tour.pk)
+        Rating.objects.create(tour=self.tour, user=self.users[0], score=4)
+        stale.title = 'Новое название'
+        stale.save()
+        self.assertEqual(self.aggregates(self.tour), (1, 4, 4.0))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('leader@example.com', 'leader', 'password')
+        self.tours = [create_tour(title=f'Тур {number}') for number in range(3)]
+        for tour, score in zip(self.tours, (3, 5)):
+            Rating.objects.create(tour=tour, user=self.user, score=score)
+
+    def ids(self, **kwargs):
+        return get_top_rated_ids(**kwargs)
+
+    def test_order_and_cache(self):
+        first, second, third = self.tours
+        self.assertEqual(self.ids(limit=3), [second.pk, first.pk, third.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids(limit=3), [second.pk, first.pk, third.pk])
+        titles = [item['title'] for item in self.client.get('/api/tours/?limit=2').json()]
+        self.assertEqual(titles, [second.title, first.title])
+
+    def test_invalidated_by_ratings_and_publication(self):
+        first, second, third = self.tours
+        self.ids(limit=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(tour=third, user=self.user, score=5)
+            Rating.objects.create(tour=third, user=User.objects.create_user('x@example.com', 'x', 'password'),
+                                  score=5)
+        self.assertEqual(self.ids(limit=3), [third.pk, second.pk, first.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            third.is_published = False
+            third.save()
+        self.assertEqual(self.ids(limit=3), [second.pk, first.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.get(tour=second).delete()
+        self.assertEqual(self.ids(limit=3), [first.pk, second.pk])
+
+    def test_category_membership_invalidates(self):
+        category = Category.objects.create(title='Mountains', description='')
+        self.assertEqual(self.ids(category=category.pk), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tours[0].category.add(category)
+        self.assertEqual(self.ids(category=category.pk), [self.tours[0].pk])
+
+
+class FeedbackThreadTests(TestCase):
+    def setUp(self):
+        self.tour = create_tour()
+
+    def reply(self, parent=None, comment='Отзыв'):
+        return Feedback.objects.create(tour=self.tour, parent=parent, comment=comment)
+
+    def state(self, *nodes):
+        rows = Feedback.objects.in_bulk([node.pk for node in nodes])
+        return [(rows[node.pk].path, rows[node.pk].depth, rows[node.pk].reply_count) for node in nodes]
+
+    def test_move_subtree_rewrites_paths_and_counts(self):
+        root = self.reply()
+        middle = self.reply(root)
+        leaf = self.reply(middle)
+        deepest = self.reply(leaf)
+        other = self.reply()
+
+        middle.parent = other
+        middle.save()
+        base = Feedback.path_segment(other.pk)
+        self.assertEqual(self.state(root, other, middle, leaf, deepest), [
+            (Feedback.path_segment(root.pk), 0, 0),
+            (base, 0, 3),
+            (base + Feedback.path_segment(middle.pk), 1, 2),
+            (base + Feedback.path_segment(middle.pk) + Feedback.path_segment(leaf.pk), 2, 1),
+            (base + Feedback.path_segment(middle.pk) + Feedback.path_segment(leaf.pk)
+             + Feedback.path_segment(deepest.pk), 3, 0),
+        ])
+
+        # Перенос ветки в саму себя запрещён
+        other.refresh_from_db()
+        other.parent = leaf
+        with self.assertRaises(ValidationError):
+            other.save()
+        self.assertEqual(self.state(other)[0], (base, 0, 3))
+
+    def test_delete_middle_node(self):
+        root = self.reply()
+        middle = self.reply(root)
+        leaf = self.reply(middle)
+        sibling = self.reply(root)
+
+        # Ответы защищены от каскадного удаления: сначала удаляется ветка под узлом
+        with self.assertRaises(ProtectedError):
+            Feedback.objects.get(pk=middle.pk).delete()
+        self.assertEqual([count for _, _, count in self.state(root, middle)], [3, 1])
+
+        leaf.delete()
+        self.assertEqual([count for _, _, count in self.state(root, middle)], [2, 0])
+        Feedback.objects.get(pk=middle.pk).delete()
+        self.assertEqual(self.state(root, sibling)[0][2], 1)
+        threads = self.client.get(f'/api/feedbacks/{root.pk}/').json()
+        self.assertEqual([child['id'] for child in threads['children']], [sibling.pk])
+
+    def test_depth_is_limited(self):
+        node = self.reply()
+        for _ in range(Feedback.MAX_DEPTH):
+            node = self.reply(node)
+        self.assertEqual(node.depth, Feedback.MAX_DEPTH)
+        with self.assertRaises(ValidationError):
+            self.reply(node)
+        self.assertFalse(Feedback.objects.filter(depth__gt=Feedback.MAX_DEPTH).exists())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.tours = [create_tour(title=f'Тур {number}', price=Decimal(price))
+                      for number, price in enumerate([100, 100, 300, 100, 200, 200, 100])]
+
+    def walk(self, url, link='next'):
+        titles, pages = [], 0
+        while url:
+            data = self.client.get(url).json()
+            titles += [item['title'] for item in data['results']]
+            url = data[link]
+            pages += 1
+        return titles, pages, data
+
+    def test_round_trip_by_id(self):
+        titles, pages, last = self.walk('/api/tours/season/?page_size=3')
+        self.assertEqual(titles, [tour.title for tour in reversed(self.tours)])
+        self.assertEqual(pages, 3)
+        # Назад от последней страницы — те же строки в том же порядке
+        back, _, _ = self.walk(last['previous'], link='previous')
+        self.assertEqual(back, titles[3:6] + titles[:3])
+
+    def test_round_trip_by_price_with_ties(self):
+        expected = [tour.title for tour in sorted(self.tours, key=lambda tour: (tour.price, tour.pk))]
+        for page_size in (1, 2, 3, 4):
+            with self.subTest(page_size=page_size):
+                titles, _, last = self.walk(f'/api/tours/season/?ordering=price&page_size={page_size}')
+                self.assertEqual(titles, expected)
+                back, _, _ = self.walk(last['previous'], link='previous') if last['previous'] else ([], 0, None)
+                self.assertEqual(sorted(back), sorted(expected[:len(expected) - len(last['results'])]))
+        titles, _, _ = self.walk('/api/tours/season/?ordering=-price&page_size=2')
+        self.assertEqual(titles, [tour.title for tour in sorted(self.tours, key=lambda tour: (-tour.price, -tour.pk))])
+
+    def test_ties_are_paged_without_offset(self):
+        cache.clear()
+        first = self.client.get('/api/tours/season/?ordering=price&page_size=2').json()
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first['next']).json()
+        self.assertEqual([item['title'] for item in second['results']], ['Тур 3', 'Тур 6'])
+        page_query = next(query['sql'] for query in queries if 'ORDER BY' in query['sql'])
+        self.assertNotIn('OFFSET', page_query)
+
+    def test_page_does_not_shift_after_insert(self):
+        first = self.client.get('/api/tours/season/?page_size=3').json()
+        create_tour(title='Новый')
+        second = self.client.get(first['next']).json()
+        self.assertEqual([item['title'] for item in second['results']],
+                         [tour.title for tour in reversed(self.tours)][3:6])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/tours/season/?cursor=bad').status_code, 404)
+
+
+class TourDatesSummaryTests(TestCase):
+    def setUp(self):
+        self.tour = create_tour()
+        self.today = date.today()
+
+    def summary(self):
+        return tuple(Tour.objects.filter(pk=self.tour.pk).values_list(
+            'season_mask', 'next_start_date', 'last_start_date')[0])
+
+    def test_summary_follows_date_changes(self):
+        bits = DateTour.SEASON_BITS
+        summer = create_date(season='summer', start_date=self.today + timedelta(days=10),
+                             end_date=self.today + timedelta(days=12))
+        winter = create_date(season='winter', start_date=self.today - timedelta(days=10),
+                             end_date=self.today - timedelta(days=8))
+        self.tour.date_tour.add(summer, winter)
+        in_ten_days = self.today + timedelta(days=10)
+        self.assertEqual(self.summary(), (bits['summer'] | bits['winter'], in_ten_days, in_ten_days))
+
+        autumn = create_date(season='autumn', start_date=self.today + timedelta(days=40),
+                             end_date=self.today + timedelta(days=42))
+        autumn.tours.add(self.tour)
+        self.assertEqual(self.summary(), (bits['summer'] | bits['winter'] | bits['autumn'], in_ten_days,
+                                          self.today + timedelta(days=40)))
+
+        summer.season = 'spring'
+        summer.save()
+        self.assertEqual(self.summary()[0], bits['spring'] | bits['winter'] | bits['autumn'])
+
+        # Полное сохранение тура, загруженного раньше, не затирает сводку
+        stale = Tour.objects.get(pk=self.tour.pk)
+        winter.delete()
+        stale.title = 'Новое название'
+        stale.save()
+        self.assertEqual(self.summary()[0], bits['spring'] | bits['autumn'])
+
+        self.tour.date_tour.remove(summer)
+        self.assertEqual(self.summary(), (bits['autumn'], self.today + timedelta(days=40),
+                                          self.today + timedelta(days=40)))
+        self.tour.date_tour.clear()
+        self.assertEqual(self.summary(), (0, None, None))
+
+    def test_season_filter_and_upcoming(self):
+        past = create_tour(title='Прошедший')
+        past.date_tour.add(create_date(season='winter', start_date=self.today - timedelta(days=5),
+                                       end_date=self.today - timedelta(days=3)))
+        self.tour.date_tour.add(create_date(season='winter'))
+        titles = {item['title'] for item in self.client.get('/api/tours/season/?season=winter').json()['results']}
+        self.assertEqual(titles, {self.tour.title, past.title})
+        titles = {item['title'] for item in self.client.get('/api/tours/season/?upcoming=1').json()['results']}
+        self.assertEqual(titles, {self.tour.title})
+        self.assertEqual(self.client.get('/api/tours/season/?season=monsoon').status_code, 400)
+
+    def test_refresh_moves_next_date_forward(self):
+        soon, later = self.today + timedelta(days=1), self.today + timedelta(days=20)
+        for start in (soon, later):
+            self.tour.date_tour.add(create_date(start_date=start, end_date=start + timedelta(days=2)))
+        self.assertEqual(self.summary()[1], soon)
+
+        refresh_tour_dates([self.tour.pk], today=self.today + timedelta(days=2))
+        self.assertEqual(self.summary()[1:], (later, later))
+        refresh_tour_dates([self.tour.pk], today=self.today + timedelta(days=30))
+        self.assertEqual(self.summary()[1:], (None, None))
+
+        # Команда пересчитывает только туры, чья ближайшая дата уже прошла
+        Tour.objects.filter(pk=self.tour.pk).update(next_start_date=self.today - timedelta(days=1))
+        call_command('refresh_tour_dates', stdout=StringIO())
+        self.assertEqual(self.summary()[1], soon)
+
+
+class ImageVariantsTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        cache.clear()
+
+    def test_availability_is_cached(self):
+        image = TourImage(image='tours_images/photo.jpg')
+        storage = image.image.storage
+        with mock.patch.object(storage, 'exists', return_value=False) as exists:
+            self.assertEqual(list(variant_urls(image.image)), ['original'])
+            self.assertEqual(list(variant_urls(image.image)), ['original'])
+        self.assertEqual(exists.call_count, 1)
+
+        # После генерации отметка ставится без обращения к хранилищу
+        mark_variants_ready(image.image.name)
+        with mock.patch.object(storage, 'exists') as exists:
+            urls = variant_urls(image.image)
+        exists.assert_not_called()
+        self.assertEqual(urls['card']['webp'], storage.url('tours_images/photo.card.webp'))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.first = create_tour(title='Первый')
+        self.second = create_tour(title='Второй')
+        self.image = TourImage.objects.create(image='tours_images/photo.jpg')
+        self.dates = create_date()
+        self.first.images.add(self.image)
+        self.first.date_tour.add(self.dates)
+        self.long_ago = timezone.now() - timedelta(days=365)
+
+    def etag(self, tour):
+        return self.client.get(f'/api/tours/{tour.pk}/').headers['ETag']
+
+    def assertTouchedOnlyFirst(self, change):
+        Tour.objects.update(updated_date=self.long_ago)
+        etags = {tour.pk: self.etag(tour) for tour in (self.first, self.second)}
+        change()
+        self.assertNotEqual(self.etag(self.first), etags[self.first.pk])
+        self.assertEqual(self.etag(self.second), etags[self.second.pk])
+        self.assertEqual(Tour.objects.get(pk=self.second.pk).updated_date, self.long_ago)
+
+    def test_related_changes_touch_only_their_tours(self):
+        self.assertTouchedOnlyFirst(lambda: self.dates.save())
+        self.assertTouchedOnlyFirst(lambda: self.image.save())
+        self.assertTouchedOnlyFirst(lambda: self.image.tours.clear())
+        self.assertTouchedOnlyFirst(lambda: self.first.images.add(self.image))
+        self.assertTouchedOnlyFirst(lambda: self.dates.delete())
+
+        # Клиент с прежним ETag получает 304, пока тур не менялся
+        etag = self.etag(self.first)
+        response = self.client.get(f'/api/tours/{self.first.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class AsyncParityTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(title='Mountains', description='')
+        region = RegionTour.objects.create(title='Issyk-Kul', description='Озеро', image='images/lake.jpg')
+        self.tours = [create_tour(title=f'Тур в горы {number}', price=Decimal(100 + number)) for number in range(3)]
+        image = TourImage.objects.create(image='tours_images/photo.jpg')
+        for tour in self.tours:
+            tour.category.add(category)
+            tour.region.add(region)
+            tour.images.add(image)
+            tour.date_tour.add(create_date())
+        root = Feedback.objects.create(tour=self.tours[0], user_name='Айбек', comment='Отлично')
+        Feedback.objects.create(tour=self.tours[0], parent=root, user_name='Гид', comment='Спасибо')
+        self.banner = Banner.objects.create(title='Лето', banner_image='banners/summer.jpg')
+        self.region = region
+        self.root = root
+
+    def assertSameResponse(self, path):
+        sync = self.client.get(f'/api{path}')
+        async_ = self.client.get(f'/api/async{path}')
+        self.assertEqual(sync.status_code, 200, path)
+        self.assertEqual(async_.status_code, 200, path)
+        # Ссылки курсора отличаются только префиксом пути
+        self.assertEqual(async_.content.decode().replace('/api/async/', '/api/'), sync.content.decode(), path)
+
+    def test_async_views_match_sync_views(self):
+        paths = [
+            '/tours/',
+            '/tours/?limit=2',
+            '/tours/?ordering=-price&price_min=101',
+            '/tours/season/?season=summer',
+            '/tours/season/?ordering=price&price_max=101',
+            '/tours/search/?search=горы',
+            '/tours/search/?search=горы&ordering=-price',
+            f'/tours/search/?category={self.tours[0].category.get().pk}&facets=0',
+            f'/tours/{self.tours[0].pk}/',
+            '/feedbacks/',
+            f'/feedbacks/{self.root.pk}/',
+            '/banners/',
+            f'/banners/{self.banner.pk}/',
+            '/regions/',
+            f'/regions/{self.region.pk}/',
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertSameResponse(path)
+
+        # Следующая страница по ссылке курсора тоже совпадает
+        next_url = self.client.get('/api/tours/season/?ordering=price&page_size=2').json()['next']
+        self.assertSameResponse(next_url.split('/api', 1)[1])
+
+
+class ImportToursTests(TestCase):
+    HEADER = 'title,description,route_tour,duration,price,participants_price,max_participants,category,region,date_tour,images'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.region = RegionTour.objects.create(title='Issyk-Kul', description='', slug='issyk-kul')
+
+    def write(self, *rows):
+        path = self.directory / 'tours.csv'
+        path.write_text('\n'.join([self.HEADER, *rows]) + '\n', encoding='utf-8')
+        return str(path)
+
+    def run_import(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_tours', path, *args, stdout=stdout, stderr=stderr)
+        return stderr.getvalue()
+
+    def test_imports_tours_with_relations(self):
+        dates = '2030-06-01:2030-06-05:group:summer|2030-12-01:2030-12-03:individual:winter'
+        path = self.write(
+            f'Ала-Арча,Описание,Бишкек,3,100,50,10,Горы|Hiking,Issyk Kul,{dates},tours_images/a.jpg',
+            f'Сон-Куль,Описание,Нарын,2,200,80,8,горы,Naryn,{dates},tours_images/a.jpg|tours_images/b.jpg',
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.run_import(path)
+
+        # «Issyk Kul» совпадает с существующим регионом по slug, а не создаёт дубль
+        self.assertEqual(RegionTour.objects.count(), 2)
+        self.assertEqual(set(Category.objects.values_list('slug', flat=True)), {'горы', 'hiking'})
+        self.assertEqual(DateTour.objects.count(), 2)
+        first, second = Tour.objects.order_by('pk')
+        self.assertEqual(list(first.region.all()), [self.region])
+        self.assertEqual(first.category.count(), 2)
+        self.assertEqual(second.images.count(), 2)
+        self.assertEqual(first.season_mask, second.season_mask)
+
+        # Связи каждого вида пишутся одним INSERT на пачку
+        for table in ('tour_tour_category', 'tour_tour_region', 'tour_tour_date_tour', 'tour_tour_images'):
+            inserts = [query for query in queries if query['sql'].startswith(f'INSERT INTO "{table}"')]
+            self.assertEqual(len(inserts), 1, table)
+
+    def test_discount_window_without_offset(self):
+        header = f'{self.HEADER},discount_price,discount_start_date,discount_end_date'
+        path = self.directory / 'discounts.csv'
+        path.write_text(f'{header}\nАла-Арча,Описание,Бишкек,3,100,50,10,,,,,80,2000-01-01T00:00,2100-01-01 00:00\n',
+                        encoding='utf-8')
+        self.run_import(str(path))
+        tour = Tour.objects.get()
+        self.assertTrue(timezone.is_aware(tour.discount_start_date))
+        self.assertEqual(tour.effective_price, Decimal('80'))
+
+    def test_invalid_json_lines(self):
+        record = {'title': 'Каракол', 'description': 'Описание', 'route_tour': 'Каракол', 'duration': 2,
+                  'price': 200, 'participants_price': 80, 'max_participants': 8}
+        path = self.directory / 'tours.jsonl'
+        path.write_text('\n'.join(['{"title": ', '[1]', '"x"', json.dumps(record, ensure_ascii=False)]) + '\n',
+                        encoding='utf-8')
+        with self.assertRaisesMessage(CommandError, 'Запись 1: некорректный JSON'):
+            self.run_import(str(path), '--offset', '0')
+
+        stderr = self.run_import(str(path), '--offset', '0', '--skip-invalid')
+        self.assertIn('Запись 2: ожидается объект JSON', stderr)
+        self.assertIn('Запись 3: ожидается объект JSON', stderr)
+        self.assertEqual(list(Tour.objects.values_list('title', flat=True)), ['Каракол'])
+
+    def test_updates_statistics_totals(self):
+        path = self.directory / 'published.csv'
+        path.write_text(f'{self.HEADER},is_published\n'
+                        'Ала-Арча,Описание,Бишкек,3,100,50,10,,,,,да\n'
+                        'Сон-Куль,Описание,Нарын,2,200,80,8,,,,,\n', encoding='utf-8')
+        self.run_import(str(path))
+        totals = dict(StatTotal.objects.values_list('name', 'count'))
+        self.assertEqual((totals['tours'], totals['published_tours']), (2, 1))
+
+    def test_invalid_records(self):
+        path = self.write(
+            'Ала-Арча,Описание,Бишкек,три,100,50,10,,,,',
+            'Сон-Куль,Описание,Нарын,2,200,80,8,,,2030-06-05:2030-06-01:group:summer,',
+            'Каракол,Описание,Каракол,2,200,80,8,,,,',
+        )
+        with self.assertRaisesMessage(CommandError, 'Запись 1'):
+            self.run_import(path, '--offset', '0')
+        self.assertFalse(Tour.objects.exists())
+
+        stderr = self.run_import(path, '--offset', '0', '--skip-invalid')
+        self.assertIn('Запись 2: date_tour: дата окончания раньше даты начала', stderr)
+        self.assertEqual(list(Tour.objects.values_list('title', flat=True)), ['Каракол'])
+
+        path = self.write('Ала-Арча,Описание,Бишкек,3,100,50,10,,Неизвестный,,')
+        with self.assertRaisesMessage(CommandError, 'не найден'):
+            self.run_import(path, '--no-create', '--offset', '0')
+        path = self.write('Ала-Арча,Описание,Бишкек,3,100,50,10,,!!!,,')
+        with self.assertRaisesMessage(CommandError, 'slug'):
+            self.run_import(path, '--offset', '0')
+
+
+class SeatInventoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('user@example.com', 'user', 'password')
+        self.tour = create_tour(max_participants=5)
+        self.date = create_date()
+        self.tour.date_tour.add(self.date)
+
+    def inventory(self):
+        return TourInventory.objects.get(tour=self.tour, date=self.date)
+
+    def test_reserve_and_reject_when_full(self):
+        reserve_seats(self.tour, self.date, self.user, 3)
+        with self.assertRaises(SeatsUnavailable):
+            reserve_seats(self.tour, self.date, self.user, 3)
+        reserve_seats(self.tour, self.date, self.user, 2)
+        self.assertEqual(self.inventory().reserved, 5)
+
+    def test_confirm_keeps_seats_and_booking_delete_returns_them(self):
+        hold = reserve_seats(self.tour, self.date, self.user, 2)
+        booking = confirm_hold(hold)
+        self.assertEqual(booking.participants, 2)
+        self.assertEqual(booking.total_price, Decimal('100.00'))
+        self.assertEqual(self.inventory().reserved, 2)
+
+        booking.delete()
+        self.assertEqual(self.inventory().reserved, 0)
+
+    def test_release_is_idempotent(self):
+        hold = reserve_seats(self.tour, self.date, self.user, 4)
+        self.assertTrue(release_hold(hold))
+        self.assertFalse(release_hold(hold))
+        self.assertEqual(self.inventory().reserved, 0)
+
+    def test_api_cannot_release_confirmed_hold(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        confirmed = reserve_seats(self.tour, self.date, self.user, 3)
+        booking = confirm_hold(confirmed)
+        response = client.delete(f'/api/holds/{confirmed.pk}/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.inventory().reserved, 3)
+        with self.assertRaises(SeatsUnavailable):
+            reserve_seats(self.tour, self.date, self.user, 3)
+
+        held = reserve_seats(self.tour, self.date, self.user, 2)
+        self.assertEqual(client.delete(f'/api/holds/{held.pk}/').status_code, 204)
+        self.assertEqual(client.delete(f'/api/holds/{held.pk}/').status_code, 204)
+        self.assertEqual(self.inventory().reserved, 3)
+
+        # Места подтверждённого удержания возвращает только отмена бронирования
+        booking.status = REJECTED_BOOKING
+        booking.save()
+        self.assertEqual(self.inventory().reserved, 0)
+
+    def test_expire_holds_in_batches(self):
+        for _ in range(5):
+            reserve_seats(self.tour, self.date, self.user, 1, ttl=timedelta(seconds=-1))
+        self.assertEqual(expire_holds(batch_size=2), 5)
+        self.assertEqual(self.inventory().reserved, 0)
+        self.assertFalse(SeatHold.objects.filter(status=SeatHold.HELD).exists())
+
+    def test_expire_skips_holds_released_concurrently(self):
+        holds = [reserve_seats(self.tour, self.date, self.user, 2, ttl=timedelta(seconds=-1)) for _ in range(2)]
+
+        def release_after_select(now, batch_size):
+            batch, _ = _stale_holds(now, batch_size)
+            # Пользователь отменяет удержание между SELECT и UPDATE в базе без skip_locked
+            release_hold(holds[0])
+            return batch, False
+
+        with mock.patch('tour.inventory._stale_holds', release_after_select):
+            self.assertEqual(expire_holds(), 1)
+        self.assertEqual(self.inventory().reserved, 0)
+        self.assertEqual(SeatHold.objects.get(pk=holds[0].pk).status, SeatHold.RELEASED)
+
+    def test_direct_booking_takes_seats(self):
+        Booking.objects.create(tour=self.tour, user=self.user, date=self.date, participants=5,
+                               total_price=Decimal('250.00'), status=1)
+        self.assertEqual(self.inventory().reserved, 5)
+        with self.assertRaises(SeatsUnavailable):
+            Booking.objects.create(tour=self.tour, user=self.user, date=self.date, participants=1,
+                                   total_price=Decimal('50.00'), status=1)
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class SeatInventoryConcurrencyTests(TransactionTestCase):
+    threads = 40
+    capacity = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user('user@example.com', 'user', 'password')
+        self.tour = create_tour(max_participants=self.capacity)
+        self.date = create_date()
+        self.tour.date_tour.add(self.date)
+
+    def test_concurrent_reservations_never_oversell(self):
+        barrier = threading.Barrier(self.threads)
+        results = []
+        lock = threading.Lock()
+
+        def book():
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        reserve_seats(self.tour, self.date, self.user, 1, ttl=timedelta(minutes=5))
+                        outcome = 'ok'
+                    except SeatsUnavailable:
+                        outcome = 'full'
+                    except OperationalError:
+                        # SQLite отвечает «database is locked» вместо ожидания — повторяем попытку
+                        continue
+                    with lock:
+                        results.append(outcome)
+                    return
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=book) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        inventory = TourInventory.objects.get(tour=self.tour, date=self.date)
+        self.assertEqual(results.count('ok'), self.capacity)
+        self.assertEqual(results.count('full'), self.threads - self.capacity)
+        self.assertEqual(inventory.reserved, self.capacity)
+        self.assertEqual(SeatHold.objects.filter(inventory=inventory).count(), self.capacity)
+
+
+class StatisticsRollupTests(TestCase):
+    """Сводки, поддерживаемые сигналами, должны совпадать с полным пересчётом."""
+
+    def snapshot(self):
+        stats = sorted(
+            row for row in BookingStat.objects.values_list(
+                'dimension', 'key', 'day', 'status', 'bookings', 'participants', 'revenue',
+            ) if row[4]
+        )
+        totals = sorted(row for row in StatTotal.objects.values_list('name', 'count', 'amount') if row[1] or row[2])
+        return stats, totals
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild_statistics()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_rollups_follow_changes(self):
+        user = User.objects.create_user('stats@example.com', 'stats', 'password')
+        region = RegionTour.objects.create(title='Issyk-Kul', description='')
+        other_region = RegionTour.objects.create(title='Naryn', description='')
+        tour = create_tour()
+        tour.region.add(region)
+        second = create_tour(is_published=False)
+        dates = create_date()
+        tour.date_tour.add(dates)
+        second.date_tour.add(dates)
+
+        booking = Booking.objects.create(tour=tour, user=user, date=dates, participants=2,
+                                         total_price=Decimal('200.00'), status=1)
+        Booking.objects.create(tour=second, user=user, date=dates, participants=1,
+                               total_price=Decimal('100.00'), status=2)
+        self.assertMatchesRebuild()
+
+        booking.status = 2
+        booking.participants = 3
+        booking.total_price = Decimal('300.00')
+        booking.save()
+        Booking.objects.get(pk=booking.pk).save()
+        second.is_published = True
+        second.save()
+        second.region.add(region, other_region)
+        region.tours.remove(tour)
+        self.assertMatchesRebuild()
+
+        tour.region.add(other_region)
+        other_region.tours.clear()
+        second.delete()
+        self.assertMatchesRebuild()
+
+        totals = dict(StatTotal.objects.values_list('name', 'count'))
+        self.assertEqual((totals['users'], totals['tours'], totals['published_tours']), (1, 1, 1))
+        user.delete()
+        self.assertMatchesRebuild()
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for number in range(3):
+            create_tour(title=f'Тур {number}').date_tour.add(create_date())
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/tours/')
+        self.assertEqual(response.status_code, 200)
+        names = [item.split(';')[0].strip() for item in response['Server-Timing'].split(',')]
+        self.assertEqual(names, ['db', 'view', 'render', 'total'])
+
+    def test_metrics_are_logged_at_debug_unless_slow(self):
+        with self.assertLogs('core.middleware', 'DEBUG') as logs:
+            self.client.get('/api/tours/')
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'])
+        self.assertIn('render_ms', logs.records[0].metrics)
+        with self.settings(REQUEST_METRICS_SLOW_MS=0), self.assertLogs('core.middleware', 'INFO') as logs:
+            self.client.get('/api/tours/')
+        self.assertEqual([record.levelname for record in logs.records], ['INFO'])
+
+    @override_settings(QUERY_BUDGETS={'TourListView': 1})
+    def test_query_budget_by_view_name(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/api/tours/')
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    def test_defaults(self):
+        databases, replicas = database_settings({}, Path('/srv/tir'))
+        self.assertEqual(replicas, [])
+        self.assertEqual(databases['default'], {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': Path('/srv/tir/db.sqlite3'),
+            'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True,
+        })
+
+    def test_primary_and_replicas_from_environment(self):
+        databases, replicas = database_settings({
+            'DATABASE_URL': 'postgres://tir:p%40ss@db:5433/tir?sslmode=require',
+            'DATABASE_REPLICA_URLS': 'sqlite:///replica.sqlite3, sqlite:////var/lib/tir/replica.sqlite3',
+            'DATABASE_CONN_MAX_AGE': '300',
+        }, Path('/srv/tir'))
+        self.assertEqual(replicas, ['replica_1', 'replica_2'])
+        self.assertEqual(databases['default'], {
+            'ENGINE': 'django.db.backends.postgresql', 'NAME': 'tir', 'USER': 'tir', 'PASSWORD': 'p@ss',
+            'HOST': 'db', 'PORT': '5433', 'OPTIONS': {'sslmode': 'require'},
+            'CONN_MAX_AGE': 300, 'CONN_HEALTH_CHECKS': True,
+        })
+        self.assertEqual(databases['replica_1']['NAME'], Path('/srv/tir/replica.sqlite3'))
+        self.assertEqual(databases['replica_2']['NAME'], '/var/lib/tir/replica.sqlite3')
+        self.assertEqual(databases['replica_2']['TEST'], {'MIRROR': 'default'})
+
+
+class CacheSettingsTests(SimpleTestCase):
+    def test_local_cache_by_default(self):
+        caches, shared = cache_settings({})
+        self.assertFalse(shared)
+        self.assertEqual(caches['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+    def test_shared_cache_from_environment(self):
+        caches, shared = cache_settings({'CACHE_URL': 'redis://:secret@cache:6379/1', 'CACHE_KEY_PREFIX': 'tir'})
+        self.assertTrue(shared)
+        self.assertEqual(caches['default'], {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://:secret@cache:6379/1', 'KEY_PREFIX': 'tir',
+        })
+        caches, shared = cache_settings({'CACHE_URL': 'memcached://cache1:11211,cache2:11211'})
+        self.assertTrue(shared)
+        self.assertEqual(caches['default']['LOCATION'], ['cache1:11211', 'cache2:11211'])
+        with self.assertRaises(CacheConfigError):
+            cache_settings({'CACHE_URL': 'mongodb://cache'})
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class DatabaseRoutingTests(SimpleTestCase):
+    def route(self, method, path, write=False, cookies=None, headers=None):
+        """Прогоняет запрос через ReplicaRoutingMiddleware; возвращает ответ и решения роутера для чтений."""
+        router, reads = ReplicaRouter(), []
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            reads.append(router.db_for_read(Tour))
+            if write:
+                self.assertEqual(router.db_for_write(Tour), 'default')
+                reads.append(router.db_for_read(Tour))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)(path, headers=headers)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(path)
+        middleware = ReplicaRoutingMiddleware(view)
+        return middleware(request), reads
+
+    def test_catalog_reads_use_replica_until_write(self):
+        response, reads = self.route('get', '/api/tours/', write=True)
+        self.assertEqual(reads, ['replica_1', None])
+        # Счётчики при просмотре не заставляют клиента читать из основной базы
+        self.assertNotIn(DATABASE_PIN_COOKIE, response.cookies)
+        self.assertEqual(self.route('get', '/api/async/tours/')[1], ['replica_1'])
+
+    def test_other_requests_use_primary(self):
+        self.assertEqual(self.route('get', '/api/tours/1/availability/')[1], [None])
+        self.assertEqual(self.route('post', '/api/tours/search/')[1], [None])
+        self.assertEqual(self.route('get', '/api/tours/', cookies={DATABASE_PIN_COOKIE: '1'})[1], [None])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.route('get', '/api/tours/')[1], [None])
+        # Вне HTTP-запроса (команды, фоновые задачи) чтения идут в основную базу
+        self.assertIsNone(ReplicaRouter().db_for_read(Tour))
+
+    def test_write_pins_client_to_primary(self):
+        response, _ = self.route('post', '/api/favorites/', write=True)
+        self.assertEqual(response.cookies[DATABASE_PIN_COOKIE]['max-age'], 5)
+        self.assertNotIn(DATABASE_PIN_COOKIE, self.route('post', '/api/favorites/')[0].cookies)
+
+    def test_write_pins_bearer_token_to_primary(self):
+        # Клиент с JWT с другого домена не отправляет cookie, закрепление идёт по заголовку
+        headers = {'Authorization': 'Bearer pin-test-token'}
+        self.assertEqual(self.route('get', '/api/tours/', headers=headers)[1], ['replica_1'])
+        self.route('post', '/api/favorites/', write=True, headers=headers)
+        self.assertEqual(self.route('get', '/api/tours/', headers=headers)[1], [None])
+        self.assertEqual(self.route('get', '/api/tours/', headers={'Authorization': 'Bearer other'})[1], ['replica_1'])
+
+    def test_migrations_skip_replicas(self):
+        router = ReplicaRouter()
+        self.assertIs(router.allow_migrate('replica_1', 'tour'), False)
+        self.assertIsNone(router.allow_migrate('default', 'tour'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaResponseCacheTests(TransactionTestCase):
+    def test_cache_miss_reads_primary(self):
+        # Алиаса replica_1 в тестовых DATABASES нет: чтение из реплики завершилось бы ошибкой.
+        # TransactionTestCase: внутри транзакции TestCase роутер и так читает из default
+        create_tour()
+        url = '/api/tours/'
+        cache.clear()
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(len(first.json()), 1)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+
+class SyntheticDataTests(TestCase):
+    def test_generated_data_is_consistent(self):
+        sizes = SyntheticSizes(users=5, banners=1, categories=2, regions=2, dates=4, tours=6, ratings=10,
+                               favorites=5, feedback_threads=2, feedback_replies=2, feedback_depth=3, bookings=8)
+        counts = SyntheticDataGenerator(seed=7, sizes=sizes).generate()
+        self.assertEqual(counts['tours'], 6)
+        self.assertEqual(counts['feedback'], 2 + 4 + 8)
+
+        root = Feedback.objects.filter(depth=0).order_by('pk').first()
+        self.assertEqual(root.reply_count, 6)
+        self.assertEqual(Feedback.objects.filter(path__startswith=root.path).count(), 7)
+        tour = Tour.objects.filter(rating_count__gt=0).first()
+        self.assertEqual(tour.rating_count, tour.ratings.count())
+        self.assertEqual(StatTotal.objects.get(name='tours').count, Tour.objects.count())
+
+
+class QueryBudgetMixin:
+    """Проверяет, что количество запросов эндпоинта не растёт вместе с данными.
+
+    Запрос выполняется дважды: на небольшом синтетическом наборе и после добавления второго,
+    в несколько раз большего. Кэши очищаются перед каждым замером, поэтому считаются запросы
+    холодного ответа. Количество должно совпасть на обоих наборах и с ожидаемым значением.
+    """
+    DATASETS = (
+        SyntheticSizes(users=5, banners=2, categories=3, regions=2, dates=6, tours=8, ratings=20, favorites=10,
+                       feedback_threads=3, feedback_replies=2, feedback_depth=2, bookings=12),
+        SyntheticSizes(users=20, banners=8, categories=12, regions=8, dates=24, tours=32, ratings=80,
+                       favorites=40, feedback_threads=12, feedback_replies=2, feedback_depth=4, bookings=48),
+    )
+
+    def assertQueryBudget(self, url, expected, user=None):
+        """url и user — значения или функции, которые вызываются после создания каждого набора."""
+        counts = []
+        for seed, sizes in enumerate(self.DATASETS, start=1):
+            SyntheticDataGenerator(seed=seed, sizes=sizes).generate()
+            cache.clear()
+            local_users.clear()
+            client = APIClient()
+            account = user() if callable(user) else user
+            if account is not None:
+                client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(account)}')
+            path = url() if callable(url) else url
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path)
+            self.assertEqual(response.status_code, 200, path)
+            counts.append((len(queries), [query['sql'] for query in queries]))
+
+        (small, small_sql), (large, large_sql) = counts
+        self.assertEqual(small, large, f'{path}: количество запросов растёт с данными\n' + '\n'.join(large_sql))
+        self.assertEqual(large, expected, f'{path}: ожидалось {expected} запросов\n' + '\n'.join(large_sql))
+
+
+def published_tour_url(suffix=''):
+    def url():
+        # Тур с наибольшим количеством дат — худший случай для вложенных сериализаторов
+        tour = Tour.objects.filter(is_published=True).annotate(dates=Count('date_tour')).order_by('-dates', 'pk')[0]
+        return f'{suffix}/tours/{tour.pk}/'
+    return url
+
+
+def largest_thread_url(prefix):
+    return lambda: f'{prefix}/feedbacks/{Feedback.objects.filter(depth=0).order_by("-reply_count", "pk")[0].pk}/'
+
+
+def first_url(prefix, model, name):
+    return lambda: f'{prefix}/{name}/{model.objects.order_by("pk")[0].pk}/'
+
+
+def similar_tour_url():
+    SimilarityBuilder().build()
+    return f'/api/tours/{SimilarTour.objects.order_by("tour_id")[0].tour_id}/similar/'
+
+
+def busiest_favorite_user():
+    return User.objects.annotate(count=Count('favorite_tours')).order_by('-count', 'pk')[0]
+
+
+# Просмотры копятся в буфере и не сбрасываются в БД во время замеров
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_tour_list(self):
+        self.assertQueryBudget('/api/tours/', 4)
+
+    def test_tour_season(self):
+        self.assertQueryBudget('/api/tours/season/?season=summer', 3)
+
+    def test_tour_search(self):
+        # Поиск, туры страницы, две предзагрузки и один запрос на все фасеты
+        self.assertQueryBudget('/api/tours/search/?search=горы', 6)
+
+    def test_tour_list_by_price(self):
+        self.assertQueryBudget('/api/tours/?ordering=price&price_min=100', 3)
+
+    def test_tour_search_by_price(self):
+        self.assertQueryBudget('/api/tours/search/?search=горы&ordering=-price', 4)
+
+    def test_region_landing(self):
+        # Регион, страница туров и две предзагрузки
+        busiest = lambda: RegionTour.objects.annotate(count=Count('tours')).order_by('-count', 'pk')[0].slug
+        self.assertQueryBudget(lambda: f'/api/regions/{busiest()}/landing/', 4)
+
+    def test_favorites(self):
+        # Пользователь, страница туров и две предзагрузки; отметки — пользователь и множество избранного
+        self.assertQueryBudget('/api/favorites/', 4, user=busiest_favorite_user)
+
+    def test_favorite_status(self):
+        self.assertQueryBudget(lambda: f'/api/favorites/status/?ids={",".join(map(str, range(1, 101)))}', 2,
+                               user=busiest_favorite_user)
+
+    def test_tour_similar(self):
+        self.assertQueryBudget(similar_tour_url, 1)
+
+    def test_tour_detail(self):
+        self.assertQueryBudget(published_tour_url('/api'), 4)
+
+    def test_tour_trending(self):
+        self.assertQueryBudget('/api/tours/trending/?limit=20', 3)
+
+    def test_tour_availability(self):
+        self.assertQueryBudget(lambda: published_tour_url('/api')() + 'availability/', 4)
+
+    def test_feedback_list(self):
+        self.assertQueryBudget('/api/feedbacks/', 2)
+
+    def test_feedback_thread(self):
+        self.assertQueryBudget(largest_thread_url('/api'), 2)
+
+    def test_banner_list(self):
+        self.assertQueryBudget('/api/banners/', 1)
+
+    def test_banner_detail(self):
+        self.assertQueryBudget(first_url('/api', Banner, 'banners'), 2)
+
+    def test_region_list(self):
+        self.assertQueryBudget('/api/regions/', 1)
+
+    def test_region_detail(self):
+        self.assertQueryBudget(first_url('/api', RegionTour, 'regions'), 2)
+
+    def test_async_endpoints(self):
+        endpoints = [
+            ('/api/async/tours/', 4),
+            ('/api/async/tours/season/?season=summer', 3),
+            ('/api/async/tours/search/?search=горы', 6),
+            (published_tour_url('/api/async'), 3),
+            ('/api/async/feedbacks/', 2),
+            (largest_thread_url('/api/async'), 2),
+            ('/api/async/banners/', 1),
+            (first_url('/api/async', Banner, 'banners'), 1),
+            ('/api/async/regions/', 1),
+            (first_url('/api/async', RegionTour, 'regions'), 1),
+        ]
+        for url, expected in endpoints:
+            with self.subTest(url=url), transaction.atomic():
+                self.assertQueryBudget(url, expected)
+                transaction.set_rollback(True)
+
+
+class SearchTests(TestCase):
+    def test_stemmed_match_and_escaped_snippet(self):
+        create_tour(title='Озеро', description='<script>alert(1)</script> Поход по тоолордо & <i>ущельям</i>')
+        create_tour(title='Город', description='Экскурсия по городу')
+        self.assertEqual(stem('тоолордо'), 'тоолор')
+
+        results = self.client.get('/api/tours/search/?search=тоолор').json()['results']
+        self.assertEqual([item['title'] for item in results], ['Озеро'])
+        snippet = results[0]['snippet']
+        self.assertNotIn('<script>', snippet)
+        self.assertNotIn('<i>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertIn('&amp;', snippet)
+        self.assertIn('<b>тоолордо</b>', snippet)
+
+    def test_highlight_escapes_text_before_marking(self):
+        self.assertEqual(highlight('a<b>\x02горы\x03</b>'), 'a&lt;b&gt;<b>горы</b>&lt;/b&gt;')
+        self.assertIsNone(highlight(None))
+
+
+class FacetedSearchTests(TestCase):
+    def setUp(self):
+        SyntheticDataGenerator(seed=5, sizes=SyntheticSizes(
+            users=3, banners=0, categories=4, regions=3, dates=8, tours=40, ratings=0, favorites=0,
+            feedback_threads=0, bookings=0,
+        )).generate()
+
+    def expected_counts(self, tours):
+        counts = {'category': {}, 'region': {}, 'season': {}, 'tour_type': {}}
+        for tour in tours:
+            for category in tour.category.all():
+                counts['category'][category.pk] = counts['category'].get(category.pk, 0) + 1
+            for region in tour.region.all():
+                counts['region'][region.pk] = counts['region'].get(region.pk, 0) + 1
+            for name, values in (('season', {date.season for date in tour.date_tour.all()}),
+                                 ('tour_type', {date.tour_type for date in tour.date_tour.all()})):
+                for value in values:
+                    counts[name][value] = counts[name].get(value, 0) + 1
+        return counts
+
+    def test_facets_match_filtered_tours(self):
+        category = Category.objects.order_by('pk').first()
+        response = self.client.get(f'/api/tours/search/?category={category.pk}&tour_type=group&page_size=100')
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()['facets']
+
+        tours = Tour.objects.prefetch_related('category', 'region', 'date_tour')
+        group_tours = [tour for tour in tours if any(date.tour_type == 'group' for date in tour.date_tour.all())]
+        in_category = [tour for tour in tours if category in tour.category.all()]
+        both = [tour for tour in group_tours if tour in in_category]
+        self.assertEqual(len(response.json()['results']), len(both))
+
+        # Фасет не фильтруется собственным значением: категории считаются по турам с group, типы — по категории
+        self.assertEqual({item['id']: item['count'] for item in facets['category']},
+                         self.expected_counts(group_tours)['category'])
+        self.assertEqual({item['value']: item['count'] for item in facets['tour_type']},
+                         self.expected_counts(in_category)['tour_type'])
+        self.assertEqual({item['value']: item['count'] for item in facets['season']},
+                         self.expected_counts(both)['season'])
+        self.assertEqual(sum(item['count'] for item in facets['price']), len(both))
+        self.assertTrue(next(item for item in facets['category'] if item['id'] == category.pk)['selected'])
+
+    def test_search_respects_filters(self):
+        response = self.client.get('/api/tours/search/?search=горы&price_max=500&page_size=100')
+        prices = [Decimal(item['effective_price']) for item in response.json()['results']]
+        self.assertTrue(prices)
+        self.assertTrue(all(price <= 500 for price in prices))
+        self.assertNotIn('facets', self.client.get('/api/tours/search/?search=горы&facets=0').json())
+
+
+class EffectivePriceTests(TestCase):
+    def test_price_follows_discount_window(self):
+        now = timezone.now()
+        start, end = now + timedelta(hours=1), now + timedelta(hours=2)
+        tour = create_tour(discount_price=Decimal('80.00'), discount_start_date=start, discount_end_date=end)
+        self.assertEqual(tour.effective_price, Decimal('100.00'))
+        always = create_tour(discount_price=Decimal('70.00'))
+        self.assertEqual(always.effective_price, Decimal('70.00'))
+
+        clock = [now]
+        scheduler = PriceScheduler(max_sleep=24 * 3600, clock=lambda: clock[0])
+        self.assertEqual(scheduler.run_once(), 0)
+        # Планировщик спит ровно до начала скидки
+        self.assertEqual(scheduler.seconds_until_next(), 3600)
+
+        clock[0] = start
+        self.assertEqual(scheduler.run_once(), 1)
+        tour.refresh_from_db()
+        self.assertEqual(tour.effective_price, Decimal('80.00'))
+        self.assertEqual(scheduler.seconds_until_next(), 3600)
+
+        clock[0] = end + timedelta(seconds=1)
+        self.assertEqual(scheduler.run_once(), 1)
+        tour.refresh_from_db()
+        self.assertEqual(tour.effective_price, Decimal('100.00'))
+        self.assertEqual(scheduler.seconds_until_next(), 24 * 3600)
+
+        tour.price = Decimal('120.00')
+        tour.save(update_fields=['price'])
+        tour.refresh_from_db()
+        self.assertEqual(tour.effective_price, Decimal('120.00'))
+
+    def test_filter_and_sort_by_effective_price(self):
+        cheap = create_tour(title='Дешёвый', price=Decimal('300.00'), discount_price=Decimal('90.00'))
+        middle = create_tour(title='Средний', price=Decimal('150.00'))
+        create_tour(title='Дорогой', price=Decimal('900.00'))
+        create_tour(title='Черновик', price=Decimal('120.00'), is_published=False)
+
+        titles = [item['title'] for item in self.client.get('/api/tours/?ordering=price&limit=10').json()]
+        self.assertEqual(titles, ['Дешёвый', 'Средний', 'Дорогой'])
+        titles = [item['title'] for item in self.client.get('/api/tours/?price_max=200&limit=10').json()]
+        self.assertEqual(sorted(titles), sorted([cheap.title, middle.title]))
+
+        response = self.client.get('/api/tours/season/?ordering=-price&page_size=2')
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Дорогой', 'Средний'])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Дешёвый'])
+
+        response = self.client.get('/api/tours/search/?price_min=100&ordering=price&facets=0')
+        self.assertEqual([item['title'] for item in response.json()['results']], ['Черновик', 'Средний', 'Дорогой'])
+        self.assertEqual(self.client.get('/api/tours/?ordering=rating').status_code, 400)
+
+
+class RegionLandingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.region = RegionTour.objects.create(title='Issyk-Kul', description='Озеро', slug='issyk-kul')
+        self.other = RegionTour.objects.create(title='Naryn', description='Горы', slug='naryn')
+        self.top = create_tour(title='Лучший')
+        self.plain = create_tour(title='Без оценок')
+        self.draft = create_tour(title='Черновик', is_published=False)
+        for tour in (self.top, self.plain, self.draft):
+            tour.region.add(self.region)
+        create_tour(title='Другой регион').region.add(self.other)
+        Rating.objects.create(tour=self.top, user=User.objects.create_user('r@example.com', 'r', 'password'), score=5)
+
+    def test_landing_lists_published_tours_by_rating(self):
+        response = self.client.get('/api/regions/issyk-kul/landing/?page_size=1')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['region']['slug'], 'issyk-kul')
+        self.assertEqual([item['title'] for item in data['results']], ['Лучший'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([item['title'] for item in data['results']], ['Без оценок'])
+        self.assertIsNone(data['next'])
+        self.assertEqual(self.client.get('/api/regions/missing/landing/').status_code, 404)
+
+    def test_unrated_tours_are_paged_without_offset(self):
+        unrated = [self.plain]
+        for number in range(3):
+            tour = create_tour(title=f'Без оценок {number}')
+            tour.region.add(self.region)
+            unrated.append(tour)
+        url, titles = '/api/regions/issyk-kul/landing/?page_size=1', []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                data = self.client.get(url).json()
+                titles += [item['title'] for item in data['results']]
+                url = data['next']
+        self.assertEqual(titles, ['Лучший', *[tour.title for tour in reversed(unrated)]])
+        pages = [query['sql'] for query in queries if 'ORDER BY' in query['sql'] and '"tour_tour"."id"' in query['sql']]
+        self.assertTrue(pages)
+        self.assertFalse([sql for sql in pages if 'OFFSET' in sql])
+
+    def test_cache_is_invalidated_per_region(self):
+        self.client.get('/api/regions/issyk-kul/landing/')
+        self.client.get('/api/regions/naryn/landing/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/regions/issyk-kul/landing/')['X-Cache'], 'HIT')
+
+        self.plain.title = 'Переименован'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plain.save()
+        response = self.client.get('/api/regions/issyk-kul/landing/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Переименован', [item['title'] for item in response.json()['results']])
+        self.assertEqual(self.client.get('/api/regions/naryn/landing/')['X-Cache'], 'HIT')
+
+        self.draft.is_published = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.draft.save()
+        self.assertEqual(len(self.client.get('/api/regions/issyk-kul/landing/').json()['results']), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plain.region.remove(self.region)
+        self.assertEqual(len(self.client.get('/api/regions/issyk-kul/landing/').json()['results']), 2)
+
+    def test_related_changes_and_unicode_slugs(self):
+        lake = RegionTour.objects.create(title='Иссык-Куль', description='', slug='иссык-куль')
+        dates = create_date()
+        self.other.tours.get().date_tour.add(dates)
+        url = '/api/regions/иссык-куль/landing/'
+        self.assertEqual(self.client.get(url).json()['region']['slug'], 'иссык-куль')
+        self.client.get('/api/regions/naryn/landing/')
+        self.client.get('/api/regions/issyk-kul/landing/')
+
+        # Дата тура сдвигает версию только его региона
+        dates.end_date += timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            dates.save()
+        self.assertEqual(self.client.get('/api/regions/naryn/landing/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/regions/issyk-kul/landing/')['X-Cache'], 'HIT')
+
+        # Удалённый регион не отдаётся из кэша
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            lake.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class FavoritesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.user = User.objects.create_user('fav@example.com', 'fav', 'password')
+        self.tours = [create_tour(title=f'Тур {number}') for number in range(3)]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def status(self, *tours):
+        ids = ','.join(str(tour.pk) for tour in tours)
+        flags = self.client.get(f'/api/favorites/status/?ids={ids}').json()['favorites']
+        return {int(key): value for key, value in flags.items()}
+
+    def test_model_and_user_field_share_storage(self):
+        first, second, third = self.tours
+        FavoriteList.objects.create(user=self.user, tour=first)
+        self.user.favorite_tours.add(second)
+        self.assertEqual(set(self.user.favorite_tours.all()), {first, second})
+        self.assertEqual(self.status(first, second, third), {first.pk: True, second.pk: True, third.pk: False})
+
+        # После изменения множество сбрасывается и читается заново одним запросом, затем снова из кэша
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.favorite_tours.remove(first)
+            FavoriteList.objects.create(user=self.user, tour=third)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.status(first, second, third), {first.pk: False, second.pk: True, third.pk: True})
+        with self.assertNumQueries(0):
+            self.status(first)
+
+    def test_bulk_change(self):
+        first, second, third = self.tours
+        self.user.favorite_tours.add(third)
+        self.status(first)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/favorites/', {'add': [first.pk, second.pk, 999999], 'remove': [third.pk]},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['favorites'],
+                         {str(first.pk): True, str(second.pk): True, '999999': False, str(third.pk): False})
+        with self.assertNumQueries(1):
+            self.assertEqual(self.status(first, second, third), {first.pk: True, second.pk: True, third.pk: False})
+
+        titles = {item['title'] for item in self.client.get('/api/favorites/').json()['results']}
+        self.assertEqual(titles, {first.title, second.title})
+        response = self.client.post('/api/favorites/', {'add': [first.pk], 'remove': [first.pk]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/favorites/status/?ids=a').status_code, 400)
+
+
+class SimilarToursTests(TestCase):
+    def setUp(self):
+        SyntheticDataGenerator(seed=7, sizes=SyntheticSizes(
+            users=30, banners=0, categories=4, regions=3, dates=6, tours=25, ratings=150, favorites=80,
+            feedback_threads=0, bookings=60,
+        )).generate()
+
+    def brute_force_scores(self):
+        """Сходство всех пар опубликованных туров по полным векторам, без пачек и ограничений."""
+        weights = get_weights()
+        published = set(Tour.objects.filter(is_published=True).values_list('pk', flat=True))
+        vectors = {tour_id: {} for tour_id in published}
+
+        def add(rows, weight):
+            for tour_id, user_id, value in rows:
+                if tour_id in published:
+                    vectors[tour_id][user_id] = vectors[tour_id].get(user_id, 0) + value * weight
+
+        add(Rating.objects.values_list('tour_id', 'user_id', 'score'), weights['rating'])
+        add([(tour_id, user_id, 1) for tour_id, user_id in FavoriteList.objects.values_list('tour_id', 'user_id')],
+            weights['favorite'])
+        add([(tour_id, user_id, 1) for tour_id, user_id in Booking.objects.exclude(status=REJECTED_BOOKING).values_list(
+            'tour_id', 'user_id')], weights['booking'])
+        categories = {pk: set() for pk in published}
+        regions = {pk: set() for pk in published}
+        for tour in Tour.objects.filter(pk__in=published).prefetch_related('category', 'region'):
+            categories[tour.pk] = {category.pk for category in tour.category.all()}
+            regions[tour.pk] = {region.pk for region in tour.region.all()}
+
+        def jaccard(left, right):
+            return len(left & right) / len(left | right) if left and right else 0.0
+
+        def cosine(left, right):
+            dot = sum(value * right.get(user_id, 0) for user_id, value in left.items())
+            norm = (sum(v * v for v in left.values()) * sum(v * v for v in right.values())) ** 0.5
+            return dot / norm if norm else 0.0
+
+        return {
+            (tour_id, other): 0.75 * cosine(vectors[tour_id], vectors[other])
+            + 0.15 * jaccard(categories[tour_id], categories[other]) + 0.1 * jaccard(regions[tour_id], regions[other])
+            for tour_id in published for other in published if other != tour_id
+        }
+
+    def test_chunked_build_matches_brute_force(self):
+        result = SimilarityBuilder(top_k=5, chunk_size=4).build()
+        self.assertEqual(result['tours'], Tour.objects.filter(is_published=True).count())
+        rows = list(SimilarTour.objects.order_by('tour_id', 'rank').values_list('tour_id', 'similar_id', 'score'))
+
+        expected = self.brute_force_scores()
+        for tour_id, other, score in rows:
+            self.assertAlmostEqual(score, expected[(tour_id, other)], places=5)
+        for tour_id in {row[0] for row in rows}:
+            best = sorted((value for (left, _), value in expected.items() if left == tour_id), reverse=True)[:5]
+            stored = [score for left, _, score in rows if left == tour_id]
+            self.assertEqual(len(stored), len([value for value in best if value > 0]))
+            for stored_score, best_score in zip(stored, best):
+                self.assertAlmostEqual(stored_score, best_score, places=5)
+
+        # Размер пачки влияет только на расход памяти
+        SimilarityBuilder(top_k=5, chunk_size=1000).build()
+        self.assertEqual(rows, list(SimilarTour.objects.order_by('tour_id', 'rank').values_list(
+            'tour_id', 'similar_id', 'score')))
+
+    def test_user_items_are_capped(self):
+        tour_ids = np.array([10, 20, 30, 40])
+        matrix = sparse.csr_matrix(np.array([[1.0, 3.0, 3.0, 2.0], [0.0, 5.0, 0.0, 1.0]]))
+        capped = cap_user_items(matrix, tour_ids, 2).toarray()
+        # У первого пользователя остаются два самых весомых тура (при равенстве — меньший ID)
+        self.assertEqual(capped.tolist(), [[0.0, 3.0, 3.0, 0.0], [0.0, 5.0, 0.0, 1.0]])
+        self.assertEqual(cap_user_items(matrix, tour_ids, 1).toarray().tolist(),
+                         [[0.0, 3.0, 0.0, 0.0], [0.0, 5.0, 0.0, 0.0]])
+
+    def test_similar_endpoint(self):
+        SimilarityBuilder(top_k=3).build()
+        tour_id = SimilarTour.objects.order_by('tour_id')[0].tour_id
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/tours/{tour_id}/similar/')
+        results = response.json()
+        self.assertEqual(len(results), 3)
+        self.assertEqual([item['score'] for item in results], sorted((item['score'] for item in results), reverse=True))
+        self.assertNotIn(tour_id, [item['id'] for item in results])
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('trend@example.com', 'trend', 'password')
+        self.first, self.second = create_tour(title='Первый'), create_tour(title='Второй')
+        self.now = timezone.now()
+        view_buffer.drain()
+
+    def score(self, tour):
+        tour.refresh_from_db(fields=['trending_score'])
+        return current_score(tour.trending_score, self.now)
+
+    @override_settings(TRENDING_HALF_LIFE_HOURS=72, TRENDING_WEIGHTS={'booking': 3.0, 'rating': 1.0, 'view': 0.1})
+    def test_events_decay(self):
+        self.assertEqual(self.score(self.first), 0.0)
+        record_event([self.first.pk], BOOKING, when=self.now - timedelta(hours=72))
+        record_event([self.second.pk], RATING, when=self.now)
+        self.assertAlmostEqual(self.score(self.first), 1.5)
+        self.assertAlmostEqual(self.score(self.second), 1.0)
+
+        # Событие прибавляет слагаемое одним UPDATE, прежние события не перечитываются
+        with self.assertNumQueries(1):
+            record_event([self.first.pk, self.second.pk], VIEW, count=5, when=self.now)
+        self.assertAlmostEqual(self.score(self.first), 2.0)
+        self.assertAlmostEqual(self.score(self.second), 1.5)
+
+        # Через половину жизни без новых событий счёт уменьшается вдвое, порядок сохраняется
+        self.now += timedelta(hours=72)
+        self.assertAlmostEqual(self.score(self.first), 1.0)
+        self.assertAlmostEqual(self.score(self.second), 0.75)
+
+    def test_signals_match_rebuild(self):
+        dates = create_date()
+        self.first.date_tour.add(dates)
+        Booking.objects.create(tour=self.first, user=self.user, date=dates, participants=1,
+                               total_price=Decimal('100.00'), status=1)
+        Rating.objects.create(tour=self.second, user=self.user, score=4)
+        self.user.favorite_tours.add(self.first, self.second)
+        self.first.favorited_by_users.add(User.objects.create_user('other@example.com', 'other', 'password'))
+        incremental = {tour.pk: self.score(tour) for tour in (self.first, self.second)}
+        self.assertGreater(incremental[self.first.pk], incremental[self.second.pk])
+
+        rebuild_trending_scores()
+        for tour in (self.first, self.second):
+            self.assertAlmostEqual(self.score(tour), incremental[tour.pk], places=4)
+
+        # Сохранение объекта, загруженного до событий, не затирает счёт
+        stale = Tour.objects.get(pk=self.first.pk)
+        record_event([self.first.pk], RATING)
+        stale.title = 'Первый тур'
+        stale.save()
+        self.assertGreater(self.score(self.first), incremental[self.first.pk])
+
+    @override_settings(TRENDING_HALF_LIFE_HOURS=72, TRENDING_WEIGHTS={'view': 0.1})
+    def test_views_are_buffered(self):
+        for tour_id in (self.first.pk, self.first.pk, self.second.pk):
+            record_views([tour_id])
+        # Вклад просмотра считается по моменту просмотра, а не записи
+        view_buffer.add([self.second.pk], when=self.now - timedelta(hours=72))
+        self.assertIsNone(Tour.objects.get(pk=self.first.pk).trending_score)
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_views(), 2)
+        self.assertAlmostEqual(self.score(self.first), 0.2, places=4)
+        self.assertAlmostEqual(self.score(self.second), 0.15, places=4)
+        self.assertEqual(flush_views(), 0)
+
+    def test_flusher_starts_once_per_process(self):
+        buffer = ViewBuffer()
+        with mock.patch('tour.trending.threading.Thread') as thread, \
+                mock.patch('tour.trending.atexit.register') as register:
+            buffer.add([self.first.pk])
+            self.assertFalse(thread.called)
+            buffer.start()
+            buffer.start()
+            buffer.add([self.first.pk])
+            self.assertEqual(thread.call_count, 1)
+            register.assert_called_once_with(flush_views)
+            # В процессе, созданном fork, поток запускается заново
+            with mock.patch('tour.trending.os.getpid', return_value=-1):
+                buffer.add([self.first.pk])
+            self.assertEqual(thread.call_count, 2)
+
+    def test_trending_endpoint(self):
+        hidden = create_tour(title='Скрытый', is_published=False)
+        record_event([hidden.pk], BOOKING, count=10)
+        for _ in range(3):
+            self.assertEqual(self.client.get(f'/api/tours/{self.second.pk}/').status_code, 200)
+        etag = self.client.get(f'/api/tours/{self.second.pk}/').headers['ETag']
+        self.assertEqual(self.client.get(f'/api/tours/{self.second.pk}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        flush_views()
+
+        results = self.client.get('/api/tours/trending/').json()
+        self.assertEqual([item['title'] for item in results], ['Второй'])
+        self.assertAlmostEqual(results[0]['trending'], 0.5, places=3)
+
+        record_event([self.first.pk], BOOKING)
+        results = self.client.get('/api/tours/trending/?limit=1').json()
+        self.assertEqual([item['title'] for item in results], ['Первый'])
@@ -0,0 +1,213 @@
+"""Популярность «сейчас» (Tour.trending_score): сумма событий с экспоненциальным затуханием.
+
+Каждое событие (бронирование, оценка, добавление в избранное, просмотр страницы) весом w в
+момент t вносит w·2^(-(now - t) / half_life), то есть за TRENDING_HALF_LIFE_HOURS его вклад
+уменьшается вдвое. Затухание у всех туров одинаковое, поэтому вместо текущей суммы хранится
+её значение, приведённое к фиксированной эпохе EPOCH:
+
+    S = Σ w·2^((t - EPOCH) / half_life),   текущая сумма = S·2^(-(now - EPOCH) / half_life).
+
+Порядок туров по S совпадает с порядком по текущей сумме, и S не нужно периодически
+пересчитывать: событие только прибавляет своё слагаемое. Чтобы S не переполнялась со
+временем, в trending_score хранится log2(S), а прибавление выполняется в SQL одним UPDATE:
+
+    log2(2^a + 2^b) = max(a, b) + log2(1 + 2^(min(a, b) - max(a, b))).
+
+У туров без событий trending_score пустой.
+
+Просмотры не пишутся в БД в запросе страницы тура: они копятся в памяти процесса
+(view_buffer) вместе с моментом просмотра, поэтому вклад просмотра не зависит от времени
+записи. Фоновый поток процесса раз в TRENDING_VIEW_FLUSH_SECONDS пишет накопленное одним
+UPDATE на пачку туров, а при штатной остановке процесса буфер сбрасывается обработчиком atexit.
+Поток запускается в core/wsgi.py и core/asgi.py, то есть только в процессах веб-сервера;
+в тестах и командах накопленное записывает flush_views. Просмотры теряются только при
+аварийном завершении процесса — как и при rebuild_trending_scores.
+"""
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest, Least, Log, Power
+from django.utils import timezone
+
+from .inventory import REJECTED_BOOKING
+from .models import Tour
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+DEFAULT_HALF_LIFE_HOURS = 72
+DEFAULT_WEIGHTS = {'booking': 3.0, 'favorite': 2.0, 'rating': 1.0, 'view': 0.1}
+BOOKING, FAVORITE, RATING, VIEW = 'booking', 'favorite', 'rating', 'view'
+VIEW_BATCH_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+def get_half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', DEFAULT_HALF_LIFE_HOURS) * 3600
+
+
+def get_weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'TRENDING_WEIGHTS', {})}
+
+
+def event_exponent(event, count=1, when=None):
+    """log2 слагаемого события: log2(w·count) + (t - EPOCH) / half_life."""
+    when = when or timezone.now()
+    return math.log2(get_weights()[event] * count) + (when - EPOCH).total_seconds() / get_half_life()
+
+
+def current_score(stored, now=None):
+    """Текущая сумма с учётом затухания по значению trending_score."""
+    if stored is None:
+        return 0.0
+    now = now or timezone.now()
+    return 2 ** (stored - (now - EPOCH).total_seconds() / get_half_life())
+
+
+def log2_add(left, right):
+    """log2(2^left + 2^right) без переполнения."""
+    high, low = max(left, right), min(left, right)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def _add_expression(exponent):
+    # То же, что log2_add, в SQL; exponent — число или выражение
+    value = exponent if hasattr(exponent, 'resolve_expression') else Value(exponent, output_field=FloatField())
+    high, low = Greatest(F('trending_score'), value), Least(F('trending_score'), value)
+    return Case(
+        When(trending_score__isnull=True, then=value),
+        default=high + Log(Value(2.0), Value(1.0) + Power(Value(2.0), low - high)),
+        output_field=FloatField(),
+    )
+
+
+def record_event(tour_ids, event, count=1, when=None, using=None):
+    """Учитывает событие для туров одним UPDATE, без чтения и без пересчёта прежних событий."""
+    if not tour_ids or count <= 0:
+        return 0
+    expression = _add_expression(event_exponent(event, count, when))
+    return Tour.objects.using(using).filter(pk__in=tour_ids).update(trending_score=expression)
+
+
+class ViewBuffer:
+    """Просмотры туров, накопленные в памяти процесса. Потокобезопасен.
+
+    Для тура хранится Σ 2^((t - base) / half_life) по моментам просмотров t, где base — начало
+    накопления: при сбросе это даёт то же слагаемое, что и запись каждого просмотра сразу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sums, self._base = defaultdict(float), timezone.now()
+        self._started = False
+        self._flusher_pid = None
+
+    def add(self, tour_ids, when=None):
+        when = when or timezone.now()
+        with self._lock:
+            factor = 2 ** ((when - self._base).total_seconds() / get_half_life())
+            for tour_id in tour_ids:
+                self._sums[tour_id] += factor
+        if self._started and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def drain(self):
+        """Забирает накопленное: {ID тура: log2 слагаемого его просмотров} (см. event_exponent)."""
+        with self._lock:
+            sums, base = self._sums, self._base
+            self._sums, self._base = defaultdict(float), timezone.now()
+        offset = (base - EPOCH).total_seconds() / get_half_life()
+        weight = get_weights()[VIEW]
+        return {tour_id: math.log2(weight * total) + offset for tour_id, total in sums.items()}
+
+    def start(self):
+        """Запускает фоновую запись раз в TRENDING_VIEW_FLUSH_SECONDS и запись при выходе процесса."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        atexit.register(flush_views)
+        self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            # После fork (gunicorn --preload) поток родителя в дочернем процессе не работает
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._run, name='trending-views', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(getattr(settings, 'TRENDING_VIEW_FLUSH_SECONDS', 30))
+            try:
+                flush_views()
+            except Exception:
+                logger.exception('Не удалось записать просмотры туров')
+            finally:
+                # Соединения этого потока не закрывает обработчик конца запроса
+                connections.close_all()
+
+
+view_buffer = ViewBuffer()
+
+
+def write_views(exponents, using=None):
+    """exponents — {ID тура: log2 слагаемого}; одно UPDATE на VIEW_BATCH_SIZE туров."""
+    items = list(exponents.items())
+    for start in range(0, len(items), VIEW_BATCH_SIZE):
+        batch = items[start:start + VIEW_BATCH_SIZE]
+        exponent = Case(
+            *[When(pk=tour_id, then=Value(value)) for tour_id, value in batch], output_field=FloatField(),
+        )
+        Tour.objects.using(using).filter(pk__in=[tour_id for tour_id, _ in batch]).update(
+            trending_score=_add_expression(exponent),
+        )
+
+
+def record_views(tour_ids):
+    """Учитывает просмотры в буфере процесса, без запросов к БД."""
+    view_buffer.add(tour_ids)
+
+
+def flush_views(using=None):
+    """Записывает накопленные просмотры в БД; возвращает количество туров."""
+    exponents = view_buffer.drain()
+    write_views(exponents, using=using)
+    return len(exponents)
+
+
+def rebuild_trending_scores(using=None, apps=None):
+    """Полный пересчёт по бронированиям, оценкам и избранному (просмотры не хранятся и теряются).
+
+    Нужен только для начального заполнения и восстановления: в обычной работе счёт
+    поддерживают сигналы. apps передаётся из миграции.
+    """
+    apps = apps or django_apps
+    half_life, weights = get_half_life(), get_weights()
+    sources = (
+        (apps.get_model('tour', 'Booking').objects.exclude(status=REJECTED_BOOKING), 'created_date', BOOKING),
+        (apps.get_model('tour', 'Rating').objects.all(), 'created_date', RATING),
+        (apps.get_model('tour', 'FavoriteList').objects.all(), 'added_date', FAVORITE),
+    )
+    scores = {}
+    for queryset, date_field, event in sources:
+        for tour_id, when in queryset.using(using).values_list('tour_id', date_field).iterator(chunk_size=5000):
+            exponent = math.log2(weights[event]) + (when - EPOCH).total_seconds() / half_life
+            scores[tour_id] = log2_add(scores[tour_id], exponent) if tour_id in scores else exponent
+
+    tour_model = apps.get_model('tour', 'Tour')
+    tours = [tour_model(pk=tour_id, trending_score=score) for tour_id, score in scores.items()]
+    with transaction.atomic(using=using):
+        tour_model.objects.using(using).update(trending_score=None)
+        tour_model.objects.using(using).bulk_update(tours, ['trending_score'], batch_size=500)
+    return len(tours)
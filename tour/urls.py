@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import BannerIndexView, BannerDetailView, TourListView, TourSeasonView, FeedbackListView, TourSearchView, \
-    RegionTourListView, RegionTourDetailView, TourDetailView
+from . import async_views
+from .views import BannerIndexView, BannerDetailView, TourListView, TourSeasonView, FeedbackListView, \
+    FeedbackThreadView, TourSearchView, RegionTourListView, RegionTourDetailView, TourDetailView, \
+    TourAvailabilityView, SeatHoldCreateView, SeatHoldDetailView, ResponseCacheStatsView, RegionLandingView, \
+    FavoriteToursView, FavoriteStatusView, TourSimilarView, TourTrendingView
 
 urlpatterns = [
     path('banners/', BannerIndexView.as_view(), name='banner-list-create'),
@@ -8,9 +11,31 @@ urlpatterns = [
     path('tours/', TourListView.as_view(), name='tour-list'),
     path('tours/season/', TourSeasonView.as_view(), name='tour-season'),
     path('feedbacks/', FeedbackListView.as_view(), name='feedback-list'),
+    path('feedbacks/<int:pk>/', FeedbackThreadView.as_view(), name='feedback-thread'),
     path('tours/search/', TourSearchView.as_view(), name='tour-search'),
+    path('tours/trending/', TourTrendingView.as_view(), name='tour-trending'),
     path('regions/', RegionTourListView.as_view(), name='region-list'),
     path('regions/<int:pk>/', RegionTourDetailView.as_view(), name='region-detail'),
+    path('regions/<str:slug>/landing/', RegionLandingView.as_view(), name='region-landing'),
     path('tours/<int:id>/', TourDetailView.as_view(), name='tour-detail'),
+    path('tours/<int:id>/similar/', TourSimilarView.as_view(), name='tour-similar'),
+    path('tours/<int:id>/availability/', TourAvailabilityView.as_view(), name='tour-availability'),
+    path('tours/<int:id>/holds/', SeatHoldCreateView.as_view(), name='seat-hold-create'),
+    path('holds/<int:pk>/', SeatHoldDetailView.as_view(), name='seat-hold-detail'),
+    path('favorites/', FavoriteToursView.as_view(), name='favorite-tours'),
+    path('favorites/status/', FavoriteStatusView.as_view(), name='favorite-status'),
+    path('cache-stats/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+
+    # Асинхронные версии публичных эндпоинтов для ASGI (tour/async_views.py)
+    path('async/banners/', async_views.AsyncBannerIndexView.as_view(), name='async-banner-list'),
+    path('async/banners/<int:pk>/', async_views.AsyncBannerDetailView.as_view(), name='async-banner-detail'),
+    path('async/tours/', async_views.AsyncTourListView.as_view(), name='async-tour-list'),
+    path('async/tours/season/', async_views.AsyncTourSeasonView.as_view(), name='async-tour-season'),
+    path('async/tours/search/', async_views.AsyncTourSearchView.as_view(), name='async-tour-search'),
+    path('async/tours/<int:id>/', async_views.AsyncTourDetailView.as_view(), name='async-tour-detail'),
+    path('async/feedbacks/', async_views.AsyncFeedbackListView.as_view(), name='async-feedback-list'),
+    path('async/feedbacks/<int:pk>/', async_views.AsyncFeedbackThreadView.as_view(), name='async-feedback-thread'),
+    path('async/regions/', async_views.AsyncRegionTourListView.as_view(), name='async-region-list'),
+    path('async/regions/<int:pk>/', async_views.AsyncRegionTourDetailView.as_view(), name='async-region-detail'),
 
 ]
@@ -1,13 +1,46 @@
-from rest_framework import generics, filters
-from django.db.models import Avg, Prefetch
-from .models import Banner, Tour, Feedback, Rating, RegionTour, DateTour
-from .serializers import BannerSerializer, TourSerializer, FeedbackSerializer, RegionTourSerializer
+from django.db.models import F
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .conditional import banner_state, conditional_get, region_state, tour_state
+from .favorites import favorite_flags, parse_tour_ids, set_favorites
+from .facets import apply_filters, filter_price, get_facets, has_filters, parse_filters, parse_price_range
+from .feedback import attach_threads
+from .inventory import cancel_hold, confirm_hold, get_availability, reserve_seats
+from .leaderboard import get_leaderboard_size, get_top_rated_tours
+from .models import Banner, Category, Tour, TourImage, Feedback, Rating, RegionTour, DateTour, SeatHold, SimilarTour
+from .pagination import BannerCursorPagination, FeedbackThreadPagination, RegionCursorPagination, \
+    RegionLandingPagination, SearchCursorPagination, TourCursorPagination
+from .pricing import parse_price_ordering
+from .regions import REGION_TOURS_NAMESPACE, region_namespace, region_tours
+from .response_cache import CachedListMixin, get_stats
+from .search import get_search_backend, search_tours
+from .seasons import season_filter
+from .serializers import BannerSerializer, TourSerializer, TourSearchSerializer, FeedbackSerializer, \
+    RegionTourSerializer, TourAvailabilitySerializer, SeatHoldSerializer, SeatHoldCreateSerializer, \
+    FavoriteChangeSerializer, SimilarTourSerializer, TrendingTourSerializer
+from .trending import record_views
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'Ожидается целое число.'})
 
 
 # Получение списка баннеров и создание нового баннера
-class BannerIndexView(generics.ListAPIView):
+class BannerIndexView(CachedListMixin, generics.ListAPIView):
+    cache_models = (Banner,)
     queryset = Banner.objects.all()
     serializer_class = BannerSerializer
+    pagination_class = BannerCursorPagination
 
 
 # Получение, обновление и удаление конкретного баннера
@@ -15,58 +48,157 @@ class BannerDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Banner.objects.all()
     serializer_class = BannerSerializer
 
+    @conditional_get(banner_state)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class TourSearchView(generics.ListAPIView):
-    serializer_class = TourSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'description', 'route_tour']
+    """Поиск с фильтрами фасетов (см. tour/facets.py).
+
+    Первая страница (без ?cursor=) содержит и счётчики фасетов по всему найденному набору,
+    поэтому боковой панели фильтров не нужны отдельные запросы. ?facets=0 отключает подсчёт.
+    ?ordering=price / -price сортирует по действующей цене вместо релевантности.
+    """
+    serializer_class = TourSearchSerializer
+    pagination_class = TourCursorPagination
 
     def get_queryset(self):
-        queryset = Tour.objects.prefetch_related(
-            Prefetch('ratings', queryset=Rating.objects.all())
-        ).annotate(average_rating=Avg('ratings__score'))
+        queryset = apply_filters(Tour.objects.prefetch_related('images', 'date_tour'), self.filters)
+        if self.query:
+            queryset = get_search_backend().filter(queryset, self.query)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        self.filters = parse_filters(request.query_params)
+        self.query = request.query_params.get('search', '').strip()
+        if not self.query or parse_price_ordering(request.query_params):
+            # Без запроса и при сортировке по цене страница читается по индексу курсорной пагинацией
+            response = super().list(request, *args, **kwargs)
+        else:
+            response = self.search(request, self.query)
+        matched = Tour.objects.all()
+        if self.query:
+            matched = get_search_backend().filter(matched, self.query)
 
-class TourListView(generics.ListAPIView):
-    serializer_class = TourSerializer
+        with_facets = request.query_params.get('facets') not in ('0', 'false')
+        if with_facets and not request.query_params.get(self.paginator.cursor_query_param):
+            response.data['facets'] = get_facets(matched, self.filters)
+        return response
+
+    def search(self, request, query):
+        # Полнотекстовый индекс отдаёт страницу ID в порядке релевантности, из БД читаются только они
+        paginator = SearchCursorPagination()
+        within = apply_filters(Tour.objects.all(), self.filters) if has_filters(self.filters) else None
+        hits = paginator.paginate_hits(
+            lambda limit, after: search_tours(query, limit, after, within=within), request, view=self
+        )
+        tours = Tour.objects.prefetch_related('images', 'date_tour').in_bulk([hit.tour_id for hit in hits])
+        results = []
+        for hit in hits:
+            tour = tours.get(hit.tour_id)
+            if tour is not None:
+                tour.search_rank = hit.rank
+                tour.search_snippet = hit.snippet
+                results.append(tour)
+        serializer = self.get_serializer(results, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
-    def get_queryset(self):
-        queryset = Tour.objects.prefetch_related(
-            Prefetch('ratings', queryset=Rating.objects.all())
-        ).annotate(average_rating=Avg('ratings__score')).order_by('-average_rating')[:4]
-        return queryset
 
+def _priced_tours(queryset, limit, category, region, price_range, ordering):
+    # С ценой список читается напрямую по индексу tour_published_price_idx
+    queryset = filter_price(queryset.filter(is_published=True), price_range)
+    if category:
+        queryset = queryset.filter(category=category)
+    if region:
+        queryset = queryset.filter(region=region)
+    ordering = ordering or (F('average_rating').desc(nulls_last=True), '-rating_count', 'pk')
+    return queryset.order_by(*ordering)[:get_leaderboard_size(limit)]
 
-class TourSeasonView(generics.ListAPIView):
+
+def _season_tours(params):
+    queryset = Tour.objects.prefetch_related('images', 'date_tour').filter(is_published=True)
+
+    # Сезоны и ближайшая дата хранятся в самом туре, поэтому join по датам и DISTINCT не нужны
+    season = params.get('season', None)
+    if season:
+        if season not in DateTour.SEASON_BITS:
+            raise ValidationError({'season': f'Допустимые значения: {", ".join(DateTour.SEASON_BITS)}.'})
+        queryset = queryset.filter(season_filter(season))
+
+    if params.get('upcoming') in ('1', 'true'):
+        queryset = queryset.filter(next_start_date__gte=timezone.localdate())
+
+    return filter_price(queryset, parse_price_range(params))
+
+
+# Лучшие туры, в том числе в разрезе категории (?category=) и региона (?region=).
+# ?price_min= / ?price_max= ограничивают действующую цену, ?ordering=price / -price сортирует по ней.
+class TourListView(CachedListMixin, generics.ListAPIView):
+    cache_models = (Tour, DateTour, TourImage, Rating, Category, RegionTour)
     serializer_class = TourSerializer
 
     def get_queryset(self):
-        season = self.request.query_params.get('season', None)
-        queryset = Tour.objects.prefetch_related(
-            Prefetch('ratings', queryset=Rating.objects.all())
-        ).filter(is_published=True)
+        params = self.request.query_params
+        limit = _int_param(params, 'limit')
+        category = _int_param(params, 'category')
+        region = _int_param(params, 'region')
+        price_range = parse_price_range(params)
+        ordering = parse_price_ordering(params)
+        queryset = Tour.objects.prefetch_related('images', 'date_tour')
+        if ordering is None and price_range == (None, None):
+            # Порядок берётся из закэшированного рейтинга, из БД читаются только отобранные туры
+            return get_top_rated_tours(limit=limit, category=category, region=region, queryset=queryset)
+        return _priced_tours(queryset, limit, category, region, price_range, ordering)
+
+
+class TourSeasonView(CachedListMixin, generics.ListAPIView):
+    cache_models = (Tour, DateTour, TourImage, Rating)
+    serializer_class = TourSerializer
+    pagination_class = TourCursorPagination
 
-        if season:
-            queryset = queryset.filter(datetour__season=season)
+    def get_cache_key_parts(self, request):
+        # ?upcoming= сравнивает даты с сегодняшней, поэтому ответ меняется со сменой дня
+        return [*super().get_cache_key_parts(request), timezone.localdate().isoformat()]
 
-        return queryset.distinct()
+    def get_queryset(self):
+        return _season_tours(self.request.query_params)
 
 
 class FeedbackListView(generics.ListAPIView):
     serializer_class = FeedbackSerializer
+    pagination_class = FeedbackThreadPagination
 
     def get_queryset(self):
-        tour_id = self.request.query_params.get('tour', None)
+        # Страница состоит из корневых отзывов, ответы подгружаются одним запросом на всю страницу
+        queryset = Feedback.objects.filter(depth=0)
+        tour_id = _int_param(self.request.query_params, 'tour')
         if tour_id:
-            return Feedback.objects.filter(tour__id=tour_id).select_related('tour')
-        return Feedback.objects.all().select_related('tour')
+            queryset = queryset.filter(tour_id=tour_id)
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return attach_threads(page, max_depth=_int_param(self.request.query_params, 'depth'))
+
+
+# Ветка обсуждения, начиная с конкретного отзыва (?depth= ограничивает глубину)
+class FeedbackThreadView(generics.RetrieveAPIView):
+    queryset = Feedback.objects.all()
+    serializer_class = FeedbackSerializer
+
+    def get_object(self):
+        feedback = super().get_object()
+        attach_threads([feedback], max_depth=_int_param(self.request.query_params, 'depth'))
+        return feedback
 
 
 # Представление для списка всех областей
-class RegionTourListView(generics.ListAPIView):
+class RegionTourListView(CachedListMixin, generics.ListAPIView):
+    cache_models = (RegionTour,)
     queryset = RegionTour.objects.all()
     serializer_class = RegionTourSerializer
+    pagination_class = RegionCursorPagination
 
 
 # Представление для отображения конкретной области по ее ID
@@ -74,10 +206,155 @@ class RegionTourDetailView(generics.RetrieveAPIView):
     queryset = RegionTour.objects.all()
     serializer_class = RegionTourSerializer
 
+    @conditional_get(region_state)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class RegionLandingView(CachedListMixin, generics.ListAPIView):
+    """Страница региона по slug: сам регион и его опубликованные туры по убыванию рейтинга.
+
+    Страница туров с фото и датами читается за постоянное число запросов. Ответ кэшируется
+    по версии региона (tour/regions.py), которую сдвигают только изменения самого региона и его туров.
+    """
+    serializer_class = TourSerializer
+    pagination_class = RegionLandingPagination
+
+    def get_cache_key_parts(self, request):
+        # Версии разных регионов могут совпасть, поэтому slug входит в ключ явно
+        return [*super().get_cache_key_parts(request), self.kwargs['slug']]
+
+    def get_cache_namespaces(self, request):
+        return [REGION_TOURS_NAMESPACE, region_namespace(self.kwargs['slug'])]
+
+    def get_queryset(self):
+        return region_tours(self.region)
+
+    def list(self, request, *args, **kwargs):
+        self.region = get_object_or_404(RegionTour, slug=self.kwargs['slug'])
+        response = super().list(request, *args, **kwargs)
+        region = RegionTourSerializer(self.region, context=self.get_serializer_context()).data
+        response.data = {'region': region, **response.data}
+        return response
+
 
 class TourDetailView(generics.RetrieveAPIView):
-    queryset = Tour.objects.prefetch_related(
-        Prefetch('ratings', queryset=Rating.objects.all())
-    ).annotate(average_rating=Avg('ratings__score'))
+    queryset = Tour.objects.prefetch_related('images', 'date_tour')
     serializer_class = TourSerializer
     lookup_field = 'id'  # Будем искать тур по ID
+
+    # Если клиент прислал актуальный ETag, ответ 304 отдаётся без загрузки тура, фото и дат
+    @conditional_get(tour_state)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Просмотр учитывается и при ответе 304: клиент снова открыл страницу тура
+        if request.method == 'GET' and response.status_code in (200, 304):
+            record_views([kwargs['id']])
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# Популярные «сейчас» туры (см. tour/trending.py): первые ?limit= строк индекса
+# tour_published_trending_idx. Ответ не кэшируется — счёт меняется с каждым событием.
+class TourTrendingView(generics.ListAPIView):
+    serializer_class = TrendingTourSerializer
+
+    def get_queryset(self):
+        limit = get_leaderboard_size(_int_param(self.request.query_params, 'limit'))
+        return (
+            Tour.objects.filter(is_published=True, trending_score__isnull=False)
+            .order_by('-trending_score').prefetch_related('images', 'date_tour')[:limit]
+        )
+
+    def get_serializer_context(self):
+        # Один момент времени для всех карточек ответа
+        return {**super().get_serializer_context(), 'now': timezone.now()}
+
+
+# Похожие туры: готовый список соседей из SimilarTour (см. tour/similarity.py), одно чтение по индексу
+class TourSimilarView(generics.ListAPIView):
+    serializer_class = SimilarTourSerializer
+
+    def get_queryset(self):
+        return (
+            SimilarTour.objects.filter(tour_id=self.kwargs['id'], similar__is_published=True)
+            .select_related('similar').order_by('rank')
+        )
+
+
+# Остаток мест по датам тура
+class TourAvailabilityView(generics.ListAPIView):
+    serializer_class = TourAvailabilitySerializer
+
+    def get_queryset(self):
+        tour = get_object_or_404(Tour.objects.prefetch_related('date_tour', 'inventories'), id=self.kwargs['id'])
+        return get_availability(tour)
+
+
+# Временное удержание мест на дату тура (POST {"date": id, "seats": n})
+class SeatHoldCreateView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = SeatHoldCreateSerializer
+
+    def post(self, request, id):
+        tour = get_object_or_404(Tour, id=id, is_published=True)
+        serializer = self.get_serializer(data=request.data, context={'tour': tour, 'request': request})
+        serializer.is_valid(raise_exception=True)
+        hold = reserve_seats(tour, serializer.validated_data['date'], request.user, serializer.validated_data['seats'])
+        return Response(SeatHoldSerializer(hold).data, status=status.HTTP_201_CREATED)
+
+
+# Подтверждение удержания (создаёт бронирование) или его отмена
+class SeatHoldDetailView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = SeatHoldSerializer
+
+    def get_queryset(self):
+        return SeatHold.objects.filter(user=self.request.user).select_related('inventory__tour')
+
+    def post(self, request, pk):
+        hold = self.get_object()
+        confirm_hold(hold)
+        return Response(self.get_serializer(hold).data, status=status.HTTP_201_CREATED)
+
+    def delete(self, request, pk):
+        cancel_hold(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# Избранные туры текущего пользователя (GET) и добавление/удаление пачкой (POST {"add": [...], "remove": [...]})
+class FavoriteToursView(generics.ListAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = TourSerializer
+    pagination_class = TourCursorPagination
+
+    def get_queryset(self):
+        return Tour.objects.filter(favoritelist__user=self.request.user).prefetch_related('images', 'date_tour')
+
+    @swagger_auto_schema(request_body=FavoriteChangeSerializer)
+    def post(self, request):
+        serializer = FavoriteChangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add, remove = serializer.validated_data['add'], serializer.validated_data['remove']
+        added = set(set_favorites(request.user.pk, add=add, remove=remove))
+        # Несуществующие туры не добавляются и возвращаются как не избранные
+        flags = {**{tour_id: tour_id in added for tour_id in add}, **{tour_id: False for tour_id in remove}}
+        return Response({'favorites': flags})
+
+
+# Отметки «в избранном» для списка туров: ?ids=1,2,3. Ответ берётся из кэша множества избранного.
+class FavoriteStatusView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        ids = parse_tour_ids(request.query_params.get('ids'), 'ids')
+        return Response({'favorites': favorite_flags(request.user.pk, ids)})
+
+
+# Счётчики попаданий и промахов кэша ответов каталога
+class ResponseCacheStatsView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
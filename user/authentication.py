@@ -0,0 +1,131 @@
+"""JWT-аутентификация с кэшем пользователей.
+
+JWTAuthentication на каждый запрос читает MyUser по первичному ключу. CachedJWTAuthentication
+берёт значения полей пользователя из двух уровней кэша:
+
+* LRU-словаря в памяти процесса (AUTH_USER_CACHE_SIZE записей, AUTH_USER_CACHE_LOCAL_TTL секунд);
+* общего кэша Django (AUTH_USER_CACHE_TIMEOUT секунд).
+
+При сохранении и удалении MyUser (user/signals.py) и блокировке в AdminUserBlockView записи
+удаляются из кэша Django и из памяти текущего процесса. Если кэш Django общий (CACHE_URL,
+core/caches.py), другие процессы увидят изменение не позже чем через AUTH_USER_CACHE_LOCAL_TTL
+секунд; если он в памяти процесса — через AUTH_USER_CACHE_TIMEOUT, который в этом случае
+не больше AUTH_USER_CACHE_LOCAL_TTL. Заблокированные пользователи отклоняются.
+
+В кэше хранятся значения полей, а не объект: на каждый запрос собирается новый экземпляр
+через from_db, поэтому изменения request.user в представлении не попадают в кэш.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import MyUser
+
+
+class LocalUserCache:
+    """Ограниченный LRU-кэш с временем жизни записей. Потокобезопасен."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_users = LocalUserCache(
+    getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000),
+    getattr(settings, 'AUTH_USER_CACHE_LOCAL_TTL', 30),
+)
+USER_FIELDS = [field.attname for field in MyUser._meta.concrete_fields]
+
+
+def _cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """Возвращает нового MyUser с закэшированными значениями полей или None, если пользователя нет."""
+    key = _cache_key(user_id)
+    values = local_users.get(key)
+    if values is None:
+        values = cache.get(key)
+        if values is None:
+            values = MyUser.objects.filter(pk=user_id).values_list(*USER_FIELDS).first()
+            if values is None:
+                return None
+            cache.set(key, values, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+        local_users.set(key, values)
+    return MyUser.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, values)
+
+
+def invalidate_user(user_id, using=None):
+    """Удаляет пользователя из кэшей сразу и ещё раз после фиксации транзакции.
+
+    Повторное удаление не даёт параллельному запросу оставить в кэше значения, прочитанные до фиксации.
+    """
+    key = _cache_key(user_id)
+
+    def drop():
+        local_users.delete(key)
+        cache.delete(key)
+
+    drop()
+    transaction.on_commit(drop, using=using)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатор пользователя')
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('Пользователь не найден', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('Пользователь неактивен', code='user_inactive')
+        if user.is_blocked:
+            raise AuthenticationFailed('Пользователь заблокирован', code='user_blocked')
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed('Пароль пользователя изменён', code='password_changed')
+        return user
@@ -0,0 +1,145 @@
+"""Потоковая выгрузка туров, бронирований и пользователей в NDJSON или CSV.
+
+Строки читаются QuerySet.iterator(chunk_size=...) в виде кортежей значений, без создания
+моделей и сериализаторов, и сразу отдаются клиенту. Память не зависит от количества строк:
+в ней держится только текущая пачка.
+
+Под ASGI синхронный итератор StreamingHttpResponse сначала читается целиком, поэтому там
+представление оборачивает поток в aiterate: каждая пачка читается в синхронном потоке
+Django, а отдаётся клиенту сразу.
+
+В CSV текстовые ячейки, которые начинаются с = + - @ (или табуляции и перевода строки),
+получают префикс «'», чтобы табличный редактор не выполнил их как формулу. При обратной
+загрузке через import_tours этот апостроф останется в значении.
+"""
+import csv
+from datetime import date
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from tour.importer import DATE_SEPARATOR, LIST_SEPARATOR
+from tour.models import Booking, Tour
+
+from .models import MyUser
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Колонки тура совпадают с форматом manage.py import_tours, поэтому выгрузку можно загрузить обратно
+TOUR_COLUMNS = [
+    'id', 'author', 'title', 'description', 'route_tour', 'duration', 'price', 'participants_price',
+    'max_participants', 'discount_price', 'discount_start_date', 'discount_end_date', 'is_published',
+    'average_rating', 'created_date', 'category', 'region', 'date_tour',
+]
+BOOKING_FIELDS = [
+    ('id', 'id'),
+    ('tour_id', 'tour_id'),
+    ('tour_title', 'tour__title'),
+    ('user_id', 'user_id'),
+    ('user_email', 'user__email'),
+    ('date_id', 'date_id'),
+    ('start_date', 'date__start_date'),
+    ('end_date', 'date__end_date'),
+    ('participants', 'participants'),
+    ('total_price', 'total_price'),
+    ('status', 'status'),
+]
+USER_FIELDS = ['id', 'username', 'email', 'phone_number', 'status', 'is_admin', 'is_blocked', 'created_date']
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _group(rows):
+    grouped = {}
+    for key, value in rows:
+        grouped.setdefault(key, []).append(value)
+    return grouped
+
+
+def iter_tours(chunk_size=DEFAULT_CHUNK_SIZE):
+    fields = TOUR_COLUMNS[:-3]
+    rows = Tour.objects.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size)
+    for chunk in _chunks(rows, chunk_size):
+        # Названия связей читаются тремя запросами на пачку прямо из through-таблиц
+        ids = [row[0] for row in chunk]
+        categories = _group(Tour.category.through.objects.filter(tour_id__in=ids)
+                            .order_by('category_id').values_list('tour_id', 'category__title'))
+        regions = _group(Tour.region.through.objects.filter(tour_id__in=ids)
+                         .order_by('regiontour_id').values_list('tour_id', 'regiontour__title'))
+        dates = _group(
+            (tour_id, DATE_SEPARATOR.join([start.isoformat(), end.isoformat(), tour_type, season]))
+            for tour_id, start, end, tour_type, season in Tour.date_tour.through.objects.filter(tour_id__in=ids)
+            .order_by('datetour__start_date').values_list(
+                'tour_id', 'datetour__start_date', 'datetour__end_date', 'datetour__tour_type', 'datetour__season',
+            )
+        )
+        yield [
+            (*row, categories.get(row[0], []), regions.get(row[0], []), dates.get(row[0], []))
+            for row in chunk
+        ]
+
+
+def iter_bookings(chunk_size=DEFAULT_CHUNK_SIZE):
+    rows = Booking.objects.order_by('pk').values_list(*[lookup for _, lookup in BOOKING_FIELDS])
+    yield from _chunks(rows.iterator(chunk_size=chunk_size), chunk_size)
+
+
+def iter_users(chunk_size=DEFAULT_CHUNK_SIZE):
+    rows = MyUser.objects.order_by('pk').values_list(*USER_FIELDS)
+    yield from _chunks(rows.iterator(chunk_size=chunk_size), chunk_size)
+
+
+EXPORTS = {
+    'tours': (TOUR_COLUMNS, iter_tours),
+    'bookings': ([name for name, _ in BOOKING_FIELDS], iter_bookings),
+    'users': (USER_FIELDS, iter_users),
+}
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи в буфер."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        value = LIST_SEPARATOR.join(str(item) for item in value)
+    elif isinstance(value, date):
+        return value.isoformat()
+    # Числа (в том числе отрицательные) не экранируются: формулой может стать только текст
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def stream_ndjson(columns, chunks):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for chunk in chunks:
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in chunk)
+
+
+def stream_csv(columns, chunks):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for chunk in chunks:
+        yield ''.join(writer.writerow([_csv_value(value) for value in row]) for row in chunk)
+
+
+async def aiterate(chunks):
+    """Асинхронная обёртка над синхронным потоком: запросы к БД идут в синхронном потоке Django."""
+    iterator = iter(chunks)
+    done = object()
+    read = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await read(iterator, done)) is not done:
+        yield chunk
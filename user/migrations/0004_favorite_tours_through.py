@@ -0,0 +1,25 @@
+# Generated by Django 5.1 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tour', '0013_copy_user_favorite_tours'),
+        ('user', '0003_myuser_groups_myuser_user_permissions'),
+    ]
+
+    operations = [
+        # Поле нельзя перевести на through-модель изменением, поэтому старая таблица удаляется,
+        # а строки из неё уже скопированы в FavoriteList миграцией tour.0013
+        migrations.RemoveField(
+            model_name='myuser',
+            name='favorite_tours',
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='favorite_tours',
+            field=models.ManyToManyField(blank=True, related_name='favorited_by_users', through='tour.FavoriteList', to='tour.tour'),
+        ),
+    ]
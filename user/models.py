@@ -53,7 +53,9 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
     is_superuser = models.BooleanField(default=False)
     is_blocked = models.BooleanField('Заблокирован', default=False)
 
-    favorite_tours = models.ManyToManyField('tour.Tour', related_name='favorited_by_users', blank=True)
+    # Избранное хранится в tour.FavoriteList; работа с ним — через tour/favorites.py
+    favorite_tours = models.ManyToManyField('tour.Tour', through='tour.FavoriteList', related_name='favorited_by_users',
+                                            blank=True)
     bookings = models.ManyToManyField('tour.Booking', blank=True, related_name='users')
 
     USERNAME_FIELD = 'email'
@@ -0,0 +1,5 @@
+from tour.pagination import KeysetPagination
+
+
+class UserCursorPagination(KeysetPagination):
+    ordering = '-id'
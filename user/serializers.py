@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import MyUser
 from tour.models import Tour, Booking
+from tour.serializers import ImageVariantsField
 
 class MyUserSerializer(serializers.ModelSerializer):
     favorite_tours = serializers.StringRelatedField(many=True)
@@ -46,10 +47,11 @@ class UserRegisterSerializer(serializers.ModelSerializer):
 
 class UserProfileListSerializer(serializers.ModelSerializer):
     avatar = serializers.ImageField(required=False)
+    avatar_srcset = ImageVariantsField(source='avatar')
 
     class Meta:
         model = MyUser
-        fields = ['username', 'email', 'avatar']
+        fields = ['username', 'email', 'avatar', 'avatar_srcset']
 
     def validate_avatar(self, value):
 
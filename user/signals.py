@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tour.images import schedule_variants
+from tour.statistics import USERS, add_total
+
+from .authentication import invalidate_user
+from .models import MyUser
+
+
+@receiver(post_save, sender=MyUser)
+def generate_avatar_variants(sender, instance, raw, **kwargs):
+    if not raw:
+        schedule_variants(instance.avatar)
+
+
+@receiver(post_save, sender=MyUser)
+def count_created_user(sender, instance, created, raw, using, **kwargs):
+    if created and not raw:
+        add_total(USERS, count=1, using=using)
+
+
+@receiver(post_delete, sender=MyUser)
+def count_deleted_user(sender, instance, using, **kwargs):
+    add_total(USERS, count=-1, using=using)
+
+
+@receiver(post_save, sender=MyUser)
+@receiver(post_delete, sender=MyUser)
+def invalidate_cached_user(sender, instance, using, **kwargs):
+    invalidate_user(instance.pk, using=using)
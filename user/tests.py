@@ -1,3 +1,94 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from django.db.models import Count
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from tour.tests import QueryBudgetMixin, create_tour
+
+from .authentication import local_users
+from .models import MyUser
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.user = MyUser.objects.create_user('user@example.com', 'user', 'password')
+        self.admin = MyUser.objects.create_superuser('admin@example.com', 'admin', 'password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_profile_reads_user_from_cache(self):
+        self.assertEqual(self.client.get('/api/user/profile/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/user/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['email'], 'user@example.com')
+        self.assertFalse([query for query in queries if 'user_myuser' in query['sql']])
+
+    def test_profile_update_invalidates_cache(self):
+        self.client.patch('/api/user/profile/', {'username': 'renamed'}, format='json')
+        self.assertEqual(self.client.get('/api/user/profile/').data['data']['username'], 'renamed')
+
+    def test_blocked_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/user/profile/').status_code, 200)
+        admin_client = APIClient()
+        admin_client.force_authenticate(self.admin)
+        response = admin_client.patch(f'/api/user/admin/users/{self.user.pk}/block/')
+        self.assertTrue(response.data['is_blocked'])
+        self.assertEqual(self.client.get('/api/user/profile/').status_code, 401)
+        admin_client.patch(f'/api/user/admin/users/{self.user.pk}/block/')
+        self.assertEqual(self.client.get('/api/user/profile/').status_code, 200)
+
+
+class AdminExportTests(TestCase):
+    def setUp(self):
+        self.admin = MyUser.objects.create_superuser('admin@example.com', '=HYPERLINK("http://x")', 'password')
+        create_tour(title='+7 дней в горах', route_tour='-Бишкек')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+
+    def test_csv_escapes_formulas(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        users = b''.join(client.get('/api/user/admin/export/users/?type=csv').streaming_content).decode()
+        self.assertIn('"\'=HYPERLINK(""http://x"")"', users)
+        tours = b''.join(client.get('/api/user/admin/export/tours/?type=csv').streaming_content).decode()
+        row = tours.splitlines()[1]
+        self.assertIn(",'+7 дней в горах,", row)
+        self.assertIn(",'-Бишкек,3,100.00,", row)
+
+    async def test_asgi_streams_asynchronously(self):
+        response = await AsyncClient().get('/api/user/admin/export/users/?type=csv', headers=self.headers)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(content.splitlines()[0], 'id,username,email,phone_number,status,is_admin,is_blocked,created_date')
+        self.assertIn('admin@example.com', content)
+
+
+def admin_user():
+    return MyUser.objects.filter(is_admin=True).order_by('pk')[0]
+
+
+def busiest_user():
+    return MyUser.objects.annotate(total=Count('bookings')).order_by('-total', 'pk')[0]
+
+
+@override_settings(QUERY_BUDGET_ACTION='raise')
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_profile(self):
+        self.assertQueryBudget('/api/user/profile/', 1, user=busiest_user)
+
+    def test_bookings(self):
+        self.assertQueryBudget('/api/user/profile/bookings/', 2, user=busiest_user)
+
+    def test_admin_user_list(self):
+        self.assertQueryBudget('/api/user/admin/users/', 2, user=admin_user)
+
+    def test_admin_statistics(self):
+        self.assertQueryBudget('/api/user/admin/statistics/', 2, user=admin_user)
+
+    def test_admin_statistics_top_tours(self):
+        self.assertQueryBudget('/api/user/admin/statistics/?by=tour', 3, user=admin_user)
@@ -18,5 +18,6 @@ urlpatterns = [
     path('admin/tours/<int:tour_id>/delete/', views.TourModerationView.as_view(), name='admin-tour-delete'),
     path('admin/tours/<int:tour_id>/block/', views.TourModerationView.as_view(), name='admin-tour-block'),
     path('admin/statistics/', views.AdminStatisticsView.as_view(), name='admin-statistics'),
+    path('admin/export/<str:name>/', views.AdminExportView.as_view(), name='admin-export'),
 ]
 
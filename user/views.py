@@ -1,10 +1,22 @@
 from drf_yasg.utils import swagger_auto_schema
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework import status, permissions
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import generics, status, permissions
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from tour.models import Booking, BookingStat, Tour
+from tour.statistics import MAX_SERIES_DAYS, SERIES_DIMENSIONS, default_range, get_series, get_totals
+
+from .authentication import invalidate_user
+from .exports import DEFAULT_CHUNK_SIZE, EXPORTS, aiterate, stream_csv, stream_ndjson
 from .models import MyUser
+from .pagination import UserCursorPagination
 from .serializers import MyUserSerializer, TourSerializer, BookingSerializer, UserRegisterSerializer, UserProfileListSerializer, AdminUserSerializer
 
 
@@ -28,7 +40,13 @@ class UserRegisterView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserProfileView(APIView):
+class CurrentUserMixin:
+    def get_current_user(self, request):
+        # request.user собирается CachedJWTAuthentication из кэша, без запроса к БД
+        return request.user
+
+
+class UserProfileView(CurrentUserMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
@@ -55,7 +73,7 @@ class UserProfileView(APIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserBookingsView(APIView):
+class UserBookingsView(CurrentUserMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
@@ -123,22 +141,49 @@ class UserWithdrawFundsView(APIView):
         return Response({'message': 'Запрос на вывод средств успешно отправлен.'}, status=200)
 
 
-class AdminUserListView(APIView):
+class AdminUserListView(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
+    serializer_class = AdminUserSerializer
+    pagination_class = UserCursorPagination
+    # Загружаются только поля, которые отдаёт сериализатор
+    queryset = MyUser.objects.only('id', 'username', 'email', 'status', 'is_blocked')
 
-    def get(self, request):
-        users = MyUser.objects.all()
-        serializer = AdminUserSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+# Потоковая выгрузка туров, бронирований или пользователей (?type=ndjson|csv)
+class AdminExportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    formats = {
+        'ndjson': (stream_ndjson, 'application/x-ndjson; charset=utf-8'),
+        'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    }
+
+    def get(self, request, name):
+        if name not in EXPORTS:
+            raise NotFound(f'Доступные выгрузки: {", ".join(EXPORTS)}.')
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in self.formats:
+            raise ValidationError({'type': f'Допустимые значения: {", ".join(self.formats)}.'})
+        columns, iter_rows = EXPORTS[name]
+        stream, content_type = self.formats[export_type]
+        content = stream(columns, iter_rows(DEFAULT_CHUNK_SIZE))
+        if isinstance(request._request, ASGIRequest):
+            # Синхронный итератор под ASGI был бы прочитан целиком до отправки
+            content = aiterate(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        filename = f'{name}-{timezone.localdate().isoformat()}.{export_type}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 
 class AdminUserBlockView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def patch(self, request, user_id):
-        user = MyUser.objects.get(id=user_id)
-        user.is_blocked = not user.is_blocked
-        user.save()
+        user = get_object_or_404(MyUser, id=user_id)
+        # Переключение одним UPDATE; кэш аутентификации сбрасывается явно, так как update() не отправляет сигналы
+        MyUser.objects.filter(pk=user.pk).update(is_blocked=~F('is_blocked'), updated_date=timezone.now())
+        invalidate_user(user.pk)
+        user.refresh_from_db(fields=['is_blocked'])
         return Response({'message': 'Статус блокировки изменен', 'is_blocked': user.is_blocked}, status=status.HTTP_200_OK)
 
 
@@ -167,17 +212,60 @@ class TourModerationView(APIView):
         return Response({'message': 'Статус блокировки изменен', 'is_blocked': tour.is_blocked}, status=status.HTTP_200_OK)
 
 class AdminStatisticsView(APIView):
+    """Итоги из StatTotal и, при наличии параметров, ряд из дневных сводок BookingStat.
+
+    Параметры: date_from, date_to (ГГГГ-ММ-ДД, по умолчанию последние 30 дней),
+    by=day|tour|region, id (тур или регион), status (статус бронирования).
+    Для by=tour|region без id возвращается топ туров или регионов по выручке за период.
+    """
     permission_classes = [permissions.IsAdminUser]
+    SERIES_PARAMS = ('date_from', 'date_to', 'by', 'id', 'status')
 
     def get(self, request):
-        total_users = MyUser.objects.count()
-        total_bookings = Booking.objects.count()
-        total_tours = Tour.objects.count()
-
-        statistics = {
-            'total_users': total_users,
-            'total_bookings': total_bookings,
-            'total_tours': total_tours,
+        statistics = get_totals()
+        params = request.query_params
+        if any(name in params for name in self.SERIES_PARAMS):
+            statistics['series'] = self.get_series(params)
+        return Response(statistics, status=status.HTTP_200_OK)
+
+    def get_series(self, params):
+        date_from, date_to = default_range()
+        date_from = self.parse_date(params, 'date_from', date_from)
+        date_to = self.parse_date(params, 'date_to', date_to)
+        if date_from > date_to:
+            raise ValidationError({'date_from': 'Начало периода позже его окончания.'})
+        if (date_to - date_from).days >= MAX_SERIES_DAYS:
+            raise ValidationError({'date_to': f'Период не может быть длиннее {MAX_SERIES_DAYS} дней.'})
+
+        dimension = params.get('by', BookingStat.DAY)
+        if dimension not in SERIES_DIMENSIONS:
+            raise ValidationError({'by': f'Допустимые значения: {", ".join(SERIES_DIMENSIONS)}.'})
+        key = params.get('id')
+        if key is not None:
+            if dimension == BookingStat.DAY or not key.isdigit():
+                raise ValidationError({'id': 'Ожидается ID тура или региона вместе с by=tour|region.'})
+            key = int(key)
+        booking_status = params.get('status')
+        if booking_status is not None:
+            if not booking_status.isdigit() or int(booking_status) not in dict(Booking.STATUS_CHOICES):
+                raise ValidationError({'status': 'Неизвестный статус бронирования.'})
+            booking_status = int(booking_status)
+
+        return {
+            'date_from': date_from,
+            'date_to': date_to,
+            'by': dimension,
+            'id': key,
+            'status': booking_status,
+            'items': get_series(date_from, date_to, dimension, key=key, status=booking_status),
         }
 
-        return Response(statistics, status=status.HTTP_200_OK)
+    @staticmethod
+    def parse_date(params, name, default):
+        value = params.get(name)
+        if not value:
+            return default
+        parsed = parse_date(value) if len(value) == 10 else None
+        if parsed is None:
+            raise ValidationError({name: 'Ожидается дата в формате ГГГГ-ММ-ДД.'})
+        return parsed